@@ -0,0 +1,93 @@
+"""particionar user_locations por mes de timestamp
+
+Revision ID: a4c7e1f9b3d5
+Revises: f2b8d6a4c1e9
+Create Date: 2025-07-22 00:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'a4c7e1f9b3d5'
+down_revision = 'f2b8d6a4c1e9'
+branch_labels = None
+depends_on = None
+
+# Índices de user_locations (f2b8d6a4c1e9); en la tabla particionada se
+# crean en el padre y cada partición tiene el suyo
+INDEXES = """
+    CREATE INDEX ix_user_locations_timestamp ON user_locations (timestamp DESC);
+    CREATE INDEX ix_user_locations_clockin_timestamp ON user_locations (clockin_id, timestamp);
+"""
+
+
+def upgrade():
+    # La PK de una tabla particionada tiene que incluir la clave de partición
+    op.execute("""
+        CREATE TABLE user_locations_part (
+            id         UUID NOT NULL,
+            user_id    UUID NOT NULL,
+            clockin_id UUID,
+            latitude   DOUBLE PRECISION NOT NULL,
+            longitude  DOUBLE PRECISION NOT NULL,
+            timestamp  TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            CONSTRAINT user_locations_part_pkey PRIMARY KEY (id, timestamp),
+            CONSTRAINT user_locations_user_id_fkey FOREIGN KEY (user_id) REFERENCES users (id),
+            CONSTRAINT user_locations_clockin_id_fkey FOREIGN KEY (clockin_id) REFERENCES clockins (id)
+        ) PARTITION BY RANGE (timestamp)
+    """)
+    # Una partición por mes (UTC) desde el dato más antiguo hasta 3 meses
+    # vista; las siguientes las crea el scheduler (services.location_partitions)
+    op.execute("""
+        DO $$
+        DECLARE m date;
+        BEGIN
+          FOR m IN
+            SELECT generate_series(
+              date_trunc('month', COALESCE((SELECT min(timestamp) FROM user_locations), now()) AT TIME ZONE 'UTC'),
+              date_trunc('month', now() AT TIME ZONE 'UTC') + interval '3 months',
+              interval '1 month'
+            )::date
+          LOOP
+            EXECUTE format(
+              'CREATE TABLE %I PARTITION OF user_locations_part FOR VALUES FROM (%L) TO (%L)',
+              'user_locations_' || to_char(m, 'YYYY_MM'),
+              m::text || ' 00:00+00',
+              (m + interval '1 month')::date::text || ' 00:00+00'
+            );
+          END LOOP;
+        END$$;
+    """)
+    op.execute("""
+        INSERT INTO user_locations_part (id, user_id, clockin_id, latitude, longitude, timestamp)
+        SELECT id, user_id, clockin_id, latitude, longitude, timestamp FROM user_locations
+    """)
+    op.execute("DROP TABLE user_locations")
+    op.execute("ALTER TABLE user_locations_part RENAME TO user_locations")
+    op.execute("ALTER INDEX user_locations_part_pkey RENAME TO user_locations_pkey")
+    op.execute(INDEXES)
+
+
+def downgrade():
+    # Las particiones ya retiradas (detach) se quedan como tablas sueltas
+    op.execute("""
+        CREATE TABLE user_locations_plain (
+            id         UUID NOT NULL,
+            user_id    UUID NOT NULL,
+            clockin_id UUID,
+            latitude   DOUBLE PRECISION NOT NULL,
+            longitude  DOUBLE PRECISION NOT NULL,
+            timestamp  TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            CONSTRAINT user_locations_plain_pkey PRIMARY KEY (id),
+            CONSTRAINT user_locations_user_id_fkey FOREIGN KEY (user_id) REFERENCES users (id),
+            CONSTRAINT user_locations_clockin_id_fkey FOREIGN KEY (clockin_id) REFERENCES clockins (id)
+        )
+    """)
+    op.execute("""
+        INSERT INTO user_locations_plain (id, user_id, clockin_id, latitude, longitude, timestamp)
+        SELECT id, user_id, clockin_id, latitude, longitude, timestamp FROM user_locations
+    """)
+    op.execute("DROP TABLE user_locations")
+    op.execute("ALTER TABLE user_locations_plain RENAME TO user_locations")
+    op.execute("ALTER INDEX user_locations_plain_pkey RENAME TO user_locations_pkey")
+    op.execute(INDEXES)
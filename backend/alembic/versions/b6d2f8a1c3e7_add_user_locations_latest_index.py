@@ -0,0 +1,41 @@
+"""índice (user_id, timestamp DESC) en user_locations para /locations/latest
+
+Revision ID: b6d2f8a1c3e7
+Revises: a4c7e1f9b3d5
+Create Date: 2025-07-29 00:00:00.000000
+
+"""
+from alembic import op
+from sqlalchemy import text
+
+# revision identifiers, used by Alembic.
+revision = 'b6d2f8a1c3e7'
+down_revision = 'a4c7e1f9b3d5'
+branch_labels = None
+depends_on = None
+
+INDEX = "ix_user_locations_user_timestamp"
+COLUMNS = "(user_id, timestamp DESC)"
+
+
+def upgrade():
+    # En una tabla particionada no se puede CREATE INDEX CONCURRENTLY: se crea
+    # el índice solo en el padre (inválido), el de cada partición sin bloquear
+    # escrituras y se enganchan; al enganchar la última el del padre es válido
+    op.execute(f"CREATE INDEX IF NOT EXISTS {INDEX} ON ONLY user_locations {COLUMNS}")
+    partitions = op.get_bind().execute(text("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'public.user_locations'::regclass
+        ORDER BY c.relname
+    """)).scalars().all()
+    with op.get_context().autocommit_block():
+        for partition in partitions:
+            name = f"{partition}_user_id_timestamp_idx"
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {partition} {COLUMNS}")
+            op.execute(f"ALTER INDEX {INDEX} ATTACH PARTITION {name}")
+
+
+def downgrade():
+    # Borra también los de cada partición
+    op.execute(f"DROP INDEX IF EXISTS {INDEX}")
@@ -0,0 +1,29 @@
+"""add thumbnail_path to clockins
+
+Revision ID: b7c2d9e4f1a0
+Revises: 351dcb8c8758, abcdef123456
+Create Date: 2025-07-01 00:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+# También une las dos cabezas que había (projects / user_locations).
+revision = 'b7c2d9e4f1a0'
+down_revision = ('351dcb8c8758', 'abcdef123456')
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        ALTER TABLE clockins
+        ADD COLUMN IF NOT EXISTS thumbnail_path VARCHAR
+    """)
+
+
+def downgrade():
+    op.execute("""
+        ALTER TABLE clockins
+        DROP COLUMN IF EXISTS thumbnail_path
+    """)
@@ -0,0 +1,32 @@
+"""make clockins.approved nullable (detección pendiente)
+
+Revision ID: d1f4a8c3e6b2
+Revises: b7c2d9e4f1a0
+Create Date: 2025-07-01 00:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'd1f4a8c3e6b2'
+down_revision = 'b7c2d9e4f1a0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # NULL = el clockin ya existe pero la detección EPP aún no ha terminado
+    op.execute("""
+        ALTER TABLE clockins
+        ALTER COLUMN approved DROP NOT NULL
+    """)
+
+
+def downgrade():
+    op.execute("""
+        UPDATE clockins SET approved = FALSE WHERE approved IS NULL
+    """)
+    op.execute("""
+        ALTER TABLE clockins
+        ALTER COLUMN approved SET NOT NULL
+    """)
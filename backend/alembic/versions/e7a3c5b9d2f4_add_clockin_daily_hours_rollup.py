@@ -0,0 +1,51 @@
+"""add clockin_daily_hours rollup (horas por usuario, proyecto y día)
+
+Revision ID: e7a3c5b9d2f4
+Revises: d1f4a8c3e6b2
+Create Date: 2025-07-08 00:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'e7a3c5b9d2f4'
+down_revision = 'd1f4a8c3e6b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        CREATE TABLE clockin_daily_hours (
+            id         UUID PRIMARY KEY,
+            user_id    UUID NOT NULL REFERENCES users(id)    ON DELETE CASCADE,
+            project_id UUID          REFERENCES projects(id) ON DELETE CASCADE,
+            day        DATE NOT NULL,
+            seconds    DOUBLE PRECISION NOT NULL DEFAULT 0,
+            clockins   INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    # Clave (usuario, proyecto, día); los clockins sin proyecto van al UUID nulo
+    op.execute("""
+        CREATE UNIQUE INDEX ux_clockin_daily_hours_key
+        ON clockin_daily_hours (user_id, COALESCE(project_id, '00000000-0000-0000-0000-000000000000'::uuid), day)
+    """)
+    op.execute("""
+        CREATE INDEX ix_clockin_daily_hours_project_day
+        ON clockin_daily_hours (project_id, day)
+    """)
+    # Carga inicial con los clockins ya terminados (día UTC de start_time)
+    op.execute("""
+        INSERT INTO clockin_daily_hours (id, user_id, project_id, day, seconds, clockins)
+        SELECT gen_random_uuid(), user_id, project_id, (start_time AT TIME ZONE 'UTC')::date,
+               SUM(EXTRACT(EPOCH FROM end_time - start_time)), COUNT(*)
+        FROM clockins
+        WHERE end_time IS NOT NULL
+        GROUP BY user_id, project_id, (start_time AT TIME ZONE 'UTC')::date
+    """)
+
+
+def downgrade():
+    op.execute("""
+        DROP TABLE clockin_daily_hours
+    """)
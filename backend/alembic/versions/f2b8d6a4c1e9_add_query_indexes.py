@@ -0,0 +1,65 @@
+"""índices compuestos/parciales para las consultas de clockins, historiales y ubicaciones
+
+Revision ID: f2b8d6a4c1e9
+Revises: e7a3c5b9d2f4
+Create Date: 2025-07-15 00:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'f2b8d6a4c1e9'
+down_revision = 'e7a3c5b9d2f4'
+branch_labels = None
+depends_on = None
+
+# (nombre, definición); deben coincidir con los Index de app/models.py
+INDEXES = [
+    # GET /clockins/user/{id}: user_id = ? ORDER BY start_time DESC
+    ("ix_clockins_user_start", "clockins (user_id, start_time DESC)"),
+    # PUT /projects/{id} (último clockin terminado) y totales de /project_history
+    ("ix_clockins_project_end_done", "clockins (project_id, end_time DESC) WHERE end_time IS NOT NULL"),
+    # release_clockin_photo: ¿otro clockin usa esta foto?
+    ("ix_clockins_photo_path", "clockins (photo_path)"),
+    # requeue_pending_detections: approved IS NULL ORDER BY created_at
+    ("ix_clockins_pending_created", "clockins (created_at) WHERE approved IS NULL"),
+    ("ix_detections_clockin_id", "detections (clockin_id)"),
+    # GET /clockin_history[/{user_id}]: ORDER BY created_at DESC, id DESC (cursor)
+    ("ix_clockin_history_created", "clockin_history (created_at DESC, id DESC)"),
+    ("ix_clockin_history_user_created", "clockin_history (user_id, created_at DESC, id DESC)"),
+    ("idx_clockin_history_project_id", "clockin_history (project_id)"),
+    ("idx_clockin_history_clockin_id", "clockin_history (clockin_id)"),
+    # GET /project_history: por proyecto / usuario ordenado por date; borrado por clockin
+    ("ix_project_history_project_date", "project_history (project_id, date DESC)"),
+    ("ix_project_history_user_date", "project_history (user_id, date DESC)"),
+    ("ix_project_history_clockin_id", "project_history (clockin_id)"),
+    # GET /api/locations/all y /api/locations/clockin/{id}
+    ("ix_user_locations_timestamp", "user_locations (timestamp DESC)"),
+    ("ix_user_locations_clockin_timestamp", "user_locations (clockin_id, timestamp)"),
+]
+
+# Cubiertos por los compuestos de arriba (mismo prefijo)
+REDUNDANT = [
+    ("ix_clockins_user_id", "clockins (user_id)"),
+    ("idx_clockin_history_user_id", "clockin_history (user_id)"),
+]
+
+
+def upgrade():
+    # CONCURRENTLY: sin bloquear escrituras en tablas con datos; no puede ir
+    # dentro de una transacción
+    with op.get_context().autocommit_block():
+        for name, definition in INDEXES:
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {definition}")
+        for name, _ in REDUNDANT:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, definition in REDUNDANT:
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {definition}")
+        for name, _ in INDEXES:
+            if name.startswith("idx_clockin_history_"):
+                continue   # ya existían (77692e05df27)
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
@@ -1,4 +1,3 @@
-import os
 import uuid
 from datetime import datetime
 from typing import Optional
@@ -11,10 +10,10 @@ from passlib.context import CryptContext
 from app.database import get_db
 from app.models import User as UserModel, RoleEnum
 from app.api.routes.auth import get_current_user
+from app.services.user_cache import user_cache
+from app.services.photo_store import release_profile_photo
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-UPLOAD_ROOT = "uploads"
-PROFILE_DIR = os.path.join(UPLOAD_ROOT, "profile_photos")
 
 router = APIRouter(prefix="/admin/users", tags=["admin-users"])
 
@@ -96,6 +95,7 @@ def update_user(
 
     db.commit()
     db.refresh(user)
+    user_cache.invalidate(user.id)
     return user
 
 
@@ -111,10 +111,8 @@ def delete_user(
     user = db.query(UserModel).get(user_id)
     if not user:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "User not found")
-    if user.profile_photo:
-        try:
-            os.remove(os.path.join(PROFILE_DIR, user.profile_photo))
-        except OSError:
-            pass
+    profile_photo = user.profile_photo
     db.delete(user)
     db.commit()
+    user_cache.invalidate(user_id)
+    release_profile_photo(db, profile_photo)
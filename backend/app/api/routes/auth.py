@@ -1,16 +1,20 @@
 # backend/app/api/routes/auth.py
 
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, Query, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from jose import jwt, JWTError
 
-from typing import Generator, Optional
+from typing import Optional
+from dataclasses import dataclass
 from datetime import datetime, timedelta
+from uuid import UUID
 from pydantic import BaseModel
 
-from app.database import SessionLocal
-from app.models import User
+from app.database import get_db, get_async_db
+from app.models import User, RoleEnum
+from app.services.user_cache import user_cache, CachedUser
 
 router = APIRouter()
 
@@ -33,6 +37,7 @@ def get_password_hash(password: str) -> str:
 
 # Nota: el tokenUrl debe coincidir con tu ruta POST /login
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
+oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl="login", auto_error=False)
 
 
 # ---------------------------------------
@@ -43,17 +48,6 @@ class LoginRequest(BaseModel):
     password: str
 
 
-# ---------------------------------------
-# Dependencia para obtener la sesión de DB
-# ---------------------------------------
-def get_db() -> Generator:
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 # ---------------------------------------
 # Ruta POST /login
 # ---------------------------------------
@@ -87,15 +81,90 @@ def login(data: LoginRequest, db: Session = Depends(get_db)):
     }
 
 
+# ---------------------------------------
+# Principal ligero (solo datos del token)
+# ---------------------------------------
+@dataclass(frozen=True)
+class Principal:
+    id: UUID
+    role: RoleEnum
+
+
+def _decode_token(token: str) -> Optional[Principal]:
+    """
+    Valida la firma/expiración del JWT y devuelve (user_id, role).
+    Retorna None si el token no es válido.
+    """
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        return Principal(id=UUID(payload["user_id"]), role=RoleEnum(payload["role"]))
+    except (JWTError, KeyError, TypeError, ValueError):
+        return None
+
+
+def _load_user(db: Session, user_id: UUID) -> Optional[CachedUser]:
+    """
+    Usuario desde la caché en memoria; si no está, lo lee de la BD y lo cachea.
+    """
+    cached = user_cache.get(user_id)
+    if cached is not None:
+        return cached
+    user = db.query(User).filter(User.id == user_id).first()
+    if user is None:
+        return None
+    return user_cache.set(user)
+
+
+# ---------------------------------------
+# Dependencia get_current_principal
+# ---------------------------------------
+def get_current_principal(token: str = Depends(oauth2_scheme)) -> Principal:
+    """
+    Para endpoints que solo necesitan id/role: no toca la BD.
+    El role es el que venía firmado en el token, así que un cambio de rol
+    tarda como mucho ACCESS_TOKEN_EXPIRE_MINUTES en aplicarse aquí.
+    """
+    principal = _decode_token(token)
+    if principal is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return principal
+
+
+# ---------------------------------------
+# Dependencia get_stream_principal
+# ---------------------------------------
+def get_stream_principal(
+    header_token: Optional[str] = Depends(oauth2_scheme_optional),
+    query_token: Optional[str] = Query(None, alias="token"),
+) -> Principal:
+    """
+    Como get_current_principal, pero también acepta ?token=... para los
+    endpoints SSE: EventSource no puede mandar la cabecera Authorization.
+    """
+    principal = _decode_token(header_token or query_token or "")
+    if principal is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return principal
+
+
 # ---------------------------------------
 # Dependencia get_current_user
 # ---------------------------------------
 def get_current_user(
     token: str = Depends(oauth2_scheme),
     db: Session = Depends(get_db)
-) -> User:
+) -> CachedUser:
     """
-    Decodifica el JWT, extrae user_id y retorna el objeto User.
+    Decodifica el JWT, extrae user_id y retorna el usuario (desde la caché
+    en memoria o, si no está, desde la BD).
     Lanza 401 si el token es inválido o el usuario no existe.
     """
     credentials_exception = HTTPException(
@@ -104,42 +173,66 @@ def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
 
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("user_id")
-        if user_id is None:
-            raise credentials_exception
-    except JWTError:
+    principal = _decode_token(token)
+    if principal is None:
         raise credentials_exception
 
-    user = db.query(User).filter(User.id == user_id).first()
+    user = _load_user(db, principal.id)
     if user is None:
         raise credentials_exception
 
     return user
 
 
+async def _load_user_async(db: AsyncSession, user_id: UUID) -> Optional[CachedUser]:
+    """_load_user con la sesión async."""
+    cached = user_cache.get(user_id)
+    if cached is not None:
+        return cached
+    user = await db.get(User, user_id)
+    if user is None:
+        return None
+    return user_cache.set(user)
+
+
+# ---------------------------------------
+# Dependencia get_current_user_async
+# ---------------------------------------
+async def get_current_user_async(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db),
+) -> CachedUser:
+    """
+    get_current_user para las rutas con AsyncSession: comparte con la ruta la
+    sesión de get_async_db en vez de abrir otra del pool síncrono.
+    """
+    principal = _decode_token(token)
+    user = await _load_user_async(db, principal.id) if principal else None
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user
+
+
 # ---------------------------------------
 # Dependencia get_current_user_optional
 # ---------------------------------------
 def get_current_user_optional(
     token: Optional[str] = Depends(oauth2_scheme),
     db: Session = Depends(get_db)
-) -> Optional[User]:
+) -> Optional[CachedUser]:
     """
-    Decodifica el JWT, extrae user_id y retorna el objeto User.
+    Decodifica el JWT, extrae user_id y retorna el usuario.
     Retorna None si el token es inválido o no está presente.
     """
     if token is None:
         return None
 
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("user_id")
-        if user_id is None:
-            return None
-    except JWTError:
+    principal = _decode_token(token)
+    if principal is None:
         return None
 
-    user = db.query(User).filter(User.id == user_id).first()
-    return user
+    return _load_user(db, principal.id)
@@ -1,27 +1,21 @@
 # backend/app/api/routes/clockin_history.py
 
-from fastapi import APIRouter, Depends, HTTPException, status, Body
+from fastapi import APIRouter, Depends, HTTPException, status, Body, Query, Response
 from sqlalchemy.orm import Session
 from typing import List, Optional, Dict
 from uuid import UUID
 from datetime import datetime
 from pydantic import BaseModel, ConfigDict
 
-from app.database import SessionLocal
-from app.models import ClockinHistory, Clockin as ClockinModel, User, Project, RoleEnum
-from app.api.routes.auth import get_current_user
+from app.database import get_db
+from app.models import ClockinHistory, User, RoleEnum
+from app.api.routes.auth import get_current_principal, get_current_user, Principal
+from app.crud.clockin_history import list_history, get_history_entry
+from app.crud.pagination import encode_cursor, decode_cursor
 
 router = APIRouter(prefix="/clockin_history", tags=["clockin_history"])
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 class ClockinHistoryOut(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
@@ -40,58 +34,47 @@ class ClockinHistoryOut(BaseModel):
     end_time: Optional[datetime]
     hours: float
     photo_path: Optional[str]
+    thumbnail_path: Optional[str] = None
     created_at: datetime
 
 
+def _paginate(
+    db: Session,
+    response: Response,
+    user_id: Optional[UUID],
+    cursor: Optional[str],
+    limit: Optional[int],
+) -> List[dict]:
+    try:
+        after = decode_cursor(cursor)
+    except ValueError:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid cursor")
+
+    rows = list_history(db, user_id=user_id, after=after, limit=limit)
+
+    # Si la página viene llena, devolvemos el cursor para pedir la siguiente
+    if limit is not None and len(rows) == limit:
+        last = rows[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(last["created_at"], last["id"])
+    return rows
+
+
 @router.get(
     "/all",
     response_model=List[ClockinHistoryOut],
     summary="Todos los historiales (solo ADMIN)"
 )
 def list_history_all(
-    current_user: User = Depends(get_current_user),
+    response: Response,
+    cursor: Optional[str] = Query(None, description="Valor de X-Next-Cursor de la página anterior"),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db),
 ):
     if current_user.role != RoleEnum.admin:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
 
-    rows = (
-        db.query(ClockinHistory)
-          .order_by(ClockinHistory.created_at.desc())
-          .all()
-    )
-
-    result = []
-    for h in rows:
-        clk = db.get(ClockinModel, h.clockin_id)
-        user = db.get(User, h.user_id)
-        proj = db.get(Project, h.project_id)
-        if not clk or not user or not proj:
-            continue
-
-        start = clk.start_time
-        end = clk.end_time or h.created_at
-        hrs = round((end - start).total_seconds() / 3600.0, 2)
-
-        result.append({
-            "id":            h.id,
-            "clockin_id":    h.clockin_id,
-            "user_id":       h.user_id,
-            "user_name":     user.username,
-            "project_id":    h.project_id,
-            "project_name":  proj.name,
-            "state":         h.state,
-            "city":          h.city,
-            "street":        h.street,
-            "street_number": h.street_number,
-            "postal_code":   h.postal_code,
-            "start_time":    start,
-            "end_time":      clk.end_time,
-            "hours":         hrs,
-            "photo_path":    clk.photo_path,
-            "created_at":    h.created_at,
-        })
-    return result
+    return _paginate(db, response, None, cursor, limit)
 
 
 @router.get(
@@ -101,53 +84,20 @@ def list_history_all(
 )
 def list_history_for_user(
     user_id: UUID,
-    current_user: User = Depends(get_current_user),
+    response: Response,
+    cursor: Optional[str] = Query(None, description="Valor de X-Next-Cursor de la página anterior"),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db),
 ):
     # Solo admin o propio usuario
     if current_user.role != RoleEnum.admin and current_user.id != user_id:
         raise HTTPException(status.HTTP_403_FORBIDDEN, "Not authorized")
 
-    rows = (
-        db.query(ClockinHistory)
-          .filter(ClockinHistory.user_id == user_id)
-          .order_by(ClockinHistory.created_at.desc())
-          .all()
-    )
-    if not rows:
+    rows = _paginate(db, response, user_id, cursor, limit)
+    if not rows and cursor is None:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "No history for this user")
-
-    result = []
-    for h in rows:
-        clk = db.get(ClockinModel, h.clockin_id)
-        user = db.get(User, h.user_id)
-        proj = db.get(Project, h.project_id)
-        if not clk or not user or not proj:
-            continue
-
-        start = clk.start_time
-        end = clk.end_time or h.created_at
-        hrs = round((end - start).total_seconds() / 3600.0, 2)
-
-        result.append({
-            "id":            h.id,
-            "clockin_id":    h.clockin_id,
-            "user_id":       h.user_id,
-            "user_name":     user.username,
-            "project_id":    h.project_id,
-            "project_name":  proj.name,
-            "state":         h.state,
-            "city":          h.city,
-            "street":        h.street,
-            "street_number": h.street_number,
-            "postal_code":   h.postal_code,
-            "start_time":    start,
-            "end_time":      clk.end_time,
-            "hours":         hrs,
-            "photo_path":    clk.photo_path,
-            "created_at":    h.created_at,
-        })
-    return result
+    return rows
 
 
 @router.patch(
@@ -173,33 +123,8 @@ def update_history_entry(
             setattr(h, field, payload[field] or "")
 
     db.commit()
-    db.refresh(h)
-
-    clk = db.get(ClockinModel, h.clockin_id)
-    user = db.get(User, h.user_id)
-    proj = db.get(Project, h.project_id)
-    start = clk.start_time
-    end = clk.end_time or h.created_at
-    hrs = round((end - start).total_seconds() / 3600.0, 2)
-
-    return {
-        "id":            h.id,
-        "clockin_id":    h.clockin_id,
-        "user_id":       h.user_id,
-        "user_name":     user.username,
-        "project_id":    h.project_id,
-        "project_name":  proj.name,
-        "state":         h.state,
-        "city":          h.city,
-        "street":        h.street,
-        "street_number": h.street_number,
-        "postal_code":   h.postal_code,
-        "start_time":    start,
-        "end_time":      clk.end_time,
-        "hours":         hrs,
-        "photo_path":    clk.photo_path,
-        "created_at":    h.created_at,
-    }
+
+    return get_history_entry(db, h.id)
 
 
 @router.delete(
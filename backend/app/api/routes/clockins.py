@@ -4,14 +4,16 @@ from fastapi import (
     APIRouter, Depends, HTTPException, status,
     UploadFile, File, Form, Body,
 )
-from sqlalchemy.orm import Session
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional, Dict, Any
 from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
 from datetime import datetime, timedelta
 from uuid import uuid4, UUID
-import os
+import logging
 
-from app.database import SessionLocal
+from app.database import get_async_db
 from app.models import (
     Clockin       as ClockinModel,
     ClockinHistory,
@@ -20,21 +22,18 @@ from app.models import (
     User,
     RoleEnum,
 )
-from app.api.routes.auth import get_current_user
-from app.crud.clockins import get_monthly_hours, create_clockin
-
-router = APIRouter(prefix="/clockins", tags=["clockins"])
+from app.api.routes.auth import get_current_user_async
+from app.crud.clockins import get_monthly_hours, create_clockin_with_history
+from app.crud.hours_rollup import hours_entry, record_hours_change
+from app.services.photo_store import (
+    store_clockin_photo, release_clockin_photo, confirm_photo, discard_upload, is_incoming_key,
+)
+from app.services.storage import get_storage, url_for
+from app.worker import finalize_clockin_photo
 
-# Carpeta de uploads
-UPLOAD_DIR = "uploads/clockins"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+logger = logging.getLogger(__name__)
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+router = APIRouter(prefix="/clockins", tags=["clockins"])
 
 # --- Schemas de salida ---
 class ClockinOut(BaseModel):
@@ -50,6 +49,7 @@ class ClockinOut(BaseModel):
     location_long: Optional[float]
     postal_code: Optional[str]
     photo_path: Optional[str]
+    thumbnail_path: Optional[str] = None
     approved: Optional[bool]
     created_at: datetime
 
@@ -65,19 +65,18 @@ class MonthlyHours(BaseModel):
 
 # --- Listado con user_name y project_name ---
 @router.get("/user/{user_id}", response_model=List[ClockinOut])
-def list_clockins_for_user(user_id: UUID, db: Session = Depends(get_db)):
-    rows = (
-        db.query(
+async def list_clockins_for_user(user_id: UUID, db: AsyncSession = Depends(get_async_db)):
+    rows = (await db.execute(
+        select(
             ClockinModel,
             User.username.label("user_name"),
             Project.name.label("project_name"),
         )
         .join(User,    ClockinModel.user_id    == User.id)
         .join(Project, ClockinModel.project_id == Project.id, isouter=True)
-        .filter(ClockinModel.user_id == user_id)
+        .where(ClockinModel.user_id == user_id)
         .order_by(ClockinModel.start_time.desc())
-        .all()
-    )
+    )).all()
     if not rows:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -98,6 +97,7 @@ def list_clockins_for_user(user_id: UUID, db: Session = Depends(get_db)):
             "location_long": clk.location_long,
             "postal_code":   clk.postal_code,
             "photo_path":    clk.photo_path,
+            "thumbnail_path": clk.thumbnail_path,
             "approved":      clk.approved,
             "created_at":    clk.created_at,
         }
@@ -106,8 +106,8 @@ def list_clockins_for_user(user_id: UUID, db: Session = Depends(get_db)):
 
 # --- Chart-data ---
 @router.get("/{user_id}/chart-data", response_model=List[MonthlyHours])
-def fetch_monthly_hours(user_id: UUID, db: Session = Depends(get_db)):
-    data = get_monthly_hours(db, user_id)
+async def fetch_monthly_hours(user_id: UUID, db: AsyncSession = Depends(get_async_db)):
+    data = await db.run_sync(get_monthly_hours, user_id)
     if not data:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -117,25 +117,29 @@ def fetch_monthly_hours(user_id: UUID, db: Session = Depends(get_db)):
 
 # --- End clockin ---
 @router.put("/end/{clockin_id}", response_model=ClockinOut)
-def end_clockin_route(
+async def end_clockin_route(
     clockin_id: UUID,
     payload: Dict[str, Any] = Body(...),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async)
 ):
     elapsed_ms = payload.get("elapsed_ms", 0)
-    clk = db.query(ClockinModel).get(clockin_id)
+    # FOR UPDATE: el delta del rollup parte de este estado; dos cierres a la
+    # vez sobre el mismo clockin no pueden partir ambos del estado anterior
+    clk = await db.get(ClockinModel, clockin_id, with_for_update=True)
     if not clk:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Clockin no encontrado")
 
+    before = hours_entry(clk)
     clk.end_time = clk.start_time + timedelta(milliseconds=elapsed_ms)
     clk.status = "completed"
-    db.commit()
-    db.refresh(clk)
+    await db.run_sync(record_hours_change, before, hours_entry(clk))
+    await db.commit()
+    await db.refresh(clk)
 
     # insertar en project_history
     if clk.project_id:
-        proj = db.get(Project, clk.project_id)
+        proj = await db.get(Project, clk.project_id)
         db.add(ProjectHistory(
             id=uuid4(),
             project_id=proj.id,
@@ -151,10 +155,11 @@ def end_clockin_route(
             street_number=proj.street_number or "",
             postal_code=proj.postal_code or ""
         ))
-        db.commit()
+        await db.commit()
 
-    user_name = db.get(User, clk.user_id).username
-    proj_name = proj.name if (proj := db.get(Project, clk.project_id)) else None
+    user_name = (await db.get(User, clk.user_id)).username
+    proj = await db.get(Project, clk.project_id) if clk.project_id else None
+    proj_name = proj.name if proj else None
 
     return {
         "id":            clk.id,
@@ -169,31 +174,34 @@ def end_clockin_route(
         "location_long": clk.location_long,
         "postal_code":   clk.postal_code,
         "photo_path":    clk.photo_path,
+        "thumbnail_path": clk.thumbnail_path,
         "approved":      clk.approved,
         "created_at":    clk.created_at,
     }
 
 # --- Modificar horas manualmente ---
 @router.patch("/modify/{clockin_id}", response_model=ClockinOut)
-def modify_clockin_hours(
+async def modify_clockin_hours(
     clockin_id: UUID,
     payload: Dict[str, Any] = Body(...),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async)
 ):
-    clk = db.query(ClockinModel).get(clockin_id)
+    clk = await db.get(ClockinModel, clockin_id, with_for_update=True)
     if not clk:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Clockin no encontrado")
 
     hours = payload.get("hours")
     if hours is not None:
+        before = hours_entry(clk)
         clk.end_time = clk.start_time + timedelta(hours=float(hours))
         clk.status   = "completed"
-    db.commit()
-    db.refresh(clk)
+        await db.run_sync(record_hours_change, before, hours_entry(clk))
+    await db.commit()
+    await db.refresh(clk)
 
     if clk.project_id:
-        proj = db.get(Project, clk.project_id)
+        proj = await db.get(Project, clk.project_id)
         db.add(ProjectHistory(
             id=uuid4(),
             project_id=proj.id,
@@ -209,10 +217,11 @@ def modify_clockin_hours(
             street_number=proj.street_number or "",
             postal_code=proj.postal_code or ""
         ))
-        db.commit()
+        await db.commit()
 
-    user_name = db.get(User, clk.user_id).username
-    proj_name = proj.name if (proj := db.get(Project, clk.project_id)) else None
+    user_name = (await db.get(User, clk.user_id)).username
+    proj = await db.get(Project, clk.project_id) if clk.project_id else None
+    proj_name = proj.name if proj else None
 
     return {
         "id":            clk.id,
@@ -227,6 +236,7 @@ def modify_clockin_hours(
         "location_long": clk.location_long,
         "postal_code":   clk.postal_code,
         "photo_path":    clk.photo_path,
+        "thumbnail_path": clk.thumbnail_path,
         "approved":      clk.approved,
         "created_at":    clk.created_at,
     }
@@ -246,84 +256,62 @@ async def create_office_clockin(
     street: str            = Form(...),
     street_number: str     = Form(...),
     postal_code: str       = Form(...),
-    file: UploadFile       = File(...),
-    db: Session            = Depends(get_db),
-    current_user: User     = Depends(get_current_user),
+    file: Optional[UploadFile] = File(None),
+    upload_key: Optional[str]  = Form(None),
+    db: AsyncSession       = Depends(get_async_db),
+    current_user: User     = Depends(get_current_user_async),
 ):
-    ext = os.path.splitext(file.filename)[1]
-    fname = f"{uuid4()}{ext}"
-    path = os.path.join(UPLOAD_DIR, fname)
-    with open(path, "wb") as f:
-        f.write(await file.read())
-
-    clk = create_clockin(
-        db,
+    # La foto llega en el multipart (file) o ya subida al storage con una
+    # URL prefirmada de POST /storage/upload-url (upload_key)
+    photo = None
+    if upload_key:
+        if not is_incoming_key(upload_key, current_user.id) or \
+                not await run_in_threadpool(get_storage().exists, upload_key):
+            raise HTTPException(status.HTTP_400_BAD_REQUEST, "upload_key inválido")
+        photo_path, thumbnail_path = url_for(upload_key), None
+    elif file is not None:
+        photo = await store_clockin_photo(file)
+        photo_path, thumbnail_path = photo.url, photo.thumbnail_url
+    else:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Falta la foto (file o upload_key)")
+
+    # Clockin + clockin_history + foto del proyecto en project_history:
+    # una sola sentencia y un solo commit
+    clk = await db.run_sync(
+        create_clockin_with_history,
+        {"state": state, "city": city, "street": street, "street_number": street_number},
         user_id=current_user.id,
         project_id=project_id,
         latitude=latitude,
         longitude=longitude,
         postal_code=postal_code,
-        photo_path=f"/uploads/clockins/{fname}"
+        photo_path=photo_path,
+        thumbnail_path=thumbnail_path,
     )
+    if clk is None:
+        if photo is not None:
+            discard_upload(photo)
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Proyecto no encontrado")
+    if photo is not None:
+        await db.run_sync(confirm_photo, photo)
+
+    # Normalizar + miniatura en el worker; hasta entonces se sirve el original
+    if upload_key:
+        try:
+            finalize_clockin_photo.delay(str(clk["id"]), upload_key)
+        except Exception:
+            logger.exception("No se pudo encolar finalize_clockin_photo para %s", clk["id"])
 
-    db.add(ClockinHistory(
-        clockin_id=clk.id,
-        user_id=current_user.id,
-        project_id=project_id,
-        state=state,
-        city=city,
-        street=street,
-        street_number=street_number,
-        postal_code=postal_code,
-    ))
-    db.commit()
-
-    proj = db.get(Project, project_id)
-    db.add(ProjectHistory(
-        id=uuid4(),
-        project_id=proj.id,
-        user_id=current_user.id,
-        clockin_id=clk.id,
-        date=datetime.utcnow(),
-        status=proj.status,
-        start_date=proj.start_date,
-        end_date=proj.end_date,
-        state=proj.state or "",
-        city=proj.city or "",
-        street=proj.street or "",
-        street_number=proj.street_number or "",
-        postal_code=proj.postal_code or ""
-    ))
-    db.commit()
-
-    user_name = current_user.username
-    proj_name = proj.name
-
-    return {
-        "id":            clk.id,
-        "user_id":       clk.user_id,
-        "user_name":     user_name,
-        "project_id":    clk.project_id,
-        "project_name":  proj_name,
-        "start_time":    clk.start_time,
-        "end_time":      clk.end_time,
-        "status":        clk.status,
-        "location_lat":  clk.location_lat,
-        "location_long": clk.location_long,
-        "postal_code":   clk.postal_code,
-        "photo_path":    clk.photo_path,
-        "approved":      clk.approved,
-        "created_at":    clk.created_at,
-    }
+    return {**clk, "user_name": current_user.username}
 
 # --- Delete clockin ---
 @router.delete("/{clockin_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_clockin(
+async def delete_clockin(
     clockin_id: UUID,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async),
 ):
-    clk = db.query(ClockinModel).get(clockin_id)
+    clk = await db.get(ClockinModel, clockin_id, with_for_update=True)
     if not clk:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Clockin no encontrado")
 
@@ -331,18 +319,21 @@ def delete_clockin(
     if current_user.role != RoleEnum.admin and clk.user_id != current_user.id:
         raise HTTPException(status.HTTP_403_FORBIDDEN, "No autorizado")
 
-    # Borrar foto en disco
-    if clk.photo_path:
-        fp = clk.photo_path.lstrip("/")
-        try:
-            os.remove(fp)
-        except FileNotFoundError:
-            pass
-
     # Borrar historiales asociados
-    db.query(ClockinHistory).filter(ClockinHistory.clockin_id == clockin_id).delete(synchronize_session=False)
-    db.query(ProjectHistory).filter(ProjectHistory.clockin_id == clockin_id).delete(synchronize_session=False)
+    await db.execute(
+        delete(ClockinHistory).where(ClockinHistory.clockin_id == clockin_id),
+        execution_options={"synchronize_session": False},
+    )
+    await db.execute(
+        delete(ProjectHistory).where(ProjectHistory.clockin_id == clockin_id),
+        execution_options={"synchronize_session": False},
+    )
+
+    photo_path, thumbnail_path = clk.photo_path, clk.thumbnail_path
+    await db.run_sync(record_hours_change, hours_entry(clk), None)
+    await db.delete(clk)
+    await db.commit()
 
-    db.delete(clk)
-    db.commit()
+    # Borrar foto (y miniatura) en disco si ningún otro clockin la usa
+    await db.run_sync(release_clockin_photo, photo_path, thumbnail_path)
     return
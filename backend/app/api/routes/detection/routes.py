@@ -1,32 +1,46 @@
 # backend/app/api/routes/detection.py
 
 from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from uuid import uuid4
+from typing import Any, Dict
+from uuid import UUID
+import asyncio
+import json
+import logging
 import os
 import redis
 from datetime import datetime
 
-from app.database import SessionLocal
+from app.database import get_db, AsyncSessionLocal
 from app.crud.clockins import create_clockin, start_clockin_detection
 from app.worker import run_detection, celery_app
 from celery.result import AsyncResult
-from app.models import User, RoleEnum
-from app.api.routes.auth import get_current_user
+from app.models import User, RoleEnum, Clockin, Detection
+from app.api.routes.auth import get_current_user, get_current_principal, get_stream_principal, Principal
+from app.services.photo_store import store_clockin_photo, confirm_photo, discard_upload
+from app.services.detection import enqueue_detection
+from app.services.detection_queue import DetectionQueueFull
+from app.services.detection_events import REDIS_URL, subscribe_detection, next_detection_event
+from starlette.concurrency import run_in_threadpool
 
 # Configuración
-UPLOAD_DIR = "uploads/clockins"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-redis_client = redis.Redis(host="localhost", port=6379, db=0)
+redis_client = redis.Redis.from_url(REDIS_URL)
 
-router = APIRouter(prefix="/detection", tags=["detection"])
+# Aprobación diferida: el clockin se crea al momento con approved=None y la
+# detección lo completa después. Con "false", lo crea el worker al terminar.
+DETECTION_DEFERRED_APPROVAL = os.getenv("DETECTION_DEFERRED_APPROVAL", "true").lower() in ("1", "true", "yes")
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# SSE de resultados: espera máxima y cada cuánto se manda un comentario para
+# que proxies/navegadores no corten la conexión
+DETECTION_EVENTS_TIMEOUT = float(os.getenv("DETECTION_EVENTS_TIMEOUT", "120"))
+SSE_KEEPALIVE = 15.0
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/detection", tags=["detection"])
 
 @router.post("/clockins/{user_id}/photo", status_code=status.HTTP_201_CREATED)
 async def upload_photo_only(
@@ -39,21 +53,19 @@ async def upload_photo_only(
     Endpoint para todos los usuarios: sube foto y arranca clockin sin modelo.
     """
     # Guardamos la imagen
-    ext = os.path.splitext(file.filename)[1]
-    fname = f"{uuid4()}{ext}"
-    path = os.path.join(UPLOAD_DIR, fname)
-    with open(path, "wb") as f:
-        f.write(await file.read())
+    photo = await store_clockin_photo(file)
 
     # Creamos el clockin directamente
     clockin = create_clockin(
         db,
         user_id=user_id,
-        photo_path=f"/uploads/clockins/{fname}"
+        photo_path=photo.url,
+        thumbnail_path=photo.thumbnail_url
     )
+    confirm_photo(db, photo)
     return clockin
 
-@router.post("/clockins/{user_id}/detect", status_code=status.HTTP_201_CREATED)
+@router.post("/clockins/{user_id}/detect", status_code=status.HTTP_202_ACCEPTED)
 async def detect_and_clockin(
     user_id: str,
     file: UploadFile = File(...),
@@ -69,29 +81,64 @@ async def detect_and_clockin(
     current_user: User = Depends(get_current_user),
 ):
     """
-    Ahora también para field: si es field, creamos clockin de inmediato;
-    si es office/admin, igual funciona aquí.
+    Guarda la foto y encola la detección EPP. Devuelve el task_id para
+    /detection/task-events/{task_id} (o /detection/task-status/{task_id}).
+
+    Con DETECTION_DEFERRED_APPROVAL el clockin se crea ya (approved=None,
+    pendiente) y se devuelve junto al task_id, que es su id; el tiempo de
+    respuesta no depende del modelo. Si la cola está llena, la detección la
+    reencola después requeue_pending_detections.
+
+    Si no, el worker crea el clockin al terminar y, con la cola llena, se
+    responde 429 + Retry-After (la foto ya queda guardada: el reintento no
+    la vuelve a procesar).
     """
-    # Leemos y guardamos la imagen
-    ext = os.path.splitext(file.filename)[1]
-    fname = f"{uuid4()}{ext}"
-    path = os.path.join(UPLOAD_DIR, fname)
-    content = await file.read()
-    with open(path, "wb") as f:
-        f.write(content)
-
-    # Si quieres seguir pasando por Celery en el futuro, podrías usar run_detection aquí.
-    # Pero por ahora, para todos los roles, creamos el clockin directamente:
-    clockin = create_clockin(
-        db,
+    # Guardamos la imagen (normalizada + miniatura); el worker la lee del storage
+    photo = await store_clockin_photo(file)
+    detection = dict(
         user_id=user_id,
         project_id=project_id,
         latitude=latitude,
         longitude=longitude,
         postal_code=postal_code,
-        photo_path=f"/uploads/clockins/{fname}"
+        photo_path=photo.url,
+        thumbnail_path=photo.thumbnail_url,
+        photo_sha256=photo.sha256,
     )
-    return clockin
+
+    if DETECTION_DEFERRED_APPROVAL:
+        clk = await run_in_threadpool(
+            create_clockin,
+            db,
+            user_id=user_id,
+            photo_path=photo.url,
+            project_id=project_id,
+            latitude=latitude,
+            longitude=longitude,
+            postal_code=postal_code,
+            thumbnail_path=photo.thumbnail_url,
+            approved=None,
+        )
+        await run_in_threadpool(confirm_photo, db, photo)
+        try:
+            await run_in_threadpool(enqueue_detection, photo.key, clockin_id=str(clk.id), **detection)
+        except DetectionQueueFull:
+            logger.warning("[detect] cola llena; clockin %s queda pendiente", clk.id)
+        except Exception:
+            logger.exception("[detect] no se pudo encolar la detección del clockin %s", clk.id)
+        return {"task_id": str(clk.id), "status": "pending", "clockin": _clockin_fields(clk)}
+
+    # Aquí el clockin lo crea el worker más tarde: no hay fila que confirmar
+    discard_upload(photo)
+    try:
+        task_id = await run_in_threadpool(enqueue_detection, photo.key, **detection)
+    except DetectionQueueFull as exc:
+        raise HTTPException(
+            status.HTTP_429_TOO_MANY_REQUESTS,
+            "Detector saturado, inténtalo de nuevo en unos segundos",
+            headers={"Retry-After": str(exc.retry_after)},
+        )
+    return {"task_id": task_id, "status": "pending"}
 
 @router.post("/task-metadata")
 async def save_task_metadata(
@@ -112,22 +159,142 @@ async def save_task_metadata(
     )
     return {"status": "metadata_saved"}
 
+def _clockin_fields(clk: Clockin) -> Dict[str, Any]:
+    return {
+        "id":             clk.id,
+        "user_id":        clk.user_id,
+        "project_id":     clk.project_id,
+        "start_time":     clk.start_time,
+        "status":         clk.status,
+        "location_lat":   clk.location_lat,
+        "location_long":  clk.location_long,
+        "postal_code":    clk.postal_code,
+        "photo_path":     clk.photo_path,
+        "thumbnail_path": clk.thumbnail_path,
+        "approved":       clk.approved,
+    }
+
+
+def _clockin_result(clk: Clockin, detections) -> Dict[str, Any]:
+    """Resultado de una detección terminada (task-status y task-events)."""
+    return {
+        "status":    "completed",
+        "clockin":   _clockin_fields(clk),
+        "approved":  clk.approved,
+        "detection": [
+            {"name": d.label, "confidence": d.confidence} for d in detections
+        ],
+    }
+
+
+def _can_see(principal: Principal, clk: Clockin) -> bool:
+    return principal.role == RoleEnum.admin or clk.user_id == principal.id
+
+
+def _task_clockin_id(task_id: str):
+    """Con aprobación diferida el task_id es el id del clockin."""
+    try:
+        return UUID(task_id)
+    except ValueError:
+        return None
+
+
+def _event_from_result(result: AsyncResult) -> Dict[str, Any]:
+    """Mismo formato que publica el worker, a partir de una tarea ya terminada."""
+    if result.successful():
+        return {"status": "completed", **result.result}
+    return {"status": "failed", "error": str(result.result or "Unknown")}
+
+
 @router.get("/task-status/{task_id}")
-async def get_task_status(
+def get_task_status(
     task_id: str,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_principal),
 ):
     """
-    Este endpoint permanece para cuando quieras volver a Celery.
-    Por ahora sólo devuelve 'pending' hasta completarlo manualmente.
+    Estado de la detección encolada por /clockins/{user_id}/detect.
+    Mejor usar /task-events/{task_id}, que avisa en cuanto termina.
+    Solo para el autor del clockin o un admin.
     """
+    clockin_id = _task_clockin_id(task_id)
+    clk = db.get(Clockin, clockin_id) if clockin_id else None
+    if clk is not None and not _can_see(current_user, clk):
+        raise HTTPException(status.HTTP_403_FORBIDDEN, "No autorizado")
+
     result = AsyncResult(task_id, app=celery_app)
     if not result.ready():
         return {"status": "pending"}
 
-    # Si completó, devolvemos directamente el clockin ya creado
-    if result.successful():
-        return {"status": "completed", "clockin": result.result.get("clockin")}
+    event = _event_from_result(result)
+    if event["status"] != "completed":
+        return event
+
+    # El resultado de la tarea solo trae el id del clockin que creó el worker
+    clk = db.get(Clockin, UUID(event["clockin_id"]))
+    if clk is None:
+        return {"status": "failed", "error": "Clockin eliminado"}
+    if not _can_see(current_user, clk):
+        raise HTTPException(status.HTTP_403_FORBIDDEN, "No autorizado")
+    return _clockin_result(clk, clk.detections)
+
+
+async def _event_payload(event: Dict[str, Any], principal: Principal) -> Dict[str, Any]:
+    if event["status"] != "completed":
+        return event
+    async with AsyncSessionLocal() as db:
+        clk = await db.get(Clockin, UUID(event["clockin_id"]))
+        if clk is None:
+            return {"status": "failed", "error": "Clockin eliminado"}
+        if not _can_see(principal, clk):
+            return {"status": "failed", "error": "No autorizado"}
+        detections = (await db.execute(
+            select(Detection).where(Detection.clockin_id == clk.id)
+        )).scalars().all()
+    return _clockin_result(clk, detections)
 
-    # Si falló:
-    return {"status": "failed", "error": str(result.result.get("error", "Unknown"))}
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+
+@router.get("/task-events/{task_id}")
+async def task_events(task_id: str, current_user: Principal = Depends(get_stream_principal)):
+    """
+    Server-Sent Events: un único evento `result` (mismo JSON que
+    /task-status) en cuanto el worker termina la detección, sin polling.
+    Si no termina en DETECTION_EVENTS_TIMEOUT s se envía `timeout`.
+    El token puede ir en ?token=... (EventSource no manda cabeceras).
+    """
+    clockin_id = _task_clockin_id(task_id)
+    if clockin_id is not None:
+        async with AsyncSessionLocal() as db:
+            clk = await db.get(Clockin, clockin_id)
+        if clk is not None and not _can_see(current_user, clk):
+            raise HTTPException(status.HTTP_403_FORBIDDEN, "No autorizado")
+
+    async def stream():
+        async with subscribe_detection(task_id) as sub:
+            # Ya suscritos: si terminó antes de conectarnos, lo sabremos aquí
+            result = AsyncResult(task_id, app=celery_app)
+            done = await run_in_threadpool(result.ready)
+            event = await run_in_threadpool(_event_from_result, result) if done else None
+
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + DETECTION_EVENTS_TIMEOUT
+            while event is None:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    yield _sse("timeout", {"status": "pending"})
+                    return
+                event = await next_detection_event(sub, min(SSE_KEEPALIVE, remaining))
+                if event is None:
+                    yield ": keep-alive\n\n"
+
+        yield _sse("result", await _event_payload(event, current_user))
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,23 +1,17 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import and_, or_, select, true
+from sqlalchemy.ext.asyncio import AsyncSession
 from uuid import UUID
-from datetime import datetime
-from typing import List, Optional, Dict
+from datetime import datetime, timedelta
+from typing import List, Optional, Dict, Tuple
 
-from app.database import SessionLocal
-from app.models import UserLocation, User
-from app.api.routes.auth import get_current_user
+from app.database import get_async_db
+from app.models import Clockin, UserLocation, User
+from app.api.routes.auth import get_current_principal, get_current_user_async, Principal
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/locations", tags=["locations"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 class LocationCreate(BaseModel):
     latitude: float
     longitude: float
@@ -38,7 +32,7 @@ class LocationWithUser(LocationOut):
     username: str
 
 @router.post("/", response_model=LocationOut)
-def create_location(data: LocationCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def create_location(data: LocationCreate, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user_async)):
     loc = UserLocation(
         user_id=current_user.id,
         clockin_id=data.clockin_id,
@@ -46,17 +40,16 @@ def create_location(data: LocationCreate, db: Session = Depends(get_db), current
         longitude=data.longitude,
     )
     db.add(loc)
-    db.commit()
-    db.refresh(loc)
+    await db.commit()
+    await db.refresh(loc)
     return loc
 
 @router.get("/all", response_model=List[LocationWithUser])
-def all_locations(db: Session = Depends(get_db)):
-    rows = (
-        db.query(UserLocation, User.username)
+async def all_locations(db: AsyncSession = Depends(get_async_db)):
+    rows = await db.execute(
+        select(UserLocation, User.username)
         .join(User, UserLocation.user_id == User.id)
         .order_by(UserLocation.timestamp.desc())
-        .all()
     )
     return [
         {
@@ -71,6 +64,64 @@ def all_locations(db: Session = Depends(get_db)):
         for loc, username in rows
     ]
 
+def _bbox(bbox: str) -> Tuple[float, float, float, float]:
+    """'oeste,sur,este,norte' (lng/lat en grados, orden GeoJSON)."""
+    try:
+        west, south, east, north = (float(v) for v in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "bbox debe ser 'oeste,sur,este,norte'")
+    if not (-180 <= west <= 180 and -180 <= east <= 180 and -90 <= south <= north <= 90):
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "bbox fuera de rango")
+    return west, south, east, north
+
+@router.get("/latest", response_model=List[LocationWithUser])
+async def latest_locations(
+    since: Optional[datetime] = Query(None, description="Solo usuarios con una ubicación desde esta fecha"),
+    bbox: Optional[str] = Query(None, description="oeste,sur,este,norte"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal),
+):
+    # Última ubicación de cada usuario (una fila por usuario, no todas las
+    # migas): por cada usuario se lee la primera entrada del índice
+    # (user_id, timestamp DESC) de cada partición, empezando por la más
+    # reciente, en vez de recorrer user_locations entera como DISTINCT ON
+    latest = (
+        select(UserLocation)
+        .where(UserLocation.user_id == User.id)
+        .order_by(UserLocation.timestamp.desc())
+        .limit(1)
+    )
+    if since is not None:
+        latest = latest.where(UserLocation.timestamp >= since)
+    latest = latest.lateral("latest")
+
+    query = (
+        select(latest, User.username)
+        .select_from(User)
+        .join(latest, true())
+        .order_by(latest.c.timestamp.desc())
+    )
+    if bbox is not None:
+        # El recuadro se aplica a la última posición: un usuario que ya salió
+        # de él no aparece con una ubicación anterior
+        west, south, east, north = _bbox(bbox)
+        lng = latest.c.longitude
+        # oeste > este: el recuadro cruza el antimeridiano
+        in_lng = and_(lng >= west, lng <= east) if west <= east else or_(lng >= west, lng <= east)
+        query = query.where(latest.c.latitude.between(south, north), in_lng)
+
+    rows = await db.execute(query)
+    return [dict(row._mapping) for row in rows]
+
 @router.get("/clockin/{clockin_id}", response_model=List[LocationOut])
-def clockin_locations(clockin_id: UUID, db: Session = Depends(get_db)):
-    return db.query(UserLocation).filter(UserLocation.clockin_id == clockin_id).order_by(UserLocation.timestamp.asc()).all()
+async def clockin_locations(clockin_id: UUID, db: AsyncSession = Depends(get_async_db)):
+    # Las ubicaciones de un clockin son posteriores a su inicio: con ese
+    # límite Postgres descarta las particiones mensuales anteriores (1 día de
+    # margen por si el reloj de la app y el de la BD no van a la par)
+    since = select(Clockin.start_time - timedelta(days=1)).where(Clockin.id == clockin_id).scalar_subquery()
+    result = await db.execute(
+        select(UserLocation)
+        .where(UserLocation.clockin_id == clockin_id, UserLocation.timestamp >= since)
+        .order_by(UserLocation.timestamp.asc())
+    )
+    return result.scalars().all()
@@ -1,31 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from sqlalchemy.orm import Session
-from sqlalchemy import func, extract
 from typing import List, Optional
 from uuid import UUID
 from datetime import datetime
 from pydantic import BaseModel, ConfigDict
 
-from app.database import SessionLocal
+from app.database import get_db
 from app.models import (
-    ProjectHistory,
-    Clockin,
-    User,
-    Project,
     ProjectStatusEnum,
     RoleEnum,
 )
-from app.api.routes.auth import get_current_user
+from app.api.routes.auth import get_current_principal, Principal
+from app.crud.project_history import list_project_history
+from app.crud.pagination import encode_cursor, decode_cursor
 
 router = APIRouter(prefix="/project_history", tags=["project_history"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 class ProjectHistoryOut(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
@@ -48,106 +38,91 @@ class ProjectHistoryOut(BaseModel):
     end_date: Optional[datetime]
     hours: float  # aquí puede ser total o individual
 
+def _address(row: dict) -> dict:
+    return {
+        "project_id":    row["project_id"],
+        "project_name":  row["project_name"],
+        "status":        row["status"],
+        "state":         row["state"] or "",
+        "city":          row["city"] or "",
+        "street":        row["street"] or "",
+        "street_number": row["street_number"] or "",
+        "postal_code":   row["postal_code"] or "",
+        "start_date":    row["start_date"],
+        "end_date":      row["end_date"],
+    }
+
+
 @router.get("/", response_model=List[ProjectHistoryOut])
 def list_history(
+    response: Response,
+    project_id: Optional[UUID] = Query(None),
+    user_id: Optional[UUID] = Query(None, description="Solo admin; el resto ve siempre lo suyo"),
+    date_from: Optional[datetime] = Query(None),
+    date_to: Optional[datetime] = Query(None),
+    cursor: Optional[str] = Query(None, description="Valor de X-Next-Cursor de la página anterior"),
+    limit: Optional[int] = Query(None, ge=1, le=500, description="Proyectos por página"),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
 ):
     """
-    → Admin: ve todo.
+    → Admin: ve todo (o lo de `user_id` si se indica).
     → Office/Field: sólo sus ProjectHistory.
 
     Por cada proyecto:
       1) Fila TOTAL con horas acumuladas (todos o sólo del user).
       2) Filas individuales con horas de cada clockin.
+
+    Todo sale de una sola consulta (ver crud.project_history.list_project_history).
     """
-    # 1) Leemos todas las entradas de history (filtro por user si no es admin)
-    q = db.query(ProjectHistory)
     if current_user.role != RoleEnum.admin:
-        q = q.filter(ProjectHistory.user_id == current_user.id)
-    history_rows = q.order_by(ProjectHistory.date.desc()).all()
+        user_id = current_user.id
 
-    if not history_rows:
+    try:
+        after = decode_cursor(cursor)
+    except ValueError:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid cursor")
+
+    rows = list_project_history(
+        db,
+        user_id=user_id,
+        project_id=project_id,
+        date_from=date_from,
+        date_to=date_to,
+        after=after,
+        limit=limit,
+    )
+    if not rows and cursor is None:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "No history entries found")
 
-    # 2) Agrupamos por proyecto
-    by_proj: dict[UUID, List[ProjectHistory]] = {}
-    for h in history_rows:
-        by_proj.setdefault(h.project_id, []).append(h)
-
-    out: List[ProjectHistoryOut] = []
-
-    for proj_id, hist_list in by_proj.items():
-        proj = db.get(Project, proj_id)
-        if not proj:
-            continue
-
-        # 3) Calculamos total acumulado
-        total_q = db.query(
-            func.coalesce(
-                func.sum(extract("epoch", Clockin.end_time - Clockin.start_time)),
-                0.0
-            )
-        ).filter(
-            Clockin.project_id == proj.id,
-            Clockin.end_time.isnot(None)
-        )
-        if current_user.role != RoleEnum.admin:
-            total_q = total_q.filter(Clockin.user_id == current_user.id)
-
-        total_secs = float(total_q.scalar() or 0.0)
-        total_hours = round(total_secs / 3600.0, 2)
-
-        # 4) Fila aggregate / TOTAL
+    out: List[dict] = []
+    current_proj = None
+    n_projects = 0
+    for row in rows:
+        # Fila aggregate / TOTAL al empezar cada proyecto
+        if row["project_id"] != current_proj:
+            current_proj = row["project_id"]
+            n_projects += 1
+            out.append({
+                "id":         row["project_id"],     # reutilizamos project_id como id
+                "clockin_id": None,
+                "user_id":    None,
+                "user_name":  "TOTAL",
+                **_address(row),
+                "hours":      row["total_hours"],
+            })
+
+        # Fila individual
         out.append({
-            "id":            proj.id,            # reutilizamos project_id como id
-            "clockin_id":    None,
-            "user_id":       None,
-            "user_name":     "TOTAL",
-            "project_id":    proj.id,
-            "project_name":  proj.name,
-            "status":        proj.status,
-            "state":         proj.state or "",
-            "city":          proj.city or "",
-            "street":        proj.street or "",
-            "street_number": proj.street_number or "",
-            "postal_code":   proj.postal_code or "",
-            "start_date":    proj.start_date,
-            "end_date":      proj.end_date,
-            "hours":         total_hours,
+            "id":         row["id"],
+            "clockin_id": row["clockin_id"],
+            "user_id":    row["user_id"],
+            "user_name":  row["user_name"],
+            **_address(row),
+            "hours":      row["hours"],
         })
 
-        # 5) Filas individuales
-        for h in hist_list:
-            user = db.get(User, h.user_id)
-            uname = user.username if user else ""
-
-            # calculamos horas de este clockin
-            if h.clockin_id:
-                clk = db.get(Clockin, h.clockin_id)
-                if clk and clk.end_time:
-                    ind_secs = (clk.end_time - clk.start_time).total_seconds()
-                else:
-                    ind_secs = 0.0
-            else:
-                ind_secs = 0.0
-            ind_hours = round(ind_secs / 3600.0, 2)
-
-            out.append({
-                "id":            h.id,
-                "clockin_id":    h.clockin_id,
-                "user_id":       h.user_id,
-                "user_name":     uname,
-                "project_id":    proj.id,
-                "project_name":  proj.name,
-                "status":        proj.status,
-                "state":         proj.state or "",
-                "city":          proj.city or "",
-                "street":        proj.street or "",
-                "street_number": proj.street_number or "",
-                "postal_code":   proj.postal_code or "",
-                "start_date":    proj.start_date,
-                "end_date":      proj.end_date,
-                "hours":         ind_hours,
-            })
+    if limit is not None and n_projects == limit:
+        last = rows[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(last["last_date"], last["project_id"])
     return out
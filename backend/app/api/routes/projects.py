@@ -1,34 +1,28 @@
 # backend/app/api/routes/projects.py
 
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from uuid import uuid4, UUID
 from datetime import datetime
 from typing import List, Optional
 
 from pydantic import BaseModel, ConfigDict
-from sqlalchemy import func, extract
+from sqlalchemy import func, select, delete
 
-from app.database import SessionLocal
+from app.database import get_async_db
 from app.models import (
     Project      as ProjectModel,
     ProjectStatusEnum,
     Clockin,
+    ClockinDailyHours,
     ProjectHistory,
     User,
     RoleEnum
 )
-from app.api.routes.auth import get_current_user
+from app.api.routes.auth import get_current_user_async
 
 router = APIRouter(prefix="/projects", tags=["projects"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 
 # ---------------------------------------
 # → Pydantic Schemas
@@ -88,28 +82,35 @@ class ProjectUpdate(BaseModel):
     end_date: Optional[datetime] = None
 
 
+async def _project_hours(db: AsyncSession, project_id: UUID) -> float:
+    """
+    Horas acumuladas (clockins terminados) de un proyecto, desde el rollup diario.
+    """
+    result = await db.execute(
+        select(func.coalesce(func.sum(ClockinDailyHours.seconds) / 3600.0, 0.0))
+        .where(ClockinDailyHours.project_id == project_id)
+    )
+    return result.scalar()
+
+
 # ---------------------------------------
 # → GET /projects
 # ---------------------------------------
 @router.get("/", response_model=List[ProjectRead])
-def get_projects(db: Session = Depends(get_db)):
+async def get_projects(db: AsyncSession = Depends(get_async_db)):
     subq = (
-        db.query(
-            Clockin.project_id.label("proj_id"),
-            func.coalesce(
-                func.sum(extract("epoch", Clockin.end_time - Clockin.start_time)) / 3600.0,
-                0.0,
-            ).label("total_hours"),
+        select(
+            ClockinDailyHours.project_id.label("proj_id"),
+            func.coalesce(func.sum(ClockinDailyHours.seconds) / 3600.0, 0.0).label("total_hours"),
         )
-        .filter(Clockin.end_time.isnot(None))
-        .group_by(Clockin.project_id)
+        .where(ClockinDailyHours.project_id.isnot(None))
+        .group_by(ClockinDailyHours.project_id)
         .subquery()
     )
 
-    rows = (
-        db.query(ProjectModel, subq.c.total_hours)
+    rows = await db.execute(
+        select(ProjectModel, subq.c.total_hours)
         .outerjoin(subq, ProjectModel.id == subq.c.proj_id)
-        .all()
     )
 
     result = []
@@ -124,21 +125,12 @@ def get_projects(db: Session = Depends(get_db)):
 # → GET /projects/{project_id}
 # ---------------------------------------
 @router.get("/{project_id}", response_model=ProjectRead)
-def get_project(project_id: UUID, db: Session = Depends(get_db)):
-    proj = db.query(ProjectModel).filter(ProjectModel.id == project_id).first()
+async def get_project(project_id: UUID, db: AsyncSession = Depends(get_async_db)):
+    proj = await db.get(ProjectModel, project_id)
     if not proj:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Project not found")
 
-    total = (
-        db.query(
-            func.coalesce(
-                func.sum(extract("epoch", Clockin.end_time - Clockin.start_time)) / 3600.0,
-                0.0,
-            )
-        )
-        .filter(Clockin.project_id == project_id, Clockin.end_time.isnot(None))
-        .scalar()
-    )
+    total = await _project_hours(db, project_id)
 
     pr = ProjectRead.from_orm(proj)
     pr.total_hours = round(total or 0, 2)
@@ -149,10 +141,10 @@ def get_project(project_id: UUID, db: Session = Depends(get_db)):
 # → POST /projects
 # ---------------------------------------
 @router.post("/", response_model=ProjectRead, status_code=status.HTTP_201_CREATED)
-def create_project(
+async def create_project(
     payload: ProjectCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async),
 ):
     # 1) Insertar el proyecto
     proj = ProjectModel(
@@ -172,8 +164,8 @@ def create_project(
         created_at=datetime.utcnow(),
     )
     db.add(proj)
-    db.commit()
-    db.refresh(proj)
+    await db.commit()
+    await db.refresh(proj)
 
     # 2) Registrar entrada en project_history
     initial_hist = ProjectHistory(
@@ -192,7 +184,7 @@ def create_project(
         postal_code=proj.postal_code or "",
     )
     db.add(initial_hist)
-    db.commit()
+    await db.commit()
 
     pr = ProjectRead.from_orm(proj)
     pr.total_hours = 0.0
@@ -203,13 +195,13 @@ def create_project(
 # → PUT /projects/{project_id}
 # ---------------------------------------
 @router.put("/{project_id}", response_model=ProjectRead)
-def update_project(
+async def update_project(
     project_id: UUID,
     payload: ProjectUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async),
 ):
-    proj = db.query(ProjectModel).filter(ProjectModel.id == project_id).first()
+    proj = await db.get(ProjectModel, project_id)
     if not proj:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Project not found")
 
@@ -249,16 +241,16 @@ def update_project(
     if "end_date" in data:
         proj.end_date = data["end_date"]
 
-    db.commit()
-    db.refresh(proj)
+    await db.commit()
+    await db.refresh(proj)
 
     # — Loguear snapshot completo en project_history:
-    last_clk = (
-        db.query(Clockin)
-        .filter(Clockin.project_id == project_id, Clockin.end_time.isnot(None))
+    last_clk = (await db.execute(
+        select(Clockin)
+        .where(Clockin.project_id == project_id, Clockin.end_time.isnot(None))
         .order_by(Clockin.end_time.desc())
-        .first()
-    )
+        .limit(1)
+    )).scalars().first()
     hist = ProjectHistory(
         id=uuid4(),
         project_id=proj.id,
@@ -275,19 +267,10 @@ def update_project(
         postal_code=proj.postal_code or "",
     )
     db.add(hist)
-    db.commit()
+    await db.commit()
 
     # — Recalcular total_hours
-    total = (
-        db.query(
-            func.coalesce(
-                func.sum(extract("epoch", Clockin.end_time - Clockin.start_time)) / 3600.0,
-                0.0,
-            )
-        )
-        .filter(Clockin.project_id == project_id, Clockin.end_time.isnot(None))
-        .scalar()
-    )
+    total = await _project_hours(db, project_id)
 
     pr = ProjectRead.from_orm(proj)
     pr.total_hours = round(total or 0, 2)
@@ -298,21 +281,21 @@ def update_project(
 # → DELETE /projects/{project_id}
 # ---------------------------------------
 @router.delete("/{project_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_project(
+async def delete_project(
     project_id: UUID,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async),
 ):
     # Solo admin puede borrar
     if current_user.role != RoleEnum.admin:
         raise HTTPException(status.HTTP_403_FORBIDDEN, "Only admins can delete")
 
-    proj = db.query(ProjectModel).filter(ProjectModel.id == project_id).first()
+    proj = await db.get(ProjectModel, project_id)
     if not proj:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Project not found")
 
     # Limpiar historial para no romper FKs
-    db.query(ProjectHistory).filter(ProjectHistory.project_id == project_id).delete()
-    db.delete(proj)
-    db.commit()
+    await db.execute(delete(ProjectHistory).where(ProjectHistory.project_id == project_id))
+    await db.delete(proj)
+    await db.commit()
     return  # 204 No Content
@@ -0,0 +1,88 @@
+# backend/app/api/routes/storage.py
+
+import os
+from typing import Dict
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+
+from app.api.routes.auth import get_current_user
+from app.models import User
+from app.services.photo_store import incoming_key, staging_path, discard_file
+from app.services.storage import get_storage, LocalStorage, PRESIGN_EXPIRES
+from app.services.uploads import MAX_UPLOAD_BYTES
+
+router = APIRouter(prefix="/storage", tags=["storage"])
+
+# Tipos aceptados → extensión de la clave
+_EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png":  ".png",
+    "image/webp": ".webp",
+    "image/heic": ".heic",
+}
+
+
+class UploadUrlIn(BaseModel):
+    content_type: str = "image/jpeg"
+
+
+class UploadUrlOut(BaseModel):
+    key: str              # se manda luego como upload_key (p.ej. POST /clockins/photo)
+    url: str
+    method: str
+    headers: Dict[str, str]
+    expires_in: int
+
+
+@router.post("/upload-url", response_model=UploadUrlOut)
+def create_upload_url(
+    data: UploadUrlIn,
+    current_user: User = Depends(get_current_user),
+):
+    """
+    URL prefirmada para subir una foto directamente al storage, sin que los
+    bytes pasen por la API. Con S3/MinIO es una URL del bucket; con el
+    storage local apunta a PUT /storage/direct/<key>.
+    """
+    ext = _EXTENSIONS.get(data.content_type)
+    if ext is None:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Tipo de fichero no permitido")
+
+    key = incoming_key(current_user.id, ext)
+    presigned = get_storage().presign_upload(key, data.content_type, PRESIGN_EXPIRES)
+    return {"key": key, "expires_in": PRESIGN_EXPIRES, **presigned}
+
+
+@router.put("/direct/{key:path}", status_code=status.HTTP_204_NO_CONTENT)
+async def direct_upload(key: str, expires: int, signature: str, request: Request):
+    """
+    Destino de las URLs "prefirmadas" del storage local (equivalente al PUT
+    sobre el bucket). Solo existe con STORAGE_BACKEND=local.
+    """
+    storage = get_storage()
+    if not isinstance(storage, LocalStorage):
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Not found")
+    if not LocalStorage.verify(key, expires, signature):
+        raise HTTPException(status.HTTP_403_FORBIDDEN, "Firma inválida o caducada")
+
+    tmp_path = await run_in_threadpool(staging_path, os.path.splitext(key)[1])
+    out = await run_in_threadpool(open, tmp_path, "wb")
+    size = 0
+    try:
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > MAX_UPLOAD_BYTES:
+                raise HTTPException(
+                    status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    f"File exceeds {MAX_UPLOAD_BYTES // (1024 * 1024)} MB",
+                )
+            await run_in_threadpool(out.write, chunk)
+    except BaseException:
+        await run_in_threadpool(out.close)
+        await run_in_threadpool(discard_file, tmp_path)
+        raise
+
+    await run_in_threadpool(out.close)
+    await run_in_threadpool(storage.put_file, tmp_path, key)
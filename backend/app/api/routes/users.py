@@ -1,7 +1,5 @@
 # backend/app/api/routes/users.py
 
-import os
-import uuid
 from uuid import UUID
 from datetime import datetime
 from typing import Optional
@@ -22,14 +20,12 @@ from passlib.context import CryptContext
 from app.database import get_db
 from app.models import User as UserModel
 from app.api.routes.auth import get_current_user, get_current_user_optional
+from app.services.user_cache import user_cache
+from app.services.photo_store import store_profile_photo, release_profile_photo, confirm_photo, profile_photo_name
 
 # — password hashing setup —
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-# — where we store profile photos —
-UPLOAD_ROOT = "uploads"
-PROFILE_DIR = os.path.join(UPLOAD_ROOT, "profile_photos")
-
 router = APIRouter(prefix="/users", tags=["users"])
 
 
@@ -60,7 +56,7 @@ class UserCreate(BaseModel):
 
 
 @router.post("/initial-admin-setup", response_model=UserOut, status_code=status.HTTP_201_CREATED, tags=["admin"])
-async def initial_admin_setup(
+def initial_admin_setup(
     user: UserCreate,
     db: Session = Depends(get_db),
 ):
@@ -93,7 +89,7 @@ async def initial_admin_setup(
 
 
 @router.post("/", response_model=UserOut, status_code=status.HTTP_201_CREATED)
-async def create_user(
+def create_user(
     user: UserCreate,
     db: Session = Depends(get_db),
     current_user: Optional[UserModel] = Depends(get_current_user_optional), # Allow unauthenticated for first user
@@ -128,7 +124,7 @@ async def create_user(
 
 
 @router.get("/me", response_model=UserOut)
-async def get_my_user(
+def get_my_user(
     current_user: UserModel = Depends(get_current_user),
 ):
     return current_user
@@ -156,24 +152,20 @@ async def update_my_user(
     if email is not None:
         user.email = email
 
+    old_photo = photo = None
     if profile_photo and profile_photo.filename:
-        os.makedirs(PROFILE_DIR, exist_ok=True)
-        if user.profile_photo:
-            try:
-                os.remove(os.path.join(PROFILE_DIR, user.profile_photo))
-            except OSError:
-                pass
-
-        ext = profile_photo.filename.rsplit(".", 1)[-1]
-        fn = f"{uuid.uuid4()}.{ext}"
-        out_path = os.path.join(PROFILE_DIR, fn)
-        contents = await profile_photo.read()
-        with open(out_path, "wb") as f:
-            f.write(contents)
-        user.profile_photo = fn
+        old_photo = user.profile_photo
+        photo = await store_profile_photo(profile_photo)
+        user.profile_photo = profile_photo_name(photo)
 
     db.commit()
+    if photo is not None:
+        confirm_photo(db, photo)
     db.refresh(user)
+    user_cache.invalidate(user.id)
+
+    if old_photo and old_photo != user.profile_photo:
+        release_profile_photo(db, old_photo)
     return user
 
 
@@ -182,7 +174,7 @@ async def update_my_user(
     status_code=status.HTTP_200_OK,
     summary="Change own password"
 )
-async def change_my_password(
+def change_my_password(
     data: PasswordChange,
     db: Session = Depends(get_db),
     current_user: UserModel = Depends(get_current_user),
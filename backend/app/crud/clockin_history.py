@@ -0,0 +1,87 @@
+# backend/app/crud/clockin_history.py
+
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import select, func, tuple_, Numeric
+from sqlalchemy.orm import Session
+
+from app.models import ClockinHistory, Clockin, User, Project
+
+
+def _history_select():
+    """
+    SELECT único con las columnas que necesita ClockinHistoryOut.
+    Las horas se calculan en SQL: (COALESCE(end_time, created_at) - start_time).
+    """
+    secs = func.extract(
+        "epoch",
+        func.coalesce(Clockin.end_time, ClockinHistory.created_at) - Clockin.start_time,
+    )
+    hours = func.round(func.cast(secs / 3600.0, Numeric), 2)
+
+    return (
+        select(
+            ClockinHistory.id,
+            ClockinHistory.clockin_id,
+            ClockinHistory.user_id,
+            User.username.label("user_name"),
+            ClockinHistory.project_id,
+            Project.name.label("project_name"),
+            ClockinHistory.state,
+            ClockinHistory.city,
+            ClockinHistory.street,
+            ClockinHistory.street_number,
+            ClockinHistory.postal_code,
+            Clockin.start_time,
+            Clockin.end_time,
+            hours.label("hours"),
+            Clockin.photo_path,
+            Clockin.thumbnail_path,
+            ClockinHistory.created_at,
+        )
+        .join(Clockin, ClockinHistory.clockin_id == Clockin.id)
+        .join(User, ClockinHistory.user_id == User.id)
+        .join(Project, ClockinHistory.project_id == Project.id)
+    )
+
+
+def _to_dict(row) -> Dict[str, Any]:
+    data = dict(row._mapping)
+    data["hours"] = float(data["hours"] or 0.0)
+    return data
+
+
+def list_history(
+    db: Session,
+    user_id: Optional[UUID] = None,
+    after: Optional[Tuple[datetime, UUID]] = None,
+    limit: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Historial ordenado por (created_at, id) DESC.
+    - user_id: filtra por usuario (None = todos).
+    - after: cursor (created_at, id) de la última fila de la página anterior.
+    - limit: tamaño de página (None = sin límite).
+    """
+    stmt = _history_select()
+    if user_id is not None:
+        stmt = stmt.where(ClockinHistory.user_id == user_id)
+    if after is not None:
+        stmt = stmt.where(
+            tuple_(ClockinHistory.created_at, ClockinHistory.id) < tuple_(*after)
+        )
+    stmt = stmt.order_by(ClockinHistory.created_at.desc(), ClockinHistory.id.desc())
+    if limit is not None:
+        stmt = stmt.limit(limit)
+
+    return [_to_dict(r) for r in db.execute(stmt)]
+
+
+def get_history_entry(db: Session, history_id: UUID) -> Optional[Dict[str, Any]]:
+    """
+    Una sola entrada de historial con el mismo formato que list_history.
+    """
+    row = db.execute(_history_select().where(ClockinHistory.id == history_id)).first()
+    return _to_dict(row) if row else None
@@ -1,19 +1,62 @@
 # backend/app/crud/clockins.py
 
-import os
-from uuid import UUID
-from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from uuid import UUID, uuid4
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
+from sqlalchemy import Select, and_, bindparam, insert, literal, null, select, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from sqlalchemy.sql import func, extract
 
-from app.models import Clockin as ClockinModel, Detection as DetectionModel
+from app.models import (
+    Clockin as ClockinModel,
+    ClockinDailyHours,
+    ClockinHistory,
+    Detection as DetectionModel,
+    Project,
+    ProjectHistory,
+)
 # Importamos la función que inserta en project_history
 from app.crud.project_history import create_history_entry
+from app.crud.hours_rollup import hours_entry, record_hours_change
 
-# Directorio donde se guardan las fotos de clockin/detección
-UPLOAD_DIR = "uploads/clockins"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+def _clockin_values(user_id, project_id=None, latitude=None, longitude=None, postal_code=None,
+                    photo_path=None, thumbnail_path=None, approved: Optional[bool] = False) -> Dict[str, Any]:
+    return dict(
+        id=uuid4(),
+        user_id=user_id,
+        project_id=project_id,
+        start_time=datetime.utcnow(),
+        status="in_progress",
+        location_lat=latitude,
+        location_long=longitude,
+        postal_code=postal_code,
+        photo_path=photo_path,
+        thumbnail_path=thumbnail_path,
+        # Con None el ORM aplicaría el default (False): NULL explícito = pendiente
+        approved=null() if approved is None else approved,
+    )
+
+
+def _insert_clockin(db: Session, values: Dict[str, Any], detections: List[Dict[str, Any]] = ()) -> ClockinModel:
+    """
+    INSERT … RETURNING del clockin y, en la misma transacción, un único
+    INSERT multi-fila de sus detecciones; un solo commit.
+
+    El clockin se saca de la sesión antes del commit: así conserva lo que
+    devolvió RETURNING y leerlo después no lanza otro SELECT (SessionLocal
+    expira los objetos al hacer commit).
+    """
+    clk = db.scalars(insert(ClockinModel).values(**values).returning(ClockinModel)).one()
+    if detections:
+        db.execute(insert(DetectionModel).values([
+            {"clockin_id": values["id"], "label": d.get("name"), "confidence": d.get("confidence")}
+            for d in detections
+        ]))
+    db.expunge(clk)
+    db.commit()
+    return clk
 
 
 def create_clockin(
@@ -23,59 +66,128 @@ def create_clockin(
     project_id: str = None,
     latitude: float = None,
     longitude: float = None,
-    postal_code: str = None
+    postal_code: str = None,
+    thumbnail_path: str = None,
+    approved: Optional[bool] = False,
 ) -> ClockinModel:
     """
-    Crea un clockin básico (para usuarios office).
+    Crea un clockin básico (para usuarios office). Con approved=None queda
+    pendiente de la detección EPP (ver apply_clockin_detections).
     """
-    # Generamos un nuevo UUID automático para el clockin
-    clk = ClockinModel(
-        # NOTA: no convertimos user_id a UUID(user_id) aquí
-        #      porque en nuestro modelo Clockin.id es un PG_UUID generado automáticamente
-        user_id=user_id,
-        project_id=project_id,
-        start_time=datetime.utcnow(),
-        status="in_progress",
-        location_lat=latitude,
-        location_long=longitude,
-        postal_code=postal_code,
-        photo_path=photo_path
-    )
-    db.add(clk)
-    db.commit()
-    db.refresh(clk)
-    return clk
+    return _insert_clockin(db, _clockin_values(
+        user_id, project_id, latitude, longitude, postal_code, photo_path, thumbnail_path, approved,
+    ))
 
 
 def start_clockin_detection(db: Session, payload: Dict[str, Any]) -> ClockinModel:
     """
     Crea un clockin con detecciones EPP (para usuarios field).
     """
-    clk = ClockinModel(
-        user_id=payload["user_id"],
-        project_id=payload.get("project_id"),
-        start_time=datetime.utcnow(),
-        status="in_progress",
-        location_lat=payload.get("latitude"),
-        location_long=payload.get("longitude"),
-        postal_code=payload.get("postal_code"),
-        photo_path=payload.get("photo_path"),
-        approved=payload.get("approved", False),
+    return _insert_clockin(db, _clockin_values(
+        payload["user_id"],
+        payload.get("project_id"),
+        payload.get("latitude"),
+        payload.get("longitude"),
+        payload.get("postal_code"),
+        payload.get("photo_path"),
+        payload.get("thumbnail_path"),
+        payload.get("approved", False),
+    ), payload.get("detection", []))
+
+
+def create_clockin_with_history(db: Session, address: Dict[str, str], **fields) -> Optional[Dict[str, Any]]:
+    """
+    Clockin de oficina con su clockin_history (la dirección de `address`:
+    state, city, street, street_number) y la foto del proyecto en
+    project_history, en UNA sentencia (INSERTs encadenados con CTEs) y una
+    transacción: o se guardan las tres filas o ninguna.
+
+    `fields` son los de create_clockin. Devuelve las columnas del clockin
+    más project_name, o None si el proyecto no existe.
+    """
+    C = ClockinModel.__table__
+    CH = ClockinHistory.__table__
+    PH = ProjectHistory.__table__
+    P = Project.__table__
+
+    new = insert(C).values(**_clockin_values(**fields)).returning(*C.c).cte("new_clockin")
+    history = insert(CH).from_select(
+        ["id", "clockin_id", "user_id", "project_id", "state", "city", "street", "street_number", "postal_code"],
+        select(
+            literal(uuid4()), new.c.id, new.c.user_id, new.c.project_id,
+            literal(address["state"]), literal(address["city"]), literal(address["street"]),
+            literal(address["street_number"]), new.c.postal_code,
+        ),
+    ).cte("new_clockin_history")
+    snapshot = insert(PH).from_select(
+        [
+            "id", "project_id", "user_id", "clockin_id", "date", "status", "start_date", "end_date",
+            "state", "city", "street", "street_number", "postal_code",
+        ],
+        select(
+            literal(uuid4()), P.c.id, new.c.user_id, new.c.id, func.now(), P.c.status, P.c.start_date,
+            P.c.end_date, *(func.coalesce(col, "") for col in (
+                P.c.state, P.c.city, P.c.street, P.c.street_number, P.c.postal_code,
+            )),
+        ).select_from(new.join(P, P.c.id == new.c.project_id)),
+    ).cte("new_project_history")
+
+    stmt = (
+        select(new, P.c.name.label("project_name"))
+        .select_from(new.join(P, P.c.id == new.c.project_id))
+        .add_cte(history, snapshot)
     )
-    db.add(clk)
-    db.commit()
-    db.refresh(clk)
-
-    # Crear registros de detección
-    for det in payload.get("detection", []):
-        db.add(DetectionModel(
-            clockin_id=clk.id,
-            label=det.get("name"),
-            confidence=det.get("confidence")
-        ))
+    try:
+        row = db.execute(stmt).mappings().first()
+    except IntegrityError:
+        # El proyecto no existe (FK de clockins/clockin_history)
+        db.rollback()
+        return None
     db.commit()
+    return dict(row) if row else None
 
-    return clk
+
+def apply_clockin_detections(db: Session, outcomes: Dict[UUID, Dict[str, Any]]) -> Set[UUID]:
+    """
+    Resultado de la detección diferida de varios clockins (id → {"approved",
+    "detection": [{name, confidence}, …]}, como en start_clockin_detection)
+    en una sola transacción: un UPDATE en bloque de approved y un INSERT en
+    bloque de las detecciones.
+
+    Solo se tocan los clockins que siguen pendientes (approved IS NULL); los
+    ya resueltos o borrados se ignoran, así repetir una detección no duplica
+    filas. Devuelve los ids actualizados.
+    """
+    if not outcomes:
+        return set()
+    pending = set(db.execute(
+        select(ClockinModel.id)
+        .where(ClockinModel.id.in_(list(outcomes)), ClockinModel.approved.is_(None))
+        .with_for_update()
+    ).scalars())
+    if not pending:
+        db.rollback()
+        return pending
+
+    table = ClockinModel.__table__
+    db.execute(
+        update(table)
+        .where(table.c.id == bindparam("clockin_id"))
+        .values(approved=bindparam("approved_value")),
+        [
+            {"clockin_id": cid, "approved_value": outcomes[cid]["approved"]}
+            for cid in pending
+        ],
+    )
+    rows = [
+        {"clockin_id": cid, "label": d.get("name"), "confidence": d.get("confidence")}
+        for cid in pending
+        for d in outcomes[cid]["detection"]
+    ]
+    if rows:
+        db.execute(insert(DetectionModel), rows)
+    db.commit()
+    return pending
 
 
 def get_clockins_for_user(db: Session, user_id: str) -> List[ClockinModel]:
@@ -92,86 +204,86 @@ def get_clockins_for_user(db: Session, user_id: str) -> List[ClockinModel]:
 
 def get_monthly_hours(db: Session, user_id: str) -> List[Dict[str, Any]]:
     """
-    Suma de horas por mes (para un usuario).
-    """
-    rows = (
-        db.query(
-            extract("month", ClockinModel.start_time).label("month"),
-            func.sum(
-                func.extract("epoch", ClockinModel.end_time - ClockinModel.start_time)
-                / 3600
-            ).label("hours"),
-        )
-        .filter(
-            ClockinModel.user_id == user_id,
-            ClockinModel.end_time.isnot(None),
-        )
-        .group_by("month")
-        .order_by("month")
-        .all()
-    )
+    Suma de horas por mes (para un usuario), desde el rollup diario.
+    """
+    month = extract("month", ClockinDailyHours.day)
+    rows = db.execute(
+        select(month.label("month"), func.sum(ClockinDailyHours.seconds / 3600).label("hours"))
+        .where(ClockinDailyHours.user_id == user_id)
+        .group_by(month)
+        .order_by(month)
+    ).all()
     return [{"month": int(m), "hours": float(h) if h else 0.0} for m, h in rows]
 
 
+# Ventanas del resumen de horas: nombre → (desde, hasta) en días UTC a partir
+# de "hoy"; None = sin límite. week/month/total son las de siempre (week = los
+# últimos 7 días contando hoy); el resto se piden aparte
+# (GET /summary/...?windows=today,last_month).
+def _month_start(today: date) -> date:
+    return today.replace(day=1)
+
+
+SUMMARY_WINDOWS: Dict[str, Callable[[date], Tuple[Optional[date], Optional[date]]]] = {
+    "total":      lambda today: (None, None),
+    "month":      lambda today: (_month_start(today), None),
+    "week":       lambda today: (today - timedelta(days=6), None),
+    "today":      lambda today: (today, None),
+    "last_month": lambda today: (_month_start(_month_start(today) - timedelta(days=1)), _month_start(today)),
+    "year":       lambda today: (today.replace(month=1, day=1), None),
+}
+DEFAULT_SUMMARY_WINDOWS = ("total", "month", "week")
+
+
+def summary_query(user_id: Optional[UUID] = None, windows: Sequence[str] = DEFAULT_SUMMARY_WINDOWS,
+                  today: Optional[date] = None) -> Select:
+    """
+    Segundos de clockins terminados por ventana (columna = nombre de la
+    ventana) en UNA pasada sobre el rollup diario (clockin_daily_hours):
+    SUM(seconds) FILTER (WHERE day en la ventana). Sin user_id, sobre todos
+    los usuarios. El coste depende de los días con actividad, no de los
+    clockins.
+    """
+    today = today or datetime.utcnow().date()
+    bounds = {name: SUMMARY_WINDOWS[name](today) for name in windows}
+    R = ClockinDailyHours
+
+    columns = []
+    for name, (since, until) in bounds.items():
+        conds = []
+        if since is not None:
+            conds.append(R.day >= since)
+        if until is not None:
+            conds.append(R.day < until)
+        total = func.sum(R.seconds).filter(and_(*conds)) if conds else func.sum(R.seconds)
+        columns.append(func.coalesce(total, 0).label(name))
+
+    q = select(*columns).select_from(R)
+    if user_id is not None:
+        q = q.where(R.user_id == user_id)
+    # Sin ventana "total" basta leer desde el inicio de la más antigua
+    if all(since is not None for since, _ in bounds.values()):
+        q = q.where(R.day >= min(since for since, _ in bounds.values()))
+    return q
+
+
+def summary_hours(row, digits: int = 2) -> Dict[str, float]:
+    """Fila de summary_query → {ventana: horas redondeadas}."""
+    return {name: round(float(secs) / 3600, digits) for name, secs in row._mapping.items()}
+
+
 def get_summary_data(db: Session, user_id: str) -> Dict[str, float]:
     """
     Horas totales, mensuales y semanales de UN usuario.
     """
-    now = datetime.utcnow()
-    week_start = now - timedelta(days=7)
-    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-
-    def hours_since(start: datetime) -> float:
-        result = db.query(
-            func.coalesce(
-                func.sum(
-                    func.extract("epoch", ClockinModel.end_time - ClockinModel.start_time)
-                    / 3600
-                ),
-                0.0,
-            )
-        ).filter(
-            ClockinModel.user_id == user_id,
-            ClockinModel.end_time.isnot(None),
-            ClockinModel.start_time >= start,
-        ).scalar()
-        return float(result) if result else 0.0
-
-    return {
-        "week": round(hours_since(week_start), 2),
-        "month": round(hours_since(month_start), 2),
-        "total": round(hours_since(datetime(1970, 1, 1)), 2),
-    }
+    return summary_hours(db.execute(summary_query(user_id)).one())
 
 
 def get_summary_data_all(db: Session) -> Dict[str, float]:
     """
     Horas totales, mensuales y semanales AGREGADAS sobre TODOS los usuarios.
     """
-    now = datetime.utcnow()
-    week_start = now - timedelta(days=7)
-    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-
-    def hours_since(start: datetime) -> float:
-        result = db.query(
-            func.coalesce(
-                func.sum(
-                    func.extract("epoch", ClockinModel.end_time - ClockinModel.start_time)
-                    / 3600
-                ),
-                0.0,
-            )
-        ).filter(
-            ClockinModel.end_time.isnot(None),
-            ClockinModel.start_time >= start,
-        ).scalar()
-        return float(result) if result else 0.0
-
-    return {
-        "week": round(hours_since(week_start), 2),
-        "month": round(hours_since(month_start), 2),
-        "total": round(hours_since(datetime(1970, 1, 1)), 2),
-    }
+    return summary_hours(db.execute(summary_query()).one())
 
 
 def end_clockin(db: Session, clockin_id: UUID) -> ClockinModel:
@@ -179,15 +291,20 @@ def end_clockin(db: Session, clockin_id: UUID) -> ClockinModel:
     Marca el clockin como completado, pone end_time y, de haber project_id,
     inserta la fila en project_history a través de create_history_entry(...).
     """
-    # 1) Buscamos el clock-in por su ID
-    clk = db.query(ClockinModel).get(clockin_id)
+    # 1) Buscamos el clock-in por su ID (bloqueado: el rollup parte de este estado)
+    clk = db.get(ClockinModel, clockin_id, with_for_update=True)
     if not clk:
         return None
 
     # 2) Solo si estaba en progreso, lo convertimos a 'completed'
     if clk.status == "in_progress":
+        before = hours_entry(clk)
         clk.end_time = func.now()
         clk.status = "completed"
+        db.flush()
+        db.refresh(clk, ["end_time"])
+        # El rollup de horas va en la misma transacción que el cierre
+        record_hours_change(db, before, hours_entry(clk))
         db.commit()
         db.refresh(clk)
 
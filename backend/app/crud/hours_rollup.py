@@ -0,0 +1,103 @@
+# backend/app/crud/hours_rollup.py
+
+from collections import defaultdict
+from datetime import date, datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.models import NO_PROJECT, Clockin as ClockinModel, ClockinDailyHours
+
+# Aportación de un clockin terminado al rollup: (user_id, project_id, día, segundos)
+HoursEntry = Tuple[UUID, Optional[UUID], date, float]
+
+
+def utc_day(dt: datetime) -> date:
+    """Día UTC de un instante (los naive se toman como UTC, igual que en la BD)."""
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc)
+    return dt.date()
+
+
+def hours_entry(clk: ClockinModel) -> Optional[HoursEntry]:
+    """
+    Lo que suma `clk` al rollup en su estado actual (None si no ha terminado).
+    Se toma ANTES y DESPUÉS de cambiarlo para pasárselo a record_hours_change.
+    """
+    if clk is None or clk.end_time is None or clk.start_time is None:
+        return None
+    secs = (clk.end_time - clk.start_time).total_seconds()
+    return clk.user_id, clk.project_id, utc_day(clk.start_time), secs
+
+
+def record_hours_change(db: Session, before: Optional[HoursEntry], after: Optional[HoursEntry]) -> None:
+    """
+    Aplica al rollup el cambio de un clockin (before → after; None = no
+    contaba / ya no cuenta) con un único UPSERT, dentro de la transacción en
+    curso: quien llama hace el commit junto con el cambio del clockin, así
+    el rollup y clockins no se desincronizan. Los días que se quedan sin
+    clockins se borran.
+    """
+    deltas: Dict[Tuple[UUID, Optional[UUID], date], List[float]] = defaultdict(lambda: [0.0, 0])
+    for entry, sign in ((before, -1), (after, 1)):
+        if entry is None:
+            continue
+        user_id, project_id, day, secs = entry
+        delta = deltas[(user_id, project_id, day)]
+        delta[0] += sign * secs
+        delta[1] += sign
+    rows = [
+        {"user_id": u, "project_id": p, "day": d, "seconds": secs, "clockins": n}
+        for (u, p, d), (secs, n) in deltas.items()
+        if secs or n
+    ]
+    if not rows:
+        return
+
+    table = ClockinDailyHours.__table__
+    stmt = insert(table).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[
+            table.c.user_id,
+            func.coalesce(table.c.project_id, text(f"'{NO_PROJECT}'::uuid")),
+            table.c.day,
+        ],
+        set_={
+            "seconds": table.c.seconds + stmt.excluded.seconds,
+            "clockins": table.c.clockins + stmt.excluded.clockins,
+        },
+    ).returning(table.c.id, table.c.clockins)
+    empty = [row.id for row in db.execute(stmt) if row.clockins <= 0]
+    if empty:
+        db.execute(delete(table).where(table.c.id.in_(empty)))
+
+
+def rebuild_hours_rollup(db: Session) -> int:
+    """
+    Recalcula el rollup entero desde clockins (p. ej. tras cargar clockins
+    por SQL a mano). Devuelve las filas generadas.
+    """
+    C = ClockinModel.__table__
+    table = ClockinDailyHours.__table__
+    day = func.date(func.timezone("UTC", C.c.start_time))
+    db.execute(delete(table))
+    result = db.execute(
+        insert(table).from_select(
+            ["id", "user_id", "project_id", "day", "seconds", "clockins"],
+            select(
+                func.gen_random_uuid(),
+                C.c.user_id,
+                C.c.project_id,
+                day,
+                func.sum(func.extract("epoch", C.c.end_time - C.c.start_time)),
+                func.count(),
+            )
+            .where(C.c.end_time.isnot(None))
+            .group_by(C.c.user_id, C.c.project_id, day),
+        )
+    )
+    db.commit()
+    return result.rowcount
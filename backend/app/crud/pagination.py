@@ -0,0 +1,29 @@
+# backend/app/crud/pagination.py
+
+import base64
+from datetime import datetime
+from typing import Optional, Tuple
+from uuid import UUID
+
+
+def encode_cursor(created_at: datetime, row_id: UUID) -> str:
+    """
+    Codifica la posición (timestamp, id) de la última fila de una página
+    como un token opaco para la paginación por keyset.
+    """
+    raw = f"{created_at.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, UUID]]:
+    """
+    Inverso de encode_cursor. Lanza ValueError si el token no es válido.
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        ts, row_id = base64.urlsafe_b64decode(padded.encode()).decode().split("|", 1)
+        return datetime.fromisoformat(ts), UUID(row_id)
+    except Exception as exc:
+        raise ValueError("Invalid cursor") from exc
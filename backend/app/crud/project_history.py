@@ -1,5 +1,10 @@
 # backend/app/crud/project_history.py
 
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import select, case, tuple_, Numeric
 from sqlalchemy.orm import Session
 from sqlalchemy.sql import func
 from app import models
@@ -19,3 +24,125 @@ def create_history_entry(db: Session, user_id: str, project_id: str, clockin_id:
 
 def get_history_for_project(db: Session, project_id: str):
     return db.query(models.ProjectHistory).filter(models.ProjectHistory.project_id == project_id).all()
+
+
+def _hours(secs):
+    return func.round(func.cast(secs / 3600.0, Numeric), 2)
+
+
+def list_project_history(
+    db: Session,
+    user_id: Optional[UUID] = None,
+    project_id: Optional[UUID] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    after: Optional[Tuple[datetime, UUID]] = None,
+    limit: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Filas de project_history con el total del proyecto, en UNA sola consulta.
+
+    La paginación es por proyecto: cada página trae `limit` proyectos
+    ordenados por su entrada más reciente (last_date, project_id) DESC, y
+    para cada uno todas sus filas individuales. `after` es el
+    (last_date, project_id) del último proyecto de la página anterior.
+
+    Cada fila devuelta lleva `total_hours` (suma de clockins terminados del
+    proyecto, con los mismos filtros de usuario/fechas) y `hours` (horas del
+    clockin de esa fila).
+    """
+    PH = models.ProjectHistory
+    Clockin = models.Clockin
+
+    filters = []
+    if user_id is not None:
+        filters.append(PH.user_id == user_id)
+    if project_id is not None:
+        filters.append(PH.project_id == project_id)
+    if date_from is not None:
+        filters.append(PH.date >= date_from)
+    if date_to is not None:
+        filters.append(PH.date <= date_to)
+
+    # 1) Proyectos de la página, ordenados por su entrada más reciente
+    last_date = func.max(PH.date)
+    page_q = (
+        select(PH.project_id.label("project_id"), last_date.label("last_date"))
+        .where(*filters)
+        .group_by(PH.project_id)
+    )
+    if after is not None:
+        page_q = page_q.having(tuple_(last_date, PH.project_id) < tuple_(*after))
+    page_q = page_q.order_by(last_date.desc(), PH.project_id.desc())
+    if limit is not None:
+        page_q = page_q.limit(limit)
+    page = page_q.cte("page")
+
+    # 2) Totales por proyecto sobre los clockins terminados
+    totals_q = (
+        select(
+            Clockin.project_id.label("project_id"),
+            func.sum(func.extract("epoch", Clockin.end_time - Clockin.start_time)).label("secs"),
+        )
+        .where(
+            Clockin.project_id.in_(select(page.c.project_id)),
+            Clockin.end_time.isnot(None),
+        )
+        .group_by(Clockin.project_id)
+    )
+    if user_id is not None:
+        totals_q = totals_q.where(Clockin.user_id == user_id)
+    if date_from is not None:
+        totals_q = totals_q.where(Clockin.start_time >= date_from)
+    if date_to is not None:
+        totals_q = totals_q.where(Clockin.start_time <= date_to)
+    totals = totals_q.cte("totals")
+
+    # 3) Filas individuales + total, en el orden final
+    ind_secs = case(
+        (Clockin.end_time.isnot(None),
+         func.extract("epoch", Clockin.end_time - Clockin.start_time)),
+        else_=0.0,
+    )
+    stmt = (
+        select(
+            page.c.last_date,
+            PH.id,
+            PH.clockin_id,
+            PH.user_id,
+            func.coalesce(models.User.username, "").label("user_name"),
+            models.Project.id.label("project_id"),
+            models.Project.name.label("project_name"),
+            models.Project.status,
+            models.Project.state,
+            models.Project.city,
+            models.Project.street,
+            models.Project.street_number,
+            models.Project.postal_code,
+            models.Project.start_date,
+            models.Project.end_date,
+            _hours(func.coalesce(totals.c.secs, 0.0)).label("total_hours"),
+            _hours(ind_secs).label("hours"),
+        )
+        .select_from(page)
+        .join(PH, PH.project_id == page.c.project_id)
+        .join(models.Project, models.Project.id == page.c.project_id)
+        .outerjoin(models.User, models.User.id == PH.user_id)
+        .outerjoin(Clockin, Clockin.id == PH.clockin_id)
+        .outerjoin(totals, totals.c.project_id == page.c.project_id)
+        .where(*filters)
+        .order_by(
+            page.c.last_date.desc(),
+            page.c.project_id.desc(),
+            PH.date.desc(),
+            PH.id.desc(),
+        )
+    )
+
+    rows = []
+    for r in db.execute(stmt):
+        data = dict(r._mapping)
+        data["total_hours"] = float(data["total_hours"] or 0.0)
+        data["hours"] = float(data["hours"] or 0.0)
+        rows.append(data)
+    return rows
@@ -1,21 +1,105 @@
 # app/database.py
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
-from typing import Generator
+from typing import Generator, AsyncGenerator, Dict, Any
 import os
 
 # Usar URL directa o variable de entorno
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://postgres:mysecretpassword@db:5432/clockin_app")
+# Misma BD vía asyncpg para las rutas async (se deriva de DATABASE_URL si no se define)
+ASYNC_DATABASE_URL = os.getenv(
+    "ASYNC_DATABASE_URL",
+    DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1),
+)
 
-engine = create_engine(DATABASE_URL)
+# ---------------------------------------
+# Pool de conexiones (configurable por entorno)
+# ---------------------------------------
+# Cada worker de uvicorn tiene dos pools, el síncrono (psycopg2) y el async
+# (asyncpg), así que el máximo de conexiones abiertas contra Postgres es
+#   workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW + DB_ASYNC_POOL_SIZE + DB_ASYNC_MAX_OVERFLOW)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_ASYNC_POOL_SIZE = int(os.getenv("DB_ASYNC_POOL_SIZE", "5"))
+DB_ASYNC_MAX_OVERFLOW = int(os.getenv("DB_ASYNC_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))          # segundos esperando una conexión libre
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))        # segundos; -1 = no reciclar
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))  # 0 = sin límite
+
+connect_args: Dict[str, Any] = {}
+if DB_STATEMENT_TIMEOUT_MS > 0 and DATABASE_URL.startswith("postgresql"):
+    connect_args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+
+engine = create_engine(
+    DATABASE_URL,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    connect_args=connect_args,
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Motor async (asyncpg), con su propio tamaño de pool.
+# expire_on_commit=False: tras un commit los atributos siguen cargados y no
+# hace falta volver a la BD (un lazy-load en async lanzaría MissingGreenlet).
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_size=DB_ASYNC_POOL_SIZE,
+    max_overflow=DB_ASYNC_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    connect_args=(
+        {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+        if DB_STATEMENT_TIMEOUT_MS > 0 else {}
+    ),
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 # Dependency to get DB session
+# Es la ÚNICA dependencia de sesión síncrona: FastAPI la cachea por petición, así que
+# get_current_user y la ruta comparten la misma sesión (y la misma conexión).
+# Las rutas async usan get_current_user_async, que comparte get_async_db: una
+# petición nunca toma conexión de los dos pools.
 def get_db() -> Generator[Session, None, None]:
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+# Dependency to get an async DB session (rutas `async def`)
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def get_pool_status() -> Dict[str, Any]:
+    """
+    Métricas del pool del proceso actual (para /api/health/db).
+    """
+    def _stats(pool) -> Dict[str, Any]:
+        return {
+            "checked_out": pool.checkedout(),
+            "checked_in":  pool.checkedin(),
+            "overflow":    pool.overflow(),
+            "status":      pool.status(),
+        }
+
+    return {
+        "pool_size":    DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        **_stats(engine.pool),
+        "async": {
+            "pool_size":    DB_ASYNC_POOL_SIZE,
+            "max_overflow": DB_ASYNC_MAX_OVERFLOW,
+            **_stats(async_engine.pool),
+        },
+    }
@@ -1,6 +1,7 @@
 # backend/app/main.py
 
 from fastapi import FastAPI
+from fastapi.responses import RedirectResponse
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.trustedhost import TrustedHostMiddleware
 
@@ -8,7 +9,6 @@ import os
 from dotenv import load_dotenv
 
 load_dotenv()
-from fastapi.staticfiles import StaticFiles
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 
@@ -16,8 +16,13 @@ from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 import logging
 
-from app.database import engine, SessionLocal
+from app.database import engine, async_engine, SessionLocal, get_pool_status
 from app import models
+from app.services.photo_store import ImmutableStaticFiles
+from app.services.storage import get_storage, LocalStorage, STORAGE_SIGNING_KEY
+from app.services.detection_queue import pending_detections, DETECTION_QUEUE_MAX
+from app.services.detection import requeue_pending_detections
+from app.services.location_partitions import maintain_location_partitions
 
 # Routers
 from app.api.routes import router as api_router
@@ -28,6 +33,7 @@ from app.api.routes.summary import router as summary_router
 from app.api.routes.projects import router as projects_router
 from app.api.routes.detection.routes import router as detection_router
 from app.api.routes.users import router as users_router
+from app.api.routes.storage import router as storage_router
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -79,7 +85,19 @@ app.add_middleware(TrustedHostMiddleware, allowed_hosts=["*"])
 # Inicializar BD y servir estáticos
 # ———————————————————————
 models.Base.metadata.create_all(bind=engine)
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+
+# /uploads/<key>: con el storage local se sirve desde disco; con S3/MinIO se
+# redirige al objeto (las URLs guardadas en BD son las mismas en ambos casos)
+storage = get_storage()
+if isinstance(storage, LocalStorage):
+    if not STORAGE_SIGNING_KEY:
+        raise RuntimeError("STORAGE_SIGNING_KEY es obligatoria con STORAGE_BACKEND=local")
+    os.makedirs(storage.root, exist_ok=True)
+    app.mount("/uploads", ImmutableStaticFiles(directory=storage.root), name="uploads")
+else:
+    @app.get("/uploads/{key:path}", include_in_schema=False)
+    def uploads_redirect(key: str):
+        return RedirectResponse(storage.public_url(key))
 
 # ———————————————————————
 # Routers
@@ -88,6 +106,16 @@ app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 async def health_check():
     return {"status": "ok"}
 
+@app.get("/api/health/db")
+def db_pool_health():
+    # Estado del pool de conexiones de ESTE worker
+    return get_pool_status()
+
+@app.get("/api/health/detection")
+def detection_queue_health():
+    # Detecciones encoladas o en curso frente al límite de admisión
+    return {"pending": pending_detections(), "max": DETECTION_QUEUE_MAX}
+
 app.include_router(api_router, prefix="/api")
 app.include_router(clockins_router)
 app.include_router(history_router)
@@ -95,6 +123,7 @@ app.include_router(project_history_router)
 app.include_router(summary_router)
 app.include_router(projects_router)
 app.include_router(detection_router)
+app.include_router(storage_router)
 
 
 # ———————————————————————
@@ -133,10 +162,27 @@ async def startup_event():
         id="promote_projects_job",
         replace_existing=True,
     )
+    # Aprobación diferida: clockins cuya detección no llegó a encolarse o se perdió
+    scheduler.add_job(
+        requeue_pending_detections,
+        trigger=CronTrigger(minute="*"),
+        id="requeue_detections_job",
+        replace_existing=True,
+    )
+    # Particiones mensuales de user_locations (las próximas) y retención;
+    # también nada más arrancar, para una BD recién creada
+    scheduler.add_job(
+        maintain_location_partitions,
+        trigger=CronTrigger(hour="0", minute="15"),
+        id="location_partitions_job",
+        replace_existing=True,
+        next_run_time=datetime.now(),
+    )
     scheduler.start()
     logger.info("Scheduler iniciado")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     scheduler.shutdown(wait=False)
-    logger.info("Scheduler detenido")
\ No newline at end of file
+    logger.info("Scheduler detenido")
+    await async_engine.dispose()
\ No newline at end of file
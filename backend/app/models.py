@@ -9,6 +9,10 @@ from sqlalchemy import (
     ForeignKey,
     Enum,
     Text,
+    Date,
+    Integer,
+    Index,
+    text,
 )
 from sqlalchemy.dialects.postgresql import UUID as PG_UUID
 from sqlalchemy.sql import func
@@ -55,7 +59,7 @@ class Project(Base):
 class Clockin(Base):
     __tablename__ = "clockins"
     id            = Column(PG_UUID(as_uuid=True), primary_key=True, index=True, default=uuid.uuid4)
-    user_id       = Column(PG_UUID(as_uuid=True), ForeignKey("users.id"), nullable=False, index=True)
+    user_id       = Column(PG_UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
     project_id    = Column(PG_UUID(as_uuid=True), ForeignKey("projects.id"), nullable=True)
     start_time    = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
     end_time      = Column(DateTime(timezone=True), nullable=True)
@@ -64,10 +68,25 @@ class Clockin(Base):
     location_long = Column(Float, nullable=True)
     postal_code   = Column(String, nullable=True)
     photo_path    = Column(String, nullable=True)
-    approved      = Column(Boolean, default=False, nullable=False)
+    thumbnail_path = Column(String, nullable=True)
+    approved      = Column(Boolean, default=False, nullable=True)   # None = detección EPP pendiente
     created_at    = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
     detections    = relationship("Detection", back_populates="clockin")
 
+    __table_args__ = (
+        # Clockins de un usuario, más recientes primero (también sirve para user_id =)
+        Index("ix_clockins_user_start", user_id, start_time.desc()),
+        # Último clockin terminado de un proyecto y totales por proyecto
+        Index(
+            "ix_clockins_project_end_done", project_id, end_time.desc(),
+            postgresql_where=end_time.isnot(None),
+        ),
+        # ¿Otro clockin usa aún esta foto? (release_clockin_photo)
+        Index("ix_clockins_photo_path", photo_path),
+        # Detecciones pendientes para requeue_pending_detections
+        Index("ix_clockins_pending_created", created_at, postgresql_where=approved.is_(None)),
+    )
+
 class Detection(Base):
     __tablename__ = "detections"
     id         = Column(PG_UUID(as_uuid=True), primary_key=True, index=True, default=uuid.uuid4)
@@ -76,6 +95,8 @@ class Detection(Base):
     confidence = Column(Float, nullable=False)
     clockin    = relationship("Clockin", back_populates="detections")
 
+    __table_args__ = (Index("ix_detections_clockin_id", clockin_id),)
+
 class ClockinHistory(Base):
     __tablename__ = "clockin_history"
     id            = Column(PG_UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
@@ -92,6 +113,43 @@ class ClockinHistory(Base):
     project = relationship("Project", lazy="joined")
     clockin = relationship("Clockin", lazy="joined")
 
+    __table_args__ = (
+        # Historial por (created_at, id) DESC, de todos o de un usuario
+        Index("ix_clockin_history_created", created_at.desc(), id.desc()),
+        Index("ix_clockin_history_user_created", user_id, created_at.desc(), id.desc()),
+        Index("idx_clockin_history_project_id", project_id),
+        Index("idx_clockin_history_clockin_id", clockin_id),
+    )
+
+# Clave del rollup para los clockins sin proyecto (el índice único no puede
+# usar project_id tal cual: en Postgres 13 los NULL no chocan entre sí)
+NO_PROJECT = uuid.UUID(int=0)
+
+
+class ClockinDailyHours(Base):
+    """
+    Horas de los clockins terminados agregadas por (usuario, proyecto, día
+    UTC de start_time). Se mantiene al terminar, modificar o borrar un
+    clockin (crud.hours_rollup) y de aquí leen los resúmenes de horas.
+    """
+    __tablename__ = "clockin_daily_hours"
+    id         = Column(PG_UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id    = Column(PG_UUID(as_uuid=True), ForeignKey("users.id",    ondelete="CASCADE"), nullable=False)
+    project_id = Column(PG_UUID(as_uuid=True), ForeignKey("projects.id", ondelete="CASCADE"), nullable=True)
+    day        = Column(Date, nullable=False)
+    seconds    = Column(Float, nullable=False, default=0.0)
+    clockins   = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index(
+            "ux_clockin_daily_hours_key",
+            user_id, func.coalesce(project_id, text(f"'{NO_PROJECT}'::uuid")), day,
+            unique=True,
+        ),
+        Index("ix_clockin_daily_hours_project_day", project_id, day),
+    )
+
+
 class ProjectHistory(Base):
     __tablename__ = "project_history"
     id            = Column(PG_UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
@@ -114,15 +172,34 @@ class ProjectHistory(Base):
     user    = relationship("User",    lazy="joined")
     clockin = relationship("Clockin", lazy="joined")
 
+    __table_args__ = (
+        Index("ix_project_history_project_date", project_id, date.desc()),
+        Index("ix_project_history_user_date", user_id, date.desc()),
+        Index("ix_project_history_clockin_id", clockin_id),
+    )
+
 
 class UserLocation(Base):
+    """
+    Migas de GPS (una cada pocos minutos por trabajador activo). Tabla
+    particionada por mes de `timestamp` (la PK tiene que incluirlo); las
+    particiones las crea y retira services.location_partitions.
+    """
     __tablename__ = "user_locations"
     id         = Column(PG_UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id    = Column(PG_UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
     clockin_id = Column(PG_UUID(as_uuid=True), ForeignKey("clockins.id"), nullable=True)
     latitude   = Column(Float, nullable=False)
     longitude  = Column(Float, nullable=False)
-    timestamp  = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    timestamp  = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, primary_key=True)
 
     user    = relationship("User")
     clockin = relationship("Clockin")
+
+    __table_args__ = (
+        Index("ix_user_locations_timestamp", timestamp.desc()),
+        Index("ix_user_locations_clockin_timestamp", clockin_id, timestamp),
+        # GET /api/locations/latest: última ubicación de cada usuario
+        Index("ix_user_locations_user_timestamp", user_id, timestamp.desc()),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
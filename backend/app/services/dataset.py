@@ -0,0 +1,204 @@
+# app/services/dataset.py
+
+import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from app.services.inference import EPP_DATA_YAML, EPP_IMG_SIZE, decode_image, letterbox
+
+# Carga del dataset de Roboflow (app/data/<split>/images + labels en formato
+# YOLO: "cls cx cy w h" normalizados) para evaluación y reentrenamiento.
+# Las imágenes ya letterboxed (uint8, S x S x 3) se guardan en un .npy que se
+# abre con memmap: la segunda pasada no decodifica ningún JPEG. Cada fila se
+# valida con el mtime y el tamaño del fichero; solo se recalculan las que
+# cambiaron (en paralelo, con un pool de procesos).
+EPP_DATASET_CACHE = os.getenv("EPP_DATASET_CACHE", os.path.join(os.path.dirname(EPP_DATA_YAML), ".cache"))
+# Procesos para decodificar (0 = uno por núcleo)
+EPP_DATASET_WORKERS = int(os.getenv("EPP_DATASET_WORKERS", "0"))
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+@dataclass
+class Sample:
+    image_path: str
+    boxes: np.ndarray     # N x 4, xyxy en píxeles de la imagen original
+    classes: np.ndarray   # N
+
+
+@dataclass
+class Batch:
+    samples: List[Sample]
+    x: np.ndarray                                  # B x 3 x S x S float32 en [0, 1]
+    metas: List[Tuple[float, Tuple[int, int], Tuple[int, int]]]   # (escala, pad, (alto, ancho))
+
+
+def split_dir(split: str, data_yaml: str = EPP_DATA_YAML) -> str:
+    return os.path.join(os.path.dirname(data_yaml), split)
+
+
+def image_paths(split: str, data_yaml: str = EPP_DATA_YAML, limit: Optional[int] = None) -> List[str]:
+    paths = glob.glob(os.path.join(split_dir(split, data_yaml), "images", "*"))
+    return sorted(p for p in paths if p.lower().endswith(IMAGE_EXTENSIONS))[:limit]
+
+
+def _image_size(path: str) -> Tuple[int, int]:
+    """(ancho, alto) tal como lo ve el detector (con la orientación EXIF)."""
+    with Image.open(path) as img:
+        w, h = img.size
+        if img.getexif().get(0x0112) in (5, 6, 7, 8):   # rotada 90º/270º
+            w, h = h, w
+    return w, h
+
+
+def read_sample(path: str, size: Optional[Tuple[int, int]] = None) -> Sample:
+    """Cajas reales de una imagen (sin .txt = sin objetos); size=(ancho, alto) si ya se conoce."""
+    label_path = os.path.join(
+        os.path.dirname(os.path.dirname(path)), "labels", os.path.splitext(os.path.basename(path))[0] + ".txt",
+    )
+    rows = np.zeros((0, 5))
+    if os.path.exists(label_path) and os.path.getsize(label_path):
+        rows = np.loadtxt(label_path, ndmin=2)[:, :5]
+    w, h = size or _image_size(path)
+    cx, cy, bw, bh = rows[:, 1] * w, rows[:, 2] * h, rows[:, 3] * w, rows[:, 4] * h
+    boxes = np.stack([cx - bw / 2, cy - bh / 2, cx + bw / 2, cy + bh / 2], axis=1)
+    return Sample(image_path=path, boxes=boxes, classes=rows[:, 0].astype(int))
+
+
+def load_split(split: str, data_yaml: str = EPP_DATA_YAML, limit: Optional[int] = None) -> List[Sample]:
+    """Imágenes de un split con sus cajas reales, sin decodificar nada."""
+    return [read_sample(p) for p in image_paths(split, data_yaml, limit)]
+
+
+def _prepare(args: Tuple[str, int]) -> Tuple[np.ndarray, float, Tuple[int, int], Tuple[int, int]]:
+    """En un proceso del pool: fichero → (letterbox uint8, escala, pad, (alto, ancho))."""
+    path, img_size = args
+    with open(path, "rb") as f:
+        img = decode_image(f.read())
+    boxed, scale, pad = letterbox(img, img_size)
+    return boxed, scale, pad, img.shape[:2]
+
+
+def _stamp(path: str) -> List[int]:
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+class DatasetCache:
+    """
+    Un split del dataset preprocesado para el detector, cacheado en disco:
+
+        <EPP_DATASET_CACHE>/<split>_<img_size>.npy   N x S x S x 3 uint8 (memmap)
+        <EPP_DATASET_CACHE>/<split>_<img_size>.json  por fila: ruta, mtime, tamaño, escala, pad, forma
+
+    build() reutiliza las filas cuyo fichero no cambió y decodifica el resto
+    en paralelo; batches() las sirve por lotes ya listos para detect_prepared.
+    """
+
+    def __init__(
+        self,
+        split: str,
+        img_size: int = EPP_IMG_SIZE,
+        data_yaml: str = EPP_DATA_YAML,
+        cache_dir: str = EPP_DATASET_CACHE,
+        workers: int = EPP_DATASET_WORKERS,
+        limit: Optional[int] = None,
+    ):
+        self.split, self.img_size = split, img_size
+        self.paths = image_paths(split, data_yaml, limit)
+        self.workers = workers or os.cpu_count() or 1
+        stem = os.path.join(cache_dir, f"{split}_{img_size}" + (f"_n{limit}" if limit else ""))
+        self.array_path, self.index_path = stem + ".npy", stem + ".json"
+        self.images: Optional[np.ndarray] = None
+        self.entries: List[Dict[str, Any]] = []
+
+    def _load_index(self) -> Dict[str, Tuple[int, Dict[str, Any]]]:
+        """Filas del caché anterior por ruta (vacío si no hay o no cuadra con el .npy)."""
+        try:
+            with open(self.index_path) as f:
+                entries = json.load(f)["entries"]
+            images = np.load(self.array_path, mmap_mode="r")
+        except (OSError, ValueError, KeyError):
+            return {}
+        if images.shape != (len(entries), self.img_size, self.img_size, 3):
+            return {}
+        self.images = images
+        return {e["path"]: (row, e) for row, e in enumerate(entries)}
+
+    def build(self) -> "DatasetCache":
+        old = self._load_index()
+        stamps = [_stamp(p) for p in self.paths]
+        keys = [os.path.abspath(p) for p in self.paths]
+        reused = {
+            i: old[k] for i, k in enumerate(keys) if k in old and old[k][1]["stamp"] == stamps[i]
+        }
+        if len(reused) == len(old) == len(self.paths) and all(row == i for i, (row, _) in reused.items()):
+            self.entries = [e for _, e in (reused[i] for i in range(len(self.paths)))]
+            return self
+
+        os.makedirs(os.path.dirname(self.array_path), exist_ok=True)
+        tmp_path = self.array_path + ".tmp.npy"
+        out = np.lib.format.open_memmap(
+            tmp_path, mode="w+", dtype=np.uint8, shape=(len(self.paths), self.img_size, self.img_size, 3),
+        )
+        entries: List[Optional[Dict[str, Any]]] = [None] * len(self.paths)
+        for i, (row, entry) in reused.items():
+            out[i] = self.images[row]
+            entries[i] = entry
+
+        todo = [i for i in range(len(self.paths)) if entries[i] is None]
+        jobs = [(self.paths[i], self.img_size) for i in todo]
+        if self.workers > 1 and len(jobs) > 1:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                prepared = pool.map(_prepare, jobs, chunksize=8)
+                self._fill(out, entries, todo, prepared, keys, stamps)
+        else:
+            self._fill(out, entries, todo, map(_prepare, jobs), keys, stamps)
+
+        out.flush()
+        del out
+        os.replace(tmp_path, self.array_path)
+        with open(self.index_path, "w") as f:
+            json.dump({"img_size": self.img_size, "entries": entries}, f)
+        self.images = np.load(self.array_path, mmap_mode="r")
+        self.entries = entries
+        return self
+
+    @staticmethod
+    def _fill(out, entries, todo, prepared, keys, stamps) -> None:
+        for i, (boxed, scale, pad, shape) in zip(todo, prepared):
+            out[i] = boxed
+            entries[i] = {
+                "path": keys[i], "stamp": stamps[i], "scale": scale, "pad": list(pad), "shape": list(shape),
+            }
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def samples(self) -> List[Sample]:
+        """Cajas reales de cada fila (con el tamaño guardado: no abre las imágenes)."""
+        if not self.entries:
+            self.build()
+        return [read_sample(p, (e["shape"][1], e["shape"][0])) for p, e in zip(self.paths, self.entries)]
+
+    def batches(self, batch_size: int = 8) -> Iterator[Batch]:
+        """Lotes consecutivos: las filas se leen del memmap al pedir cada lote."""
+        if not self.entries:
+            self.build()
+        samples = self.samples()
+        for i in range(0, len(self.paths), batch_size):
+            rows = np.asarray(self.images[i:i + batch_size])
+            yield Batch(
+                samples=samples[i:i + batch_size],
+                x=np.ascontiguousarray(rows.transpose(0, 3, 1, 2), dtype=np.float32) / 255.0,
+                metas=[
+                    (e["scale"], tuple(e["pad"]), tuple(e["shape"]))
+                    for e in self.entries[i:i + batch_size]
+                ],
+            )
@@ -1,53 +1,146 @@
 # app/services/detection.py
 
-import os
-from uuid import uuid4
+import logging
+from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
+from uuid import uuid4
 
 from celery.result import AsyncResult
 
+from app.database import SessionLocal
+from app.models import Clockin
+from app.crud.clockins import apply_clockin_detections
 from app.worker import celery_app, run_detection
+from app.services.storage import key_for
+from app.services.detection_queue import (
+    DETECTION_MAX_ATTEMPTS,
+    DETECTION_REQUEUE_AFTER,
+    PRIORITY_CLOCKIN,
+    PRIORITY_RESCAN,
+    DetectionQueueFull,
+    claim_run,
+    count_attempt,
+    queued_detections,
+    reserve_detection,
+    release_detections,
+)
 
-# Directorio donde vamos a volcar las imágenes procesadas
-UPLOAD_DIR = "uploads/clockins"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+logger = logging.getLogger(__name__)
 
 
 def enqueue_detection(
-    file: Any,
+    photo_key: str,
     user_id: str,
     project_id: Optional[str],
     latitude: float,
     longitude: float,
     postal_code: Optional[str] = None,
+    photo_path: Optional[str] = None,
+    thumbnail_path: Optional[str] = None,
+    photo_sha256: Optional[str] = None,
+    priority: int = PRIORITY_CLOCKIN,
+    clockin_id: Optional[str] = None,
 ) -> str:
     """
-    Encola una tarea de detección EPP. 
-    file puede ser un UploadFile de FastAPI o una ruta de fichero.
-    Devuelve el task_id de Celery.
+    Encola una tarea de detección EPP sobre una foto ya guardada en el
+    storage (photo_key). Solo viaja la referencia: el worker lee la imagen
+    del storage. photo_path/thumbnail_path se pasan tal cual al clockin que
+    crea el worker (por defecto, la URL de photo_key). photo_sha256 (hash de
+    la subida) es la clave de la caché de detecciones; si no se pasa, el
+    worker lo calcula.
+    Con clockin_id (aprobación diferida) el clockin ya existe con
+    approved=None: el worker solo le pone approved y las detecciones, y el
+    task_id de la tarea es el propio id del clockin.
+    Devuelve el task_id de Celery; si la cola de detección está llena lanza
+    DetectionQueueFull (services.detection_queue) sin encolar nada.
     """
-    # 1) Leemos los bytes de la imagen
-    if hasattr(file, "read"):
-        # FastAPI UploadFile
-        image_bytes = file.file.read()
-    else:
-        # ruta a fichero en disco
-        with open(file, "rb") as f:
-            image_bytes = f.read()
-
-    # 2) Construimos un payload genérico
     payload: Dict[str, Any] = {
         "user_id": user_id,
         "project_id": project_id,
         "latitude": latitude,
         "longitude": longitude,
         "postal_code": postal_code,
-        "photo_bytes": image_bytes,
+        "photo_key": photo_key,
+        "photo_path": photo_path,
+        "thumbnail_path": thumbnail_path,
+        "photo_sha256": photo_sha256,
+        "clockin_id": clockin_id,
     }
 
-    # 3) Disparamos la tarea en Celery
-    task = run_detection.delay(payload)
-    return task.id
+    task_id = clockin_id or str(uuid4())
+    reserve_detection(task_id, priority)
+    if clockin_id:
+        # Reescaneo: que task-status no devuelva el resultado del intento anterior
+        AsyncResult(task_id, app=celery_app).forget()
+    try:
+        run_detection.apply_async((payload,), task_id=task_id, priority=priority)
+    except Exception:
+        release_detections([task_id])
+        raise
+    return task_id
+
+
+def requeue_pending_detections(limit: int = 100) -> int:
+    """
+    Tarea periódica (scheduler de main.py) de la aprobación diferida: vuelve
+    a encolar, como reescaneo, los clockins que siguen con approved=None
+    pasados DETECTION_REQUEUE_AFTER s y que ya no están en la cola (la cola
+    estaba llena al fichar, o la tarea falló o se perdió). Tras
+    DETECTION_MAX_ATTEMPTS intentos el clockin queda como no aprobado.
+    Devuelve cuántos se encolaron.
+    """
+    # Corre cada minuto en todos los workers: una sola pasada por minuto, si
+    # no cada clockin se encolaría (y gastaría intentos) una vez por worker
+    if not claim_run("requeue_detections", 55):
+        return 0
+    db = SessionLocal()
+    try:
+        threshold = datetime.utcnow() - timedelta(seconds=DETECTION_REQUEUE_AFTER)
+        rows = (
+            db.query(Clockin)
+            .filter(
+                Clockin.approved.is_(None),
+                Clockin.photo_path.isnot(None),
+                Clockin.created_at <= threshold,
+            )
+            .order_by(Clockin.created_at)
+            .limit(limit)
+            .all()
+        )
+        queued = queued_detections([str(clk.id) for clk in rows])
+
+        enqueued, given_up = 0, {}
+        for clk in rows:
+            if str(clk.id) in queued:
+                continue
+            if count_attempt(str(clk.id)) > DETECTION_MAX_ATTEMPTS:
+                given_up[clk.id] = {"approved": False, "detection": []}
+                continue
+            try:
+                enqueue_detection(
+                    key_for(clk.photo_path),
+                    user_id=str(clk.user_id),
+                    project_id=str(clk.project_id) if clk.project_id else None,
+                    latitude=clk.location_lat,
+                    longitude=clk.location_long,
+                    postal_code=clk.postal_code,
+                    photo_path=clk.photo_path,
+                    thumbnail_path=clk.thumbnail_path,
+                    priority=PRIORITY_RESCAN,
+                    clockin_id=str(clk.id),
+                )
+            except DetectionQueueFull:
+                break
+            enqueued += 1
+
+        if given_up:
+            logger.warning("[detect] %d clockins sin detección tras %d intentos", len(given_up), DETECTION_MAX_ATTEMPTS)
+            apply_clockin_detections(db, given_up)
+        if enqueued:
+            logger.info("[detect] %d detecciones pendientes reencoladas", enqueued)
+        return enqueued
+    finally:
+        db.close()
 
 
 def get_detection_status(task_id: str) -> Dict[str, Any]:
@@ -0,0 +1,80 @@
+# app/services/detection_cache.py
+
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+import redis
+
+from app.services.detection_events import REDIS_URL
+
+logger = logging.getLogger(__name__)
+
+# Caché de resultados del detector por contenido de la foto: los reintentos
+# desde el móvil (misma foto, subida otra vez) no vuelven a pasar por el
+# modelo. La clave lleva la versión del modelo (EPPDetector.version), así que
+# al cambiar de pesos o de umbrales las entradas viejas simplemente dejan de
+# usarse y caducan solas.
+#   - EPP_CACHE_TTL: segundos que vive cada entrada (0 = caché desactivada)
+#   - EPP_CACHE_MAX_ENTRIES: tope de entradas; se expulsan las más antiguas
+EPP_CACHE_TTL = int(os.getenv("EPP_CACHE_TTL", "86400"))
+EPP_CACHE_MAX_ENTRIES = int(os.getenv("EPP_CACHE_MAX_ENTRIES", "10000"))
+
+_PREFIX = "epp:cache"
+_INDEX = f"{_PREFIX}:index"   # ZSET clave → instante de alta, para el tope
+
+_redis: Optional[redis.Redis] = None
+
+
+def _client() -> redis.Redis:
+    global _redis
+    if _redis is None:
+        _redis = redis.Redis.from_url(REDIS_URL)
+    return _redis
+
+
+def _key(model_version: str, sha256: str) -> str:
+    return f"{_PREFIX}:{model_version}:{sha256}"
+
+
+def get_cached_labels(model_version: str, digests: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Detecciones ya calculadas para estas fotos (sha256 → labels). Las que no
+    están no aparecen; si Redis falla se devuelve {} y se infiere normalmente.
+    """
+    if EPP_CACHE_TTL <= 0 or not digests:
+        return {}
+    try:
+        values = _client().mget([_key(model_version, d) for d in digests])
+    except redis.RedisError:
+        logger.exception("[detect] no se pudo leer la caché de detecciones")
+        return {}
+    return {d: json.loads(v) for d, v in zip(digests, values) if v is not None}
+
+
+def cache_labels(model_version: str, labels_by_digest: Dict[str, List[Dict[str, Any]]]) -> None:
+    """Guarda detecciones nuevas y recorta la caché a EPP_CACHE_MAX_ENTRIES."""
+    if EPP_CACHE_TTL <= 0 or not labels_by_digest:
+        return
+    now = time.time()
+    try:
+        pipe = _client().pipeline()
+        for digest, labels in labels_by_digest.items():
+            key = _key(model_version, digest)
+            pipe.set(key, json.dumps(labels), ex=EPP_CACHE_TTL)
+            pipe.zadd(_INDEX, {key: now})
+        # Fuera del índice lo que ya caducó por TTL…
+        pipe.zremrangebyscore(_INDEX, "-inf", now - EPP_CACHE_TTL)
+        # …y si aún sobra, las entradas más antiguas
+        pipe.zcard(_INDEX)
+        size = pipe.execute()[-1]
+
+        excess = size - EPP_CACHE_MAX_ENTRIES
+        if excess > 0:
+            evicted = [key for key, _ in _client().zpopmin(_INDEX, excess)]
+            if evicted:
+                _client().delete(*evicted)
+    except redis.RedisError:
+        logger.exception("[detect] no se pudo guardar en la caché de detecciones")
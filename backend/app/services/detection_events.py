@@ -0,0 +1,53 @@
+# app/services/detection_events.py
+
+import json
+import os
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+import redis
+import redis.asyncio as aioredis
+
+# Aviso de "detección terminada" del worker a la API por Redis pub/sub, para
+# que los clientes reciban el resultado por SSE en vez de consultar
+# /detection/task-status en bucle.
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+_redis: Optional[redis.Redis] = None
+_aioredis: Optional[aioredis.Redis] = None
+
+
+def _channel(task_id: str) -> str:
+    return f"detection:{task_id}"
+
+
+def publish_detection_event(task_id: str, event: Dict[str, Any]) -> None:
+    """Worker: publica el resultado de una detección (status + datos mínimos)."""
+    global _redis
+    if _redis is None:
+        _redis = redis.Redis.from_url(REDIS_URL)
+    _redis.publish(_channel(task_id), json.dumps(event))
+
+
+@asynccontextmanager
+async def subscribe_detection(task_id: str) -> AsyncIterator[aioredis.client.PubSub]:
+    """
+    API: suscripción al canal de una tarea. Hay que suscribirse ANTES de
+    mirar si la tarea ya terminó; si no, el aviso se puede perder entre medias.
+    """
+    global _aioredis
+    if _aioredis is None:
+        _aioredis = aioredis.Redis.from_url(REDIS_URL)
+    pubsub = _aioredis.pubsub()
+    await pubsub.subscribe(_channel(task_id))
+    try:
+        yield pubsub
+    finally:
+        await pubsub.unsubscribe()
+        await pubsub.aclose()
+
+
+async def next_detection_event(pubsub: aioredis.client.PubSub, timeout: float) -> Optional[Dict[str, Any]]:
+    """Siguiente aviso de la suscripción, o None si no llega en `timeout` s."""
+    msg = await pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+    return json.loads(msg["data"]) if msg else None
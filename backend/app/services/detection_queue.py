@@ -0,0 +1,149 @@
+# app/services/detection_queue.py
+
+import logging
+import math
+import os
+import time
+from typing import Iterable, List, Optional, Set
+
+import redis
+
+from app.services.detection_events import REDIS_URL
+
+logger = logging.getLogger(__name__)
+
+# Control de admisión de la cola de detección: cada tarea encolada ocupa un
+# hueco (ZSET task_id → instante de alta) hasta que el worker la marca como
+# terminada. Con la cola llena, el endpoint responde 429 + Retry-After en vez
+# de dejar que un atasco del modelo se convierta en fichajes de minutos.
+#   - DETECTION_QUEUE_MAX: detecciones pendientes como máximo (0 = sin límite)
+#   - DETECTION_RETRY_AFTER: segundos que se piden al cliente antes de reintentar
+#   - DETECTION_PENDING_TTL: una tarea pendiente más tiempo que esto se da por
+#     perdida (worker caído) y deja de ocupar hueco
+DETECTION_QUEUE_MAX = int(os.getenv("DETECTION_QUEUE_MAX", "100"))
+DETECTION_RETRY_AFTER = int(os.getenv("DETECTION_RETRY_AFTER", "30"))
+DETECTION_PENDING_TTL = int(os.getenv("DETECTION_PENDING_TTL", "600"))
+# Aprobación diferida: cada cuánto se reencola un clockin aún pendiente que ya
+# no está en la cola, y cuántos intentos antes de darlo por no aprobado
+DETECTION_REQUEUE_AFTER = int(os.getenv("DETECTION_REQUEUE_AFTER", "120"))
+DETECTION_MAX_ATTEMPTS = int(os.getenv("DETECTION_MAX_ATTEMPTS", "3"))
+
+# Prioridades de Celery sobre Redis: 0 es la más alta. Los fichajes de campo
+# van por delante de los reescaneos (volver a pasar fotos ya guardadas), que
+# además solo entran mientras la cola está por debajo de la mitad.
+PRIORITY_CLOCKIN = 0
+PRIORITY_RESCAN = 6
+
+_PENDING = "detection:pending"
+
+# Poda + comprobación + alta en un solo paso (atómico en Redis)
+_RESERVE = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', tonumber(ARGV[1]) - tonumber(ARGV[2]))
+local limit = tonumber(ARGV[3])
+if limit > 0 and redis.call('ZCARD', KEYS[1]) >= limit then
+    return 0
+end
+redis.call('ZADD', KEYS[1], ARGV[1], ARGV[4])
+return 1
+"""
+
+_redis: Optional[redis.Redis] = None
+_reserve_script = None
+
+
+class DetectionQueueFull(Exception):
+    """No hay hueco en la cola de detección; reintentar tras retry_after segundos."""
+
+    def __init__(self, retry_after: int = DETECTION_RETRY_AFTER):
+        super().__init__(f"Cola de detección llena; reintentar en {retry_after} s")
+        self.retry_after = retry_after
+
+
+def _client() -> redis.Redis:
+    global _redis, _reserve_script
+    if _redis is None:
+        _redis = redis.Redis.from_url(REDIS_URL)
+        _reserve_script = _redis.register_script(_RESERVE)
+    return _redis
+
+
+def _limit(priority: int) -> int:
+    if DETECTION_QUEUE_MAX <= 0 or priority <= PRIORITY_CLOCKIN:
+        return DETECTION_QUEUE_MAX
+    return max(DETECTION_QUEUE_MAX // 2, 1)
+
+
+def reserve_detection(task_id: str, priority: int = PRIORITY_CLOCKIN) -> None:
+    """
+    Ocupa un hueco para task_id o lanza DetectionQueueFull. Si Redis no
+    responde se deja pasar: el encolado fallará igualmente si el broker cae.
+    Sin límite (DETECTION_QUEUE_MAX=0) el hueco se anota igualmente, para
+    saber qué detecciones siguen en curso (queued_detections).
+    """
+    try:
+        _client()
+        admitted = _reserve_script(
+            keys=[_PENDING], args=[time.time(), DETECTION_PENDING_TTL, _limit(priority), task_id],
+        )
+    except redis.RedisError:
+        logger.exception("[detect] no se pudo comprobar la cola de detección")
+        return
+    if not admitted:
+        raise DetectionQueueFull(retry_after(priority))
+
+
+def retry_after(priority: int = PRIORITY_CLOCKIN) -> int:
+    """Segundos para el Retry-After: el configurado, más si la cola desborda mucho."""
+    try:
+        pending = _client().zcard(_PENDING)
+    except redis.RedisError:
+        return DETECTION_RETRY_AFTER
+    return max(DETECTION_RETRY_AFTER, math.ceil(DETECTION_RETRY_AFTER * pending / max(_limit(priority), 1)))
+
+
+def release_detections(task_ids: Iterable[str]) -> None:
+    """Worker: libera los huecos de las tareas ya terminadas (bien o mal)."""
+    task_ids = list(task_ids)
+    if not task_ids:
+        return
+    try:
+        _client().zrem(_PENDING, *task_ids)
+    except redis.RedisError:
+        logger.exception("[detect] no se pudieron liberar %d huecos de la cola", len(task_ids))
+
+
+def queued_detections(task_ids: List[str]) -> Set[str]:
+    """De estas tareas, las que siguen ocupando hueco (encoladas o en curso)."""
+    if not task_ids:
+        return set()
+    scores = _client().zmscore(_PENDING, task_ids)
+    cutoff = time.time() - DETECTION_PENDING_TTL
+    return {t for t, score in zip(task_ids, scores) if score is not None and score >= cutoff}
+
+
+def count_attempt(task_id: str) -> int:
+    """Suma un reintento de la detección task_id y devuelve cuántos lleva."""
+    key = f"detection:attempts:{task_id}"
+    pipe = _client().pipeline()
+    pipe.incr(key)
+    pipe.expire(key, 86400)
+    return pipe.execute()[0]
+
+
+def claim_run(job: str, ttl: int) -> bool:
+    """
+    Lock entre procesos (SET NX EX) para los jobs del scheduler, que corre en
+    cada worker de uvicorn: solo el que lo consigue ejecuta esta pasada. No
+    se libera al terminar; con un ttl algo menor que el intervalo del job hay
+    una pasada por intervalo aunque los relojes de los workers no coincidan.
+    """
+    try:
+        return bool(_client().set(f"lock:{job}", os.getpid(), nx=True, ex=ttl))
+    except redis.RedisError:
+        logger.exception("[detect] no se pudo tomar el lock de %s", job)
+        return False
+
+
+def pending_detections() -> int:
+    """Detecciones encoladas o en curso (para /health y logs)."""
+    return _client().zcard(_PENDING)
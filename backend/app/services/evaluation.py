@@ -0,0 +1,197 @@
+# app/services/evaluation.py
+
+import resource
+import time
+from typing import Any, Dict, Iterator, List, Tuple, Union
+
+import numpy as np
+
+from app.services.dataset import DatasetCache, Sample
+from app.services.inference import EPP_CONF, DetectionResult, EPPDetector, is_approved
+
+# Evaluación offline del detector EPP sobre el dataset de Roboflow
+# (services.dataset). Métricas como las de val.py de yolov5: mAP@0.5 y
+# mAP@0.5:0.95 con interpolación de 101 puntos, y precisión/recall por clase
+# al umbral de producción (EPP_CONF) con IoU 0.5.
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+# Confianza mínima para calcular el mAP (la curva P/R necesita también las
+# detecciones de baja confianza); P/R y approved se miden a EPP_CONF
+EVAL_CONF = 0.001
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """IoU de cada caja de `a` (N x 4) con cada una de `b` (M x 4) → N x M."""
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.clip(rb - lt, 0, None).prod(2)
+    area_a = (a[:, 2:] - a[:, :2]).prod(1)
+    area_b = (b[:, 2:] - b[:, :2]).prod(1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def match_detections(
+    boxes: np.ndarray, classes: np.ndarray, scores: np.ndarray, gt_boxes: np.ndarray, gt_classes: np.ndarray,
+) -> np.ndarray:
+    """
+    Marca cada detección como acierto (True) para cada umbral de
+    IOU_THRESHOLDS: emparejamiento voraz por confianza, misma clase y cada
+    caja real usada una sola vez → matriz N x len(IOU_THRESHOLDS).
+    """
+    correct = np.zeros((len(boxes), len(IOU_THRESHOLDS)), dtype=bool)
+    if not len(boxes) or not len(gt_boxes):
+        return correct
+    iou = box_iou(boxes, gt_boxes)
+    iou[classes[:, None] != gt_classes[None, :]] = 0
+    order = np.argsort(-scores)
+    for t, thr in enumerate(IOU_THRESHOLDS):
+        used = np.zeros(len(gt_boxes), dtype=bool)
+        for i in order:
+            candidates = np.where((iou[i] >= thr) & ~used)[0]
+            if candidates.size:
+                j = candidates[iou[i, candidates].argmax()]
+                used[j] = True
+                correct[i, t] = True
+    return correct
+
+
+def average_precision(recall: np.ndarray, precision: np.ndarray) -> float:
+    """Área bajo la curva P/R (envolvente monótona, 101 puntos como COCO)."""
+    r = np.concatenate(([0.0], recall, [1.0]))
+    p = np.concatenate(([1.0], precision, [0.0]))
+    p = np.flip(np.maximum.accumulate(np.flip(p)))
+    x = np.linspace(0, 1, 101)
+    y = np.interp(x, r, p)
+    return float(((y[1:] + y[:-1]) / 2 * np.diff(x)).sum())
+
+
+def class_metrics(
+    correct: np.ndarray, scores: np.ndarray, classes: np.ndarray, gt_classes: np.ndarray,
+    names: Dict[int, str], conf: float = EPP_CONF,
+) -> Dict[str, Dict[str, Any]]:
+    """AP por clase (todas las confianzas) y P/R a `conf` con IoU 0.5."""
+    out = {}
+    for c, name in sorted(names.items()):
+        is_c = classes == c
+        n_gt = int((gt_classes == c).sum())
+        hits, s = correct[is_c], scores[is_c]
+        order = np.argsort(-s)
+        hits, s = hits[order], s[order]
+
+        ap = np.zeros(len(IOU_THRESHOLDS))
+        if n_gt and len(hits):
+            tp = np.cumsum(hits, axis=0)
+            fp = np.cumsum(~hits, axis=0)
+            for t in range(len(IOU_THRESHOLDS)):
+                ap[t] = average_precision(tp[:, t] / n_gt, tp[:, t] / (tp[:, t] + fp[:, t]))
+
+        kept = hits[s >= conf, 0]
+        out[name] = {
+            "instances": n_gt,
+            "precision": round(float(kept.mean()), 4) if len(kept) else 0.0,
+            "recall": round(float(kept.sum() / n_gt), 4) if n_gt else 0.0,
+            "ap50": round(float(ap[0]), 4),
+            "ap50_95": round(float(ap.mean()), 4),
+        }
+    return out
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss va en KB en Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _run(
+    detector: EPPDetector, data: Union[List[Sample], DatasetCache], batch_size: int,
+) -> Iterator[Tuple[List[Sample], List[DetectionResult], float]]:
+    """(muestras, resultados, segundos) por lote; con DatasetCache no se decodifica nada."""
+    if isinstance(data, DatasetCache):
+        for batch in data.batches(batch_size):
+            t = time.perf_counter()
+            results = detector.detect_prepared(batch.x, batch.metas)
+            yield batch.samples, results, time.perf_counter() - t
+        return
+
+    for i in range(0, len(data), batch_size):
+        batch = data[i:i + batch_size]
+        images = []
+        for sample in batch:
+            with open(sample.image_path, "rb") as f:
+                images.append(f.read())
+        t = time.perf_counter()
+        results = detector.detect_batch(images)
+        yield batch, results, time.perf_counter() - t
+
+
+def evaluate(
+    detector: EPPDetector, data: Union[List[Sample], DatasetCache], batch_size: int = 8, conf: float = EPP_CONF,
+) -> Dict[str, Any]:
+    """
+    Pasa el dataset por el detector en lotes de `batch_size` y devuelve
+    métricas de precisión (por clase y globales, más el acierto de la
+    decisión approved por imagen) y de velocidad (latencia por lote,
+    imágenes/s, ms por etapa y memoria máxima del proceso).
+
+    `data` son muestras (se decodifica cada imagen, como en producción) o un
+    DatasetCache (imágenes ya preprocesadas: solo se mide infer+postprocess).
+    El detector debe tener conf <= EVAL_CONF para que el mAP salga bien;
+    la lectura de los ficheros no entra en los tiempos.
+    """
+    all_correct, all_scores, all_classes, all_gt = [], [], [], []
+    approved_hits = images = 0
+    latencies, stages = [], {}
+    elapsed = 0.0
+
+    for batch, results, latency in _run(detector, data, batch_size):
+        images += len(batch)
+        elapsed += latency
+        latencies.append(latency * 1000)
+        for k, v in results[0].timings.items():
+            if k != "batch_size":
+                stages.setdefault(k, []).append(v)
+
+        for sample, result in zip(batch, results):
+            labels = result.labels
+            boxes = np.array([[d["xmin"], d["ymin"], d["xmax"], d["ymax"]] for d in labels]).reshape(-1, 4)
+            classes = np.array([d["class"] for d in labels], dtype=int)
+            scores = np.array([d["confidence"] for d in labels], dtype=float)
+            all_correct.append(match_detections(boxes, classes, scores, sample.boxes, sample.classes))
+            all_scores.append(scores)
+            all_classes.append(classes)
+            all_gt.append(sample.classes)
+
+            predicted = is_approved([d for d in labels if d["confidence"] >= conf])
+            expected = is_approved([{"name": detector.names.get(int(c), str(c))} for c in sample.classes])
+            approved_hits += predicted == expected
+
+    per_class = class_metrics(
+        np.concatenate(all_correct) if all_correct else np.zeros((0, len(IOU_THRESHOLDS)), dtype=bool),
+        np.concatenate(all_scores) if all_scores else np.zeros(0),
+        np.concatenate(all_classes) if all_classes else np.zeros(0, dtype=int),
+        np.concatenate(all_gt) if all_gt else np.zeros(0, dtype=int),
+        detector.names,
+        conf,
+    )
+    with_gt = [m for m in per_class.values() if m["instances"]]
+
+    def mean(key: str) -> float:
+        return round(float(np.mean([m[key] for m in with_gt])), 4) if with_gt else 0.0
+
+    return {
+        "images": images,
+        "instances": sum(m["instances"] for m in per_class.values()),
+        "precision": mean("precision"),
+        "recall": mean("recall"),
+        "map50": mean("ap50"),
+        "map50_95": mean("ap50_95"),
+        "approved_accuracy": round(approved_hits / images, 4) if images else 0.0,
+        "classes": per_class,
+        "speed": {
+            "batch_size": batch_size,
+            "preprocessed": isinstance(data, DatasetCache),
+            "images_per_s": round(images / elapsed, 2) if elapsed else 0.0,
+            "p50_ms": round(float(np.percentile(latencies, 50)), 2) if latencies else 0.0,
+            "p95_ms": round(float(np.percentile(latencies, 95)), 2) if latencies else 0.0,
+            "stages_mean_ms": {k: round(float(np.mean(v)), 2) for k, v in stages.items()},
+        },
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
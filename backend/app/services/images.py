@@ -0,0 +1,74 @@
+# app/services/images.py
+
+import logging
+import os
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+# Lado mayor (px) de la foto normalizada y de la miniatura
+PHOTO_MAX_SIZE = int(os.getenv("PHOTO_MAX_SIZE", "1600"))
+PHOTO_THUMB_SIZE = int(os.getenv("PHOTO_THUMB_SIZE", "320"))
+# JPEG o WEBP
+PHOTO_FORMAT = os.getenv("PHOTO_FORMAT", "JPEG").upper()
+PHOTO_QUALITY = int(os.getenv("PHOTO_QUALITY", "85"))
+
+_EXTENSIONS = {"JPEG": ".jpg", "WEBP": ".webp"}
+
+
+@dataclass
+class ProcessedPhoto:
+    path: str                       # foto normalizada en disco
+    thumbnail_path: Optional[str]   # miniatura en disco (None si no se pudo generar)
+
+
+def _save(img: Image.Image, path: str) -> None:
+    tmp_path = f"{path}.part"
+    img.save(tmp_path, format=PHOTO_FORMAT, quality=PHOTO_QUALITY, optimize=True)
+    os.replace(tmp_path, path)
+
+
+def output_paths(stem: str) -> Tuple[str, str]:
+    """(foto normalizada, miniatura) para un nombre base sin extensión."""
+    ext = _EXTENSIONS.get(PHOTO_FORMAT, ".jpg")
+    return f"{stem}{ext}", f"{stem}_thumb{ext}"
+
+
+def process_photo(src_path: str, dest_stem: Optional[str] = None) -> ProcessedPhoto:
+    """
+    Normaliza una foto subida:
+      1) aplica la orientación EXIF y pasa a RGB,
+      2) la reduce a PHOTO_MAX_SIZE px de lado mayor (sin ampliar),
+      3) genera una miniatura de PHOTO_THUMB_SIZE px.
+    Ambas se guardan como <dest_stem>.jpg / <dest_stem>_thumb.jpg (o .webp);
+    por defecto dest_stem es el nombre del original, que se sustituye por la
+    versión normalizada.
+    Si el fichero no es una imagen que Pillow sepa abrir, se guarda tal cual.
+    """
+    src_stem, src_ext = os.path.splitext(src_path)
+    stem = dest_stem or src_stem
+    out_path, thumb_path = output_paths(stem)
+
+    try:
+        with Image.open(src_path) as raw:
+            img = ImageOps.exif_transpose(raw).convert("RGB")
+    except (UnidentifiedImageError, OSError):
+        logger.warning("No se pudo procesar la imagen %s; se guarda sin normalizar", src_path)
+        raw_path = f"{stem}{src_ext}"
+        if raw_path != src_path:
+            os.replace(src_path, raw_path)
+        return ProcessedPhoto(path=raw_path, thumbnail_path=None)
+
+    img.thumbnail((PHOTO_MAX_SIZE, PHOTO_MAX_SIZE), Image.LANCZOS)
+    _save(img, out_path)
+
+    img.thumbnail((PHOTO_THUMB_SIZE, PHOTO_THUMB_SIZE), Image.LANCZOS)
+    _save(img, thumb_path)
+
+    if out_path != src_path:
+        os.remove(src_path)
+    return ProcessedPhoto(path=out_path, thumbnail_path=thumb_path)
+
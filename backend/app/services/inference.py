@@ -0,0 +1,357 @@
+# app/services/inference.py
+
+import ast
+import hashlib
+import io
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Backend de inferencia: "torch" (pesos .pt de YOLOv5) u "onnx" (onnxruntime,
+# sin torch; ver scripts/export_onnx.py para generar el .onnx y su versión INT8)
+EPP_DETECTOR_BACKEND = os.getenv("EPP_DETECTOR_BACKEND", "torch").lower()
+
+# Modelo YOLOv5 custom de detección de EPP
+EPP_MODEL_PATH = os.getenv("EPP_MODEL_PATH", "yolov5/epp-detector/exp8/weights/best.pt")
+EPP_ONNX_PATH = os.getenv("EPP_ONNX_PATH", os.path.splitext(EPP_MODEL_PATH)[0] + ".onnx")
+# Clases del dataset (helmet, not_helmet, …), por si el .onnx no las trae
+EPP_DATA_YAML = os.getenv("EPP_DATA_YAML", os.path.join(os.path.dirname(__file__), "..", "data", "data.yaml"))
+# Repo de yolov5 para torch.hub: "ultralytics/yolov5" (GitHub) o una ruta local
+# con el código ya clonado (evita ir a la red cada vez que arranca un worker)
+EPP_YOLOV5_REPO = os.getenv("EPP_YOLOV5_REPO", "ultralytics/yolov5")
+EPP_CONF = float(os.getenv("EPP_CONF", "0.3"))
+EPP_IOU = float(os.getenv("EPP_IOU", "0.45"))
+EPP_IMG_SIZE = int(os.getenv("EPP_IMG_SIZE", "640"))
+EPP_MAX_DET = int(os.getenv("EPP_MAX_DET", "100"))
+# Hilos de inferencia por proceso (torch u onnxruntime; 0 = lo que decida el
+# runtime). Con varios procesos de Celery conviene workers * EPP_THREADS <= núcleos.
+EPP_THREADS = int(os.getenv("EPP_THREADS", "0"))
+# Versión del modelo para la caché de detecciones; por defecto se deriva del
+# fichero de pesos y de los umbrales (ver model_version)
+EPP_MODEL_VERSION = os.getenv("EPP_MODEL_VERSION", "")
+
+STAGES = ("decode", "preprocess", "infer", "postprocess")
+
+ImageSource = Union[bytes, BinaryIO]
+
+
+@dataclass
+class DetectionResult:
+    labels: List[Dict[str, Any]]            # mismo formato que results.pandas().xyxy[0]
+    timings: Dict[str, float] = field(default_factory=dict)  # ms por etapa
+
+    @property
+    def approved(self) -> bool:
+        return is_approved(self.labels)
+
+
+def normalize_label(name: str) -> str:
+    return name.lower().replace(" ", "_")
+
+
+def is_approved(labels: List[Dict[str, Any]]) -> bool:
+    """
+    Si aparece alguna clase que empieza por "not_" (p.ej. not_helmet),
+    rechazamos; si no, se aprueba.
+    """
+    return not any(normalize_label(d["name"]).startswith("not_") for d in labels)
+
+
+# ---------------------------------------
+# Pre/post-proceso (numpy, sin torch)
+# ---------------------------------------
+def decode_image(source: ImageSource) -> np.ndarray:
+    """
+    bytes o fichero binario (con seek; p.ej. el mmap de Storage.open) → array
+    RGB HxWx3 uint8 (aplicando la orientación EXIF).
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    with Image.open(source) as raw:
+        img = ImageOps.exif_transpose(raw).convert("RGB")
+    return np.asarray(img)
+
+
+def letterbox(img: np.ndarray, size: int = EPP_IMG_SIZE) -> Tuple[np.ndarray, float, Tuple[int, int]]:
+    """
+    Escala el lado mayor a `size` manteniendo proporción y rellena con gris
+    (114) hasta size x size, como hace yolov5. Devuelve (imagen, escala, (pad_x, pad_y)).
+    """
+    h, w = img.shape[:2]
+    scale = min(size / h, size / w)
+    nh, nw = round(h * scale), round(w * scale)
+    resized = np.asarray(Image.fromarray(img).resize((nw, nh), Image.BILINEAR))
+    pad_y, pad_x = (size - nh) // 2, (size - nw) // 2
+    out = np.full((size, size, 3), 114, dtype=np.uint8)
+    out[pad_y:pad_y + nh, pad_x:pad_x + nw] = resized
+    return out, scale, (pad_x, pad_y)
+
+
+def to_input(img: np.ndarray) -> np.ndarray:
+    """HxWx3 uint8 → 1x3xHxW float32 en [0, 1]."""
+    return np.ascontiguousarray(img.transpose(2, 0, 1)[None], dtype=np.float32) / 255.0
+
+
+def _nms(boxes: np.ndarray, scores: np.ndarray, iou: float) -> List[int]:
+    x1, y1, x2, y2 = boxes.T
+    areas = (x2 - x1) * (y2 - y1)
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        xx1 = np.maximum(x1[i], x1[order[1:]])
+        yy1 = np.maximum(y1[i], y1[order[1:]])
+        xx2 = np.minimum(x2[i], x2[order[1:]])
+        yy2 = np.minimum(y2[i], y2[order[1:]])
+        inter = np.clip(xx2 - xx1, 0, None) * np.clip(yy2 - yy1, 0, None)
+        ious = inter / (areas[i] + areas[order[1:]] - inter + 1e-9)
+        order = order[1:][ious <= iou]
+    return keep
+
+
+def postprocess(
+    pred: np.ndarray,
+    names: Dict[int, str],
+    scale: float,
+    pad: Tuple[int, int],
+    shape: Tuple[int, int],
+    conf: float = EPP_CONF,
+    iou: float = EPP_IOU,
+    max_det: int = EPP_MAX_DET,
+) -> List[Dict[str, Any]]:
+    """
+    Salida cruda de yolov5 (N x (5 + clases): cx, cy, w, h, obj, cls…) →
+    lista de detecciones en coordenadas de la imagen original, tras filtrar
+    por confianza y aplicar NMS por clase.
+    """
+    scores = pred[:, 4:5] * pred[:, 5:]
+    cls = scores.argmax(1)
+    score = scores[np.arange(len(cls)), cls]
+    mask = score >= conf
+    if not mask.any():
+        return []
+    xywh, cls, score = pred[mask, :4], cls[mask], score[mask]
+
+    boxes = np.empty_like(xywh)
+    boxes[:, :2] = xywh[:, :2] - xywh[:, 2:] / 2
+    boxes[:, 2:] = xywh[:, :2] + xywh[:, 2:] / 2
+    # NMS por clase desplazando cada clase a su propia "zona" (truco de yolov5)
+    keep = _nms(boxes + cls[:, None] * 4096.0, score, iou)[:max_det]
+
+    h, w = shape
+    boxes = boxes[keep]
+    boxes[:, [0, 2]] = ((boxes[:, [0, 2]] - pad[0]) / scale).clip(0, w)
+    boxes[:, [1, 3]] = ((boxes[:, [1, 3]] - pad[1]) / scale).clip(0, h)
+    return [
+        {
+            "xmin": float(b[0]), "ymin": float(b[1]),
+            "xmax": float(b[2]), "ymax": float(b[3]),
+            "confidence": float(s),
+            "class": int(c),
+            "name": names.get(int(c), str(int(c))),
+        }
+        for b, s, c in zip(boxes, score[keep], cls[keep])
+    ]
+
+
+# ---------------------------------------
+# Backends de inferencia
+# ---------------------------------------
+# Reciben el lote ya preprocesado (B x 3 x S x S, float32) y devuelven la
+# salida cruda de yolov5 (B x N x (5 + clases)) como numpy.
+def _names_dict(names) -> Dict[int, str]:
+    return dict(enumerate(names)) if isinstance(names, (list, tuple)) else {int(k): v for k, v in dict(names).items()}
+
+
+def load_class_names(data_yaml: str = EPP_DATA_YAML) -> Dict[int, str]:
+    """Clases del dataset (names de data.yaml)."""
+    import yaml
+
+    with open(data_yaml) as f:
+        return _names_dict(yaml.safe_load(f)["names"])
+
+
+class TorchBackend:
+    """YOLOv5 (.pt) con torch en CPU."""
+
+    name = "torch"
+
+    def __init__(self, weights: str = EPP_MODEL_PATH):
+        import torch  # pesado: solo en los procesos que usan este backend
+
+        if EPP_THREADS > 0:
+            torch.set_num_threads(EPP_THREADS)
+        self._torch = torch
+        self.model = torch.hub.load(
+            EPP_YOLOV5_REPO,
+            "custom",
+            path=weights,
+            source="local" if os.path.isdir(EPP_YOLOV5_REPO) else "github",
+            autoshape=False,   # pre/post-proceso propios (y medibles)
+            device="cpu",
+        ).eval()
+        self.model_path = weights
+        self.names = _names_dict(self.model.names)
+
+    def __call__(self, x: np.ndarray) -> np.ndarray:
+        with self._torch.inference_mode():
+            out = self.model(self._torch.from_numpy(x))
+        if isinstance(out, (list, tuple)):
+            out = out[0]
+        return out.cpu().numpy()
+
+
+class OnnxBackend:
+    """
+    Modelo exportado a ONNX (scripts/export_onnx.py; opcionalmente INT8)
+    con onnxruntime en CPU. No necesita torch.
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_path: str = EPP_ONNX_PATH):
+        import onnxruntime as ort
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if EPP_THREADS > 0:
+            opts.intra_op_num_threads = EPP_THREADS
+        self.session = ort.InferenceSession(model_path, opts, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.model_path = model_path
+
+        # export_onnx.py guarda las clases en los metadatos; si no, data.yaml
+        meta = self.session.get_modelmeta().custom_metadata_map
+        self.names = _names_dict(ast.literal_eval(meta["names"])) if "names" in meta else load_class_names()
+
+    def __call__(self, x: np.ndarray) -> np.ndarray:
+        return self.session.run(None, {self.input_name: x})[0]
+
+
+BACKENDS = {"torch": TorchBackend, "onnx": OnnxBackend}
+
+
+def model_version(backend: str, model_path: str, img_size: int, conf: float, iou: float) -> str:
+    """
+    Identifica lo que produce el detector: backend + hash de los pesos +
+    parámetros que cambian el resultado. Si cambia cualquiera, cambia la
+    versión (y con ella las claves de la caché de detecciones).
+    """
+    digest = hashlib.sha256()
+    try:
+        with open(model_path, "rb") as f:
+            while chunk := f.read(1024 * 1024):
+                digest.update(chunk)
+        weights = digest.hexdigest()[:12]
+    except OSError:
+        weights = os.path.basename(model_path)
+    return f"{backend}-{weights}-{img_size}-{conf}-{iou}"
+
+
+# ---------------------------------------
+# Detector
+# ---------------------------------------
+class EPPDetector:
+    """
+    Modelo cargado una sola vez por proceso (ver get_detector). La inferencia
+    es en CPU con el backend de EPP_DETECTOR_BACKEND (torch u onnx); cada
+    llamada devuelve también lo que tardó cada etapa.
+    """
+
+    def __init__(
+        self,
+        backend: str = EPP_DETECTOR_BACKEND,
+        model_path: Optional[str] = None,
+        img_size: int = EPP_IMG_SIZE,
+        conf: float = EPP_CONF,
+        iou: float = EPP_IOU,
+    ):
+        if backend not in BACKENDS:
+            raise ValueError(f"EPP_DETECTOR_BACKEND desconocido: {backend}")
+
+        t0 = time.perf_counter()
+        self.runner = BACKENDS[backend](model_path) if model_path else BACKENDS[backend]()
+        self.names = self.runner.names
+        self.img_size, self.conf, self.iou = img_size, conf, iou
+        self.version = EPP_MODEL_VERSION or model_version(
+            backend, self.runner.model_path, img_size, conf, iou,
+        )
+        logger.info(
+            "[detect] modelo cargado (%s, %s) en %.0f ms",
+            backend, self.version, (time.perf_counter() - t0) * 1000,
+        )
+
+    def _forward(self, x: np.ndarray) -> np.ndarray:
+        return self.runner(x)
+
+    def warmup(self) -> None:
+        """Una inferencia en vacío: la primera siempre es mucho más lenta."""
+        self._forward(np.zeros((1, 3, self.img_size, self.img_size), dtype=np.float32))
+
+    def detect(self, image: ImageSource) -> DetectionResult:
+        return self.detect_batch([image])[0]
+
+    def detect_batch(self, images: List[ImageSource]) -> List[DetectionResult]:
+        """
+        Varias imágenes en una sola pasada del modelo (todas van al mismo
+        tamaño por el letterbox). Los tiempos son los del lote completo y se
+        repiten en cada resultado, junto con batch_size.
+        """
+        timings: Dict[str, float] = {}
+        t = time.perf_counter()
+        decoded = [decode_image(b) for b in images]
+        timings["decode"] = round((time.perf_counter() - t) * 1000, 2)
+
+        t = time.perf_counter()
+        boxed = [letterbox(img, self.img_size) for img in decoded]
+        x = np.concatenate([to_input(b) for b, _, _ in boxed])
+        timings["preprocess"] = round((time.perf_counter() - t) * 1000, 2)
+
+        metas = [(scale, pad, img.shape[:2]) for img, (_, scale, pad) in zip(decoded, boxed)]
+        return self._infer(x, metas, timings)
+
+    def detect_prepared(
+        self, x: np.ndarray, metas: List[Tuple[float, Tuple[int, int], Tuple[int, int]]],
+    ) -> List[DetectionResult]:
+        """
+        Lote ya letterboxed (B x 3 x S x S float32, p.ej. de la caché de
+        services.dataset) con (escala, pad, (alto, ancho)) de cada imagen:
+        solo inferencia y post-proceso.
+        """
+        return self._infer(x, metas, {"decode": 0.0, "preprocess": 0.0})
+
+    def _infer(self, x: np.ndarray, metas, timings: Dict[str, float]) -> List[DetectionResult]:
+        t = time.perf_counter()
+        preds = self._forward(x)
+        timings["infer"] = round((time.perf_counter() - t) * 1000, 2)
+
+        t = time.perf_counter()
+        labels = [
+            postprocess(pred, self.names, scale, pad, shape, self.conf, self.iou)
+            for pred, (scale, pad, shape) in zip(preds, metas)
+        ]
+        timings["postprocess"] = round((time.perf_counter() - t) * 1000, 2)
+
+        timings["total"] = round(sum(timings[s] for s in STAGES), 2)
+        timings["batch_size"] = len(metas)
+        logger.info(
+            "[detect] %s",
+            " ".join(f"{k}={v:.1f}ms" for k, v in timings.items() if k != "batch_size")
+            + f" batch={len(metas)}",
+        )
+        return [DetectionResult(labels=l, timings=dict(timings)) for l in labels]
+
+
+@lru_cache(maxsize=1)
+def get_detector() -> EPPDetector:
+    """Detector del proceso actual (se carga en la primera llamada)."""
+    return EPPDetector()
@@ -0,0 +1,159 @@
+# app/services/location_partitions.py
+
+import logging
+import os
+import re
+from datetime import date, datetime
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from app.database import engine
+
+logger = logging.getLogger(__name__)
+
+# user_locations está particionada por mes de `timestamp` (UTC):
+# user_locations_YYYY_MM, más una partición DEFAULT para que un insert nunca
+# falle por falta de partición. Un job diario del scheduler (main.py) crea por
+# adelantado las de los próximos meses y, si se activa, retira las que pasan
+# de la retención.
+#   - LOCATION_PARTITIONS_AHEAD: meses futuros con partición ya creada
+#   - LOCATION_RETENTION_MONTHS: meses completos que se conservan además del
+#     actual (0 = sin límite, el valor por defecto)
+#   - LOCATION_RETENTION_MODE: detach = se sacan de user_locations pero la
+#     tabla se queda (para archivarla con pg_dump -t y borrarla a mano);
+#     drop = se borran
+LOCATION_PARTITIONS_AHEAD = int(os.getenv("LOCATION_PARTITIONS_AHEAD", "3"))
+LOCATION_RETENTION_MONTHS = int(os.getenv("LOCATION_RETENTION_MONTHS", "0"))
+LOCATION_RETENTION_MODE = os.getenv("LOCATION_RETENTION_MODE", "detach").lower()
+
+TABLE = "user_locations"
+DEFAULT_PARTITION = f"{TABLE}_default"
+_PARTITION = re.compile(rf"^{TABLE}_(\d{{4}})_(\d{{2}})$")
+
+
+def _add_months(month: date, n: int) -> date:
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{TABLE}_{month.year:04d}_{month.month:02d}"
+
+
+def is_partitioned(conn: Connection) -> bool:
+    """False si la migración que particiona user_locations aún no se aplicó."""
+    return bool(conn.execute(text("""
+        SELECT 1 FROM pg_partitioned_table p
+        JOIN pg_class c ON c.oid = p.partrelid
+        WHERE c.relname = :table AND c.relnamespace = 'public'::regnamespace
+    """), {"table": TABLE}).scalar())
+
+
+def attached_partitions(conn: Connection) -> List[str]:
+    return list(conn.execute(text("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'public.user_locations'::regclass
+        ORDER BY c.relname
+    """)).scalars())
+
+
+def ensure_default_partition(conn: Connection) -> None:
+    conn.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT"))
+
+
+def _create_partition(conn: Connection, name: str, start: date) -> int:
+    """
+    Crea la partición del mes `start`. Si la DEFAULT ya tiene filas de ese
+    mes (el job no corrió a tiempo) no se puede crear directamente: se crea
+    suelta, se le pasan esas filas y se engancha. Devuelve las filas movidas.
+    """
+    bounds = {"start": f"{start.isoformat()} 00:00+00", "end": f"{_add_months(start, 1).isoformat()} 00:00+00"}
+    values = f"FOR VALUES FROM ('{bounds['start']}') TO ('{bounds['end']}')"
+    in_month = "timestamp >= CAST(:start AS timestamptz) AND timestamp < CAST(:end AS timestamptz)"
+    pending = conn.execute(
+        text(f"SELECT 1 FROM {DEFAULT_PARTITION} WHERE {in_month} LIMIT 1"), bounds
+    ).scalar()
+    if not pending:
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {TABLE} {values}"))
+        return 0
+    conn.execute(text(f"CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    moved = conn.execute(text(f"""
+        WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE {in_month} RETURNING *)
+        INSERT INTO {name} SELECT * FROM moved
+    """), bounds).rowcount
+    conn.execute(text(f"ALTER TABLE {TABLE} ATTACH PARTITION {name} {values}"))
+    return moved
+
+
+def ensure_location_partitions(conn: Connection, today: Optional[date] = None,
+                               ahead: int = LOCATION_PARTITIONS_AHEAD) -> List[str]:
+    """Crea (si faltan) la DEFAULT y las particiones del mes actual y de los `ahead` siguientes."""
+    ensure_default_partition(conn)
+    month = (today or datetime.utcnow().date()).replace(day=1)
+    existing = set(attached_partitions(conn))
+    created = []
+    for n in range(ahead + 1):
+        start = _add_months(month, n)
+        name = partition_name(start)
+        if name in existing:
+            continue
+        moved = _create_partition(conn, name, start)
+        if moved:
+            logger.warning("[locations] %d filas de %s movidas a %s: el job de particiones no ha corrido a tiempo",
+                           moved, DEFAULT_PARTITION, name)
+        created.append(name)
+    return created
+
+
+def apply_location_retention(conn: Connection, today: Optional[date] = None,
+                             months: int = LOCATION_RETENTION_MONTHS,
+                             mode: str = LOCATION_RETENTION_MODE) -> List[str]:
+    """
+    Retira las particiones de meses anteriores a los `months` que se
+    conservan (detach o drop según `mode`). Devuelve sus nombres.
+    """
+    if months <= 0:
+        return []
+    if mode not in ("detach", "drop"):
+        raise ValueError(f"LOCATION_RETENTION_MODE desconocido: {mode}")
+    cutoff = _add_months((today or datetime.utcnow().date()).replace(day=1), -months)
+    retired = []
+    for name in attached_partitions(conn):
+        match = _PARTITION.match(name)
+        if not match or date(int(match[1]), int(match[2]), 1) >= cutoff:
+            continue
+        if mode == "drop":
+            conn.execute(text(f"DROP TABLE {name}"))
+        else:
+            conn.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {name}"))
+        retired.append(name)
+    return retired
+
+
+def maintain_location_partitions() -> None:
+    """Job del scheduler (al arrancar y a diario): particiones futuras + retención."""
+    try:
+        with engine.begin() as conn:
+            # El scheduler corre en cada worker: solo uno hace la pasada
+            if not conn.execute(text("SELECT pg_try_advisory_xact_lock(hashtext(:name))"),
+                                {"name": "location_partitions"}).scalar():
+                return
+            if not is_partitioned(conn):
+                logger.warning("[locations] %s no está particionada; falta aplicar la migración", TABLE)
+                return
+            created = ensure_location_partitions(conn)
+            retired = apply_location_retention(conn)
+            stray = conn.execute(text(f"SELECT count(*) FROM {DEFAULT_PARTITION}")).scalar()
+    except Exception:
+        logger.exception("[locations] error manteniendo las particiones de %s", TABLE)
+        return
+    if created:
+        logger.info("[locations] particiones creadas: %s", ", ".join(created))
+    if retired:
+        logger.info("[locations] particiones retiradas (%s): %s", LOCATION_RETENTION_MODE, ", ".join(retired))
+    if stray:
+        # Fuera de los meses con partición (fechas muy pasadas o futuras)
+        logger.warning("[locations] %d filas en %s", stray, DEFAULT_PARTITION)
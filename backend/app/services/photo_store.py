@@ -0,0 +1,239 @@
+# app/services/photo_store.py
+
+import hashlib
+import os
+from dataclasses import dataclass
+from typing import Optional
+from uuid import uuid4
+
+from fastapi import UploadFile
+from fastapi.staticfiles import StaticFiles
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.models import Clockin, User
+from app.services.images import process_photo, output_paths
+from app.services.storage import get_storage, url_for, key_for
+from app.services.uploads import SavedUpload, save_upload, UPLOAD_TMP_DIR, CHUNK_SIZE
+
+# Los ficheros se nombran por el SHA-256 de lo que subió el usuario y se
+# reparten en dos niveles de carpetas (ab/cd/abcd…), así:
+#   - la misma foto subida dos veces se guarda (y se procesa) una sola vez,
+#   - el contenido de una URL no cambia nunca → se puede cachear como immutable,
+#   - ningún directorio acaba con cientos de miles de entradas.
+# Se procesan en UPLOAD_TMP_DIR y el resultado se sube al storage configurado
+# (disco local o S3/MinIO); las claves son relativas a /uploads.
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+CLOCKIN_PREFIX = "clockins"
+PROFILE_PREFIX = "profile_photos"
+# Subidas directas (URL prefirmada) pendientes de procesar: incoming/<user_id>/<uuid>.<ext>
+INCOMING_PREFIX = "incoming"
+
+
+@dataclass
+class StoredPhoto:
+    key: str                      # foto normalizada en el storage
+    thumbnail_key: Optional[str]  # miniatura (None si no se pudo generar)
+    sha256: str                   # hash de la subida original (caché de detecciones)
+    # Si se reutilizó una foto ya guardada, la subida se conserva hasta
+    # confirm_photo (por si un release concurrente la borra antes del commit)
+    upload: Optional[SavedUpload] = None
+
+    @property
+    def url(self) -> str:
+        return url_for(self.key)
+
+    @property
+    def thumbnail_url(self) -> Optional[str]:
+        return url_for(self.thumbnail_key) if self.thumbnail_key else None
+
+
+def _key_stem(prefix: str, digest: str) -> str:
+    return f"{prefix}/{digest[:2]}/{digest[2:4]}/{digest}"
+
+
+def staging_path(ext: str = "") -> str:
+    os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+    return os.path.join(UPLOAD_TMP_DIR, f"{uuid4()}{ext}")
+
+
+def discard_file(path: Optional[str]) -> None:
+    if not path:
+        return
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _store_clockin(saved: SavedUpload) -> StoredPhoto:
+    storage = get_storage()
+    key_stem = _key_stem(CLOCKIN_PREFIX, saved.sha256)
+    out_key, thumb_key = output_paths(key_stem)
+    raw_key = key_stem + os.path.splitext(saved.path)[1]
+
+    # Ya existe: reutilizamos lo guardado (la subida se queda hasta confirm_photo)
+    if storage.exists(out_key) and storage.exists(thumb_key):
+        return StoredPhoto(key=out_key, thumbnail_key=thumb_key, sha256=saved.sha256, upload=saved)
+    if storage.exists(raw_key):
+        return StoredPhoto(key=raw_key, thumbnail_key=None, sha256=saved.sha256, upload=saved)
+
+    # Normalizamos en local (mismo nombre base que la subida) y subimos el resultado
+    local = process_photo(saved.path)
+    if local.thumbnail_path is None:
+        storage.put_file(local.path, raw_key)
+        return StoredPhoto(key=raw_key, thumbnail_key=None, sha256=saved.sha256)
+    storage.put_file(local.thumbnail_path, thumb_key)
+    storage.put_file(local.path, out_key)
+    return StoredPhoto(key=out_key, thumbnail_key=thumb_key, sha256=saved.sha256)
+
+
+def _store_profile(saved: SavedUpload) -> StoredPhoto:
+    storage = get_storage()
+    key = _key_stem(PROFILE_PREFIX, saved.sha256) + os.path.splitext(saved.path)[1]
+    if storage.exists(key):
+        return StoredPhoto(key=key, thumbnail_key=None, sha256=saved.sha256, upload=saved)
+    storage.put_file(saved.path, key)
+    return StoredPhoto(key=key, thumbnail_key=None, sha256=saved.sha256)
+
+
+def profile_photo_name(photo: StoredPhoto) -> str:
+    """Ruta relativa a profile_photos/ (lo que se guarda en User.profile_photo)."""
+    return photo.key[len(PROFILE_PREFIX) + 1:]
+
+
+async def store_clockin_photo(file: UploadFile) -> StoredPhoto:
+    """
+    Guarda una foto de clockin (normalizada + miniatura) con nombre por
+    contenido. Si ya estaba, no se vuelve a escribir ni a procesar.
+    """
+    saved = await save_upload(file, UPLOAD_TMP_DIR)
+    return await run_in_threadpool(_store_clockin, saved)
+
+
+async def store_profile_photo(file: UploadFile) -> StoredPhoto:
+    """
+    Guarda una foto de perfil con nombre por contenido (ver
+    profile_photo_name para el valor de User.profile_photo).
+    """
+    saved = await save_upload(file, UPLOAD_TMP_DIR)
+    return await run_in_threadpool(_store_profile, saved)
+
+
+def incoming_key(user_id, ext: str) -> str:
+    return f"{INCOMING_PREFIX}/{user_id}/{uuid4()}{ext}"
+
+
+def is_incoming_key(key: str, user_id) -> bool:
+    return key.startswith(f"{INCOMING_PREFIX}/{user_id}/") and ".." not in key
+
+
+def store_incoming_clockin_photo(key: str) -> StoredPhoto:
+    """
+    Procesa una foto subida directamente al storage (URL prefirmada): la
+    descarga a UPLOAD_TMP_DIR y la guarda como cualquier otra foto de clockin.
+    El objeto original NO se borra (hay que hacerlo tras actualizar el clockin).
+    Síncrona: se llama desde el worker de Celery.
+    """
+    storage = get_storage()
+    local_path = staging_path(os.path.splitext(key)[1])
+    try:
+        storage.download(key, local_path)
+        digest = hashlib.sha256()
+        with open(local_path, "rb") as f:
+            while chunk := f.read(CHUNK_SIZE):
+                digest.update(chunk)
+        saved = SavedUpload(
+            path=local_path,
+            filename=os.path.basename(local_path),
+            size=os.path.getsize(local_path),
+            sha256=digest.hexdigest(),
+        )
+        return _store_clockin(saved)
+    except BaseException:
+        discard_file(local_path)
+        raise
+
+
+def _lock_photo(db: Session, key: str) -> None:
+    """
+    Lock de Postgres por clave (hasta el commit de db): el "¿alguien la usa
+    aún?" + borrado de release_* y la comprobación de confirm_photo no se
+    pueden intercalar.
+    """
+    db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:key))"), {"key": key})
+
+
+def confirm_photo(db: Session, photo: StoredPhoto) -> None:
+    """
+    Llamar DESPUÉS del commit de la fila que apunta a `photo`. Si se
+    reutilizó una foto ya guardada, un release_* concurrente pudo borrarla
+    antes de ese commit: se comprueba con el lock tomado y, si falta, se
+    vuelve a guardar desde la subida. Luego la subida se descarta.
+    """
+    if photo.upload is None:
+        return
+    try:
+        _lock_photo(db, photo.key)
+        if not get_storage().exists(photo.key):
+            store = _store_profile if photo.key.startswith(PROFILE_PREFIX + "/") else _store_clockin
+            store(photo.upload)
+        db.commit()
+    finally:
+        discard_upload(photo)
+
+
+def discard_upload(photo: StoredPhoto) -> None:
+    """Descarta la subida conservada si la foto al final no se usa."""
+    if photo.upload is not None:
+        discard_file(photo.upload.path)
+        photo.upload = None
+
+
+def release_clockin_photo(
+    db: Session,
+    photo_path: Optional[str],
+    thumbnail_path: Optional[str] = None,
+) -> None:
+    """
+    Borra del storage la foto (y su miniatura) si ningún clockin la referencia
+    ya. Llamar DESPUÉS de hacer commit del borrado/cambio del clockin.
+    """
+    if not photo_path:
+        return
+    _lock_photo(db, key_for(photo_path))
+    refs = db.query(func.count(Clockin.id)).filter(Clockin.photo_path == photo_path).scalar()
+    if not refs:
+        storage = get_storage()
+        storage.delete(key_for(photo_path))
+        if thumbnail_path:
+            storage.delete(key_for(thumbnail_path))
+    db.commit()
+
+
+def release_profile_photo(db: Session, profile_photo: Optional[str]) -> None:
+    """
+    Igual que release_clockin_photo, para User.profile_photo.
+    """
+    if not profile_photo:
+        return
+    key = f"{PROFILE_PREFIX}/{profile_photo}"
+    _lock_photo(db, key)
+    refs = db.query(func.count(User.id)).filter(User.profile_photo == profile_photo).scalar()
+    if not refs:
+        get_storage().delete(key)
+    db.commit()
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """
+    StaticFiles (que ya envía ETag/Last-Modified y responde 304) con
+    Cache-Control immutable: una URL bajo /uploads nunca cambia de contenido.
+    """
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = CACHE_CONTROL
+        return response
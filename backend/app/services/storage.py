@@ -0,0 +1,223 @@
+# app/services/storage.py
+
+import base64
+import hashlib
+import hmac
+import io
+import os
+import mimetypes
+import mmap
+import shutil
+import tempfile
+import time
+from functools import lru_cache
+from typing import BinaryIO, Dict, Any, Optional
+from urllib.parse import quote
+
+# Backend de almacenamiento de ficheros subidos: "local" (carpeta uploads/,
+# servida por el mount /uploads) o "s3" (S3 o compatible: MinIO, R2, …).
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local").lower()
+
+# Local
+LOCAL_STORAGE_ROOT = os.getenv("LOCAL_STORAGE_ROOT", "uploads")
+# Sin valor por defecto: con una clave conocida cualquiera podría firmarse
+# un PUT /storage/direct/<key>. La API no arranca sin ella (main.py).
+STORAGE_SIGNING_KEY = os.getenv("STORAGE_SIGNING_KEY")
+
+# S3 / MinIO
+S3_BUCKET = os.getenv("S3_BUCKET", "clockin-uploads")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")            # p.ej. http://minio:9000
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+S3_PUBLIC_URL = os.getenv("S3_PUBLIC_URL")                # base pública (CDN) si el bucket es público
+
+PRESIGN_EXPIRES = int(os.getenv("STORAGE_PRESIGN_EXPIRES", "900"))
+# Objetos S3 de hasta este tamaño se leen en memoria; los mayores, a disco
+SPOOL_MAX_BYTES = 4 * 1024 * 1024
+
+# Todas las URLs que guardamos en la BD tienen la forma /uploads/<key>, sea
+# cual sea el backend; con S3 esa ruta redirige al objeto (ver main.py).
+URL_PREFIX = "/uploads/"
+
+
+def url_for(key: str) -> str:
+    return URL_PREFIX + key
+
+
+def key_for(url: str) -> str:
+    """/uploads/clockins/x.jpg → clockins/x.jpg"""
+    return url[len(URL_PREFIX):] if url.startswith(URL_PREFIX) else url.lstrip("/")
+
+
+class Storage:
+    """
+    Interfaz mínima que usan photo_store y el worker. Las claves son rutas
+    relativas con "/" (clockins/ab/cd/<hash>.jpg).
+    """
+
+    def put_file(self, local_path: str, key: str, content_type: Optional[str] = None) -> None:
+        """Mueve un fichero local al almacenamiento (el local deja de existir)."""
+        raise NotImplementedError
+
+    def put_bytes(self, data: bytes, key: str, content_type: Optional[str] = None) -> None:
+        fd, tmp_path = tempfile.mkstemp()
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        self.put_file(tmp_path, key, content_type)
+
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def open(self, key: str) -> BinaryIO:
+        """
+        Fichero de solo lectura (binario, con seek) con el contenido del
+        objeto, sin cargarlo entero en memoria. Usar con `with`.
+        """
+        raise NotImplementedError
+
+    def download(self, key: str, local_path: str) -> None:
+        raise NotImplementedError
+
+    def public_url(self, key: str) -> str:
+        """URL desde la que el navegador puede descargar el objeto."""
+        raise NotImplementedError
+
+    def presign_upload(self, key: str, content_type: str, expires: int = PRESIGN_EXPIRES) -> Dict[str, Any]:
+        """
+        Datos para que el cliente suba el fichero directamente (sin pasar por
+        la API): {"url", "method", "headers"}.
+        """
+        raise NotImplementedError
+
+
+class LocalStorage(Storage):
+    def __init__(self, root: str = LOCAL_STORAGE_ROOT):
+        self.root = root
+
+    def path(self, key: str) -> str:
+        path = os.path.normpath(os.path.join(self.root, key))
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise ValueError(f"Invalid storage key: {key}")
+        return path
+
+    def put_file(self, local_path, key, content_type=None):
+        dest = self.path(key)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        # os.replace es atómico si staging y destino están en el mismo disco
+        try:
+            os.replace(local_path, dest)
+        except OSError:
+            shutil.move(local_path, dest)
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def open(self, key):
+        # mmap: el SO pagina el fichero bajo demanda, sin copiarlo al heap
+        with open(self.path(key), "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return io.BytesIO()
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def download(self, key, local_path):
+        shutil.copyfile(self.path(key), local_path)
+
+    def public_url(self, key):
+        return url_for(key)
+
+    # — Sustituto local de las URLs prefirmadas de S3 —
+    # La "URL prefirmada" apunta a PUT /storage/direct/<key> de la propia API,
+    # firmada con HMAC; así el flujo del cliente es el mismo en ambos backends.
+    @staticmethod
+    def sign(key: str, expires_at: int) -> str:
+        msg = f"{key}:{expires_at}".encode()
+        digest = hmac.new(STORAGE_SIGNING_KEY.encode(), msg, hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest).decode().rstrip("=")
+
+    @classmethod
+    def verify(cls, key: str, expires_at: int, signature: str) -> bool:
+        if expires_at < time.time():
+            return False
+        return hmac.compare_digest(cls.sign(key, expires_at), signature)
+
+    def presign_upload(self, key, content_type, expires=PRESIGN_EXPIRES):
+        expires_at = int(time.time()) + expires
+        sig = self.sign(key, expires_at)
+        return {
+            "url": f"/storage/direct/{quote(key)}?expires={expires_at}&signature={sig}",
+            "method": "PUT",
+            "headers": {"Content-Type": content_type},
+        }
+
+
+class S3Storage(Storage):
+    def __init__(self, bucket: str = S3_BUCKET):
+        import boto3  # dependencia opcional, solo con STORAGE_BACKEND=s3
+
+        self.bucket = bucket
+        self.client = boto3.client("s3", endpoint_url=S3_ENDPOINT_URL, region_name=S3_REGION)
+
+    def put_file(self, local_path, key, content_type=None):
+        # Las claves que escribe la API son por contenido (o uuid): nunca cambian
+        extra = {
+            "ContentType": content_type or mimetypes.guess_type(key)[0] or "application/octet-stream",
+            "CacheControl": "public, max-age=31536000, immutable",
+        }
+        self.client.upload_file(local_path, self.bucket, key, ExtraArgs=extra)
+        os.remove(local_path)
+
+    def exists(self, key):
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError as exc:
+            if exc.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def open(self, key):
+        # Se descarga por trozos a un temporal (en memoria si es pequeño);
+        # el Body de get_object no admite seek, que necesita Pillow
+        f = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+        self.client.download_fileobj(self.bucket, key, f)
+        f.seek(0)
+        return f
+
+    def download(self, key, local_path):
+        self.client.download_file(self.bucket, key, local_path)
+
+    def public_url(self, key):
+        if S3_PUBLIC_URL:
+            return f"{S3_PUBLIC_URL.rstrip('/')}/{quote(key)}"
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": key}, ExpiresIn=PRESIGN_EXPIRES
+        )
+
+    def presign_upload(self, key, content_type, expires=PRESIGN_EXPIRES):
+        url = self.client.generate_presigned_url(
+            "put_object",
+            Params={"Bucket": self.bucket, "Key": key, "ContentType": content_type},
+            ExpiresIn=expires,
+        )
+        return {"url": url, "method": "PUT", "headers": {"Content-Type": content_type}}
+
+
+@lru_cache(maxsize=1)
+def get_storage() -> Storage:
+    """Backend configurado (uno por proceso)."""
+    if STORAGE_BACKEND == "s3":
+        return S3Storage()
+    return LocalStorage()
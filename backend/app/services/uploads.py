@@ -0,0 +1,81 @@
+# app/services/uploads.py
+
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+from uuid import uuid4
+
+from fastapi import HTTPException, UploadFile, status
+from starlette.concurrency import run_in_threadpool
+
+# Carpeta local donde se vuelcan las subidas antes de procesarlas y pasarlas
+# al storage (ver services/storage.py). Nunca dentro de uploads/: todo lo
+# que hay ahí se sirve en /uploads, incluidos los .part a medio escribir.
+# Con el storage local, en el mismo disco que uploads/ el paso final es un
+# simple rename; si no, una copia.
+UPLOAD_TMP_DIR = os.getenv("UPLOAD_TMP_DIR", os.path.join(tempfile.gettempdir(), "clockin-uploads"))
+
+# Tamaño máximo aceptado por fichero y tamaño de cada trozo leído/escrito
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "15")) * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass
+class SavedUpload:
+    path: str        # ruta en disco, p.ej. /tmp/clockin-uploads/<uuid>.jpg
+    filename: str    # solo el nombre, p.ej. <uuid>.jpg
+    size: int        # bytes escritos
+    sha256: str      # hash del contenido, calculado mientras se escribe
+
+
+def _write_chunk(out, digest, chunk: bytes) -> None:
+    digest.update(chunk)
+    out.write(chunk)
+
+
+def _discard(out, tmp_path: str) -> None:
+    out.close()
+    try:
+        os.remove(tmp_path)
+    except FileNotFoundError:
+        pass
+
+
+async def save_upload(
+    file: UploadFile,
+    directory: str = UPLOAD_TMP_DIR,
+    max_bytes: int = MAX_UPLOAD_BYTES,
+) -> SavedUpload:
+    """
+    Vuelca un UploadFile a `directory` por trozos, sin cargarlo entero en
+    memoria y sin bloquear el event loop (la escritura y el hash van al
+    threadpool). Escribe en un .part y lo renombra al terminar, así nunca
+    queda un fichero a medias con el nombre final.
+    Lanza 413 si el fichero supera max_bytes.
+    """
+    ext = os.path.splitext(file.filename or "")[1].lower()
+    fname = f"{uuid4()}{ext}"
+    path = os.path.join(directory, fname)
+    tmp_path = f"{path}.part"
+
+    await run_in_threadpool(os.makedirs, directory, exist_ok=True)
+    out = await run_in_threadpool(open, tmp_path, "wb")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        while chunk := await file.read(CHUNK_SIZE):
+            size += len(chunk)
+            if size > max_bytes:
+                raise HTTPException(
+                    status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    f"File exceeds {max_bytes // (1024 * 1024)} MB",
+                )
+            await run_in_threadpool(_write_chunk, out, digest, chunk)
+    except BaseException:
+        await run_in_threadpool(_discard, out, tmp_path)
+        raise
+
+    await run_in_threadpool(out.close)
+    await run_in_threadpool(os.replace, tmp_path, path)
+    return SavedUpload(path=path, filename=fname, size=size, sha256=digest.hexdigest())
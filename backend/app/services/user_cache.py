@@ -0,0 +1,91 @@
+# app/services/user_cache.py
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+from uuid import UUID
+
+from app.models import User, RoleEnum
+
+
+@dataclass(frozen=True)
+class CachedUser:
+    """
+    Copia de solo lectura de un User (sin el hash de la contraseña),
+    desacoplada de la sesión de SQLAlchemy para poder reutilizarla
+    entre peticiones.
+    """
+    id: UUID
+    username: str
+    email: Optional[str]
+    role: RoleEnum
+    created_at: Optional[datetime]
+    profile_photo: Optional[str]
+
+    @classmethod
+    def from_model(cls, user: User) -> "CachedUser":
+        return cls(
+            id=user.id,
+            username=user.username,
+            email=user.email,
+            role=user.role,
+            created_at=user.created_at,
+            profile_photo=user.profile_photo,
+        )
+
+
+class UserCache:
+    """
+    Caché LRU con TTL de usuarios autenticados, por proceso.
+
+    Las entradas caducan a los `ttl` segundos; cuando se supera `maxsize`
+    se descarta la menos usada. Las rutas que modifican o borran usuarios
+    deben llamar a invalidate(user_id).
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[UUID, tuple[float, CachedUser]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: UUID) -> Optional[CachedUser]:
+        with self._lock:
+            item = self._data.get(user_id)
+            if item is None:
+                return None
+            expires, user = item
+            if expires < time.monotonic():
+                del self._data[user_id]
+                return None
+            self._data.move_to_end(user_id)
+            return user
+
+    def set(self, user: User) -> CachedUser:
+        cached = CachedUser.from_model(user)
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return cached
+        with self._lock:
+            self._data[cached.id] = (time.monotonic() + self.ttl, cached)
+            self._data.move_to_end(cached.id)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return cached
+
+    def invalidate(self, user_id: UUID) -> None:
+        with self._lock:
+            self._data.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+user_cache = UserCache(
+    maxsize=int(os.getenv("USER_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("USER_CACHE_TTL", "60")),
+)
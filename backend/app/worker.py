@@ -1,76 +1,284 @@
 # backend/app/worker.py
 
 from celery import Celery
-import torch
-from PIL import Image
-import io
+from celery.signals import worker_process_init
+from celery_batches import Batches, SimpleRequest
+from contextlib import ExitStack
+import hashlib
+import logging
 import os
-from uuid import uuid4
+from typing import Any, BinaryIO, Dict, List, Union
+from uuid import UUID
 
-# Configuración de Celery
+from app.database import SessionLocal
+from app.models import Clockin
+from app.crud.clockins import start_clockin_detection, apply_clockin_detections
+from app.services.inference import get_detector, normalize_label, DetectionResult, ImageSource
+from app.services.storage import get_storage, url_for
+from app.services.detection_events import REDIS_URL, publish_detection_event
+from app.services.detection_queue import release_detections
+from app.services.detection_cache import get_cached_labels, cache_labels
+from app.services.uploads import CHUNK_SIZE
+from app.services.photo_store import (
+    store_incoming_clockin_photo,
+    release_clockin_photo,
+    confirm_photo,
+    discard_upload,
+)
+
+logger = logging.getLogger(__name__)
+
+# Configuración de Celery (por defecto broker y resultados en REDIS_URL)
+CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", REDIS_URL)
+CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", REDIS_URL)
 celery_app = Celery(
     "tasks",
-    broker="redis://localhost:6379/0",
-    backend="redis://localhost:6379/0"
+    broker=CELERY_BROKER_URL,
+    backend=CELERY_RESULT_BACKEND,
 )
 
-# Carpeta donde volcar las imágenes de clockin
-UPLOAD_DIR = "uploads/clockins"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-
-# Carga el modelo YOLOv5 (tu peso custom)
-# model = torch.hub.load(
-#     "ultralytics/yolov5",
-#     "custom",
-#     path="yolov5/epp-detector/exp8/weights/best.pt",
-#     force_reload=False,
-# )
-
-def save_uploaded_image(image_bytes: bytes) -> str:
-    """Guarda la imagen y devuelve la ruta relativa."""
-    fname = f"{uuid4()}.jpg"
-    path = os.path.join(UPLOAD_DIR, fname)
-    with open(path, "wb") as f:
-        f.write(image_bytes)
-    return f"/uploads/clockins/{fname}"
-
-@celery_app.task(bind=True, name="app.worker.run_detection")
-def run_detection(self, image_bytes: bytes, user_id: str):
+# La detección va a su propia cola para poder darle un pool de workers
+# dedicado (celery -A app.worker worker -Q detection -c N), separado de las
+# tareas ligeras (finalize_clockin_photo, en la cola por defecto). Dentro de
+# la cola, prioridad 0 = más urgente (ver services.detection_queue).
+DETECTION_QUEUE = os.getenv("DETECTION_QUEUE", "detection")
+# Procesos por worker (0 = uno por núcleo); con EPP_THREADS > 0 conviene
+# EPP_WORKER_CONCURRENCY * EPP_THREADS <= núcleos
+EPP_WORKER_CONCURRENCY = int(os.getenv("EPP_WORKER_CONCURRENCY", "0"))
+celery_app.conf.task_routes = {"app.worker.run_detection": {"queue": DETECTION_QUEUE}}
+celery_app.conf.broker_transport_options = {
+    "queue_order_strategy": "priority",
+    "priority_steps": list(range(10)),
+}
+if EPP_WORKER_CONCURRENCY > 0:
+    celery_app.conf.worker_concurrency = EPP_WORKER_CONCURRENCY
+
+# Micro-lotes de detección: como mucho EPP_BATCH_SIZE imágenes por pasada, o
+# las que se hayan juntado en EPP_BATCH_INTERVAL_MS. El worker tiene que poder
+# tener en memoria un lote completo sin confirmar → prefetch >= tamaño de lote.
+EPP_BATCH_SIZE = int(os.getenv("EPP_BATCH_SIZE", "8"))
+EPP_BATCH_INTERVAL_MS = int(os.getenv("EPP_BATCH_INTERVAL_MS", "100"))
+celery_app.conf.worker_prefetch_multiplier = max(EPP_BATCH_SIZE, 4)
+# Los resultados son pequeños ({clockin_id, approved}) y caducan: nadie
+# consulta el estado de una detección pasada una hora
+celery_app.conf.result_expires = int(os.getenv("CELERY_RESULT_EXPIRES", "3600"))
+
+# El modelo se carga una vez por proceso de Celery, al arrancar (prefork: en
+# cada hijo, después del fork) y con una inferencia de calentamiento.
+@worker_process_init.connect
+def load_detector(**_):
+    try:
+        get_detector().warmup()
+    except Exception:
+        logger.exception("[detect] no se pudo cargar el modelo EPP")
+
+def _persist_all(detected: List[tuple], results: Dict[str, Any]) -> None:
+    """
+    Guarda el resultado de cada petición detectada ((req, payload, resultado)).
+    El resultado de la tarea es mínimo (id del clockin + approved): el resto
+    se lee de la BD al consultar el estado, así el backend de resultados no
+    crece con cada detección.
+
+    - Con clockin_id en el payload (aprobación diferida: el clockin ya existe
+      con approved=None) se actualizan todos los del lote de una vez.
+    - Sin él, se crea el clockin con sus detecciones (start_clockin_detection).
+    """
+    for req, payload, result in detected:
+        found = {normalize_label(d["name"]) for d in result.labels}
+        logger.info("[detect] user=%s found=%s approved=%s", payload['user_id'], found, result.approved)
+
+    deferred = [(req, payload, result) for req, payload, result in detected if payload.get("clockin_id")]
+    db = SessionLocal()
     try:
-        # --- 1) Prepara la imagen ---
-        img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-
-        # --- 2) Inferencia con threshold más bajo ---
-        # results = model(img, conf=0.3, iou=0.45)
-        # labels = results.pandas().xyxy[0].to_dict(orient="records")
-        labels = []
-
-        # --- 3) Normaliza nombres de clase ---
-        found = {
-            d["name"].lower().replace(" ", "_")
-            for d in labels
-        }
-
-        # --- 4) Nueva lógica de aprobación ---
-        # Si aparece alguna clase que empieza por "not_", rechazamos.
-        has_negative = any(name.startswith("not_") for name in found)
-        approved = not has_negative
-
-        # --- 5) Log interno para depurar ---
-        print(f"[detect] user={user_id} found={found} approved={approved}")
-
-        # --- 6) Guarda la foto y devuelve la ruta ---
-        photo_path = save_uploaded_image(image_bytes)
-
-        return {
-            "status":     "success",
-            "detection":  labels,
-            "approved":   approved,
-            "photo_path": photo_path
-        }
-
-    except Exception as e:
-        return {
-            "status": "failed",
-            "error":  str(e)
-        }
+        if deferred:
+            try:
+                updated = apply_clockin_detections(db, {
+                    UUID(payload["clockin_id"]): {"approved": result.approved, "detection": result.labels}
+                    for _, payload, result in deferred
+                })
+            except Exception as exc:
+                db.rollback()
+                for req, _, _ in deferred:
+                    results[req.id] = exc
+            else:
+                for req, payload, result in deferred:
+                    if UUID(payload["clockin_id"]) in updated:
+                        results[req.id] = {"clockin_id": payload["clockin_id"], "approved": result.approved}
+                    else:
+                        results[req.id] = ValueError("Clockin eliminado o ya resuelto")
+
+        for req, payload, result in detected:
+            if payload.get("clockin_id"):
+                continue
+            try:
+                clk = start_clockin_detection(db, {
+                    **payload,
+                    "photo_path": payload.get("photo_path") or url_for(payload["photo_key"]),
+                    "detection":  result.labels,
+                    "approved":   result.approved,
+                })
+                results[req.id] = {"clockin_id": str(clk.id), "approved": clk.approved}
+            except Exception as exc:
+                db.rollback()
+                results[req.id] = exc
+    finally:
+        db.close()
+
+
+def _from_cache(model_version: str, items: List[tuple], detected: List[tuple]) -> List[tuple]:
+    """
+    Resuelve con la caché de detecciones las peticiones de `items` (tuplas
+    que empiezan por (req, payload, …)) cuya foto ya se detectó con este
+    modelo, añadiéndolas a `detected`; devuelve las que sí hay que pasar por
+    el modelo.
+    """
+    cached = get_cached_labels(
+        model_version, [item[1]["photo_sha256"] for item in items if item[1].get("photo_sha256")],
+    )
+    misses = []
+    for item in items:
+        req, payload = item[0], item[1]
+        labels = cached.get(payload.get("photo_sha256"))
+        if labels is None:
+            misses.append(item)
+            continue
+        logger.info("[detect] %s resuelta con la caché", req.id)
+        detected.append((req, payload, DetectionResult(labels=labels)))
+    return misses
+
+
+def _sha256(image: BinaryIO) -> str:
+    """Hash de una foto abierta con storage.open (y se vuelve al principio)."""
+    digest = hashlib.sha256()
+    while chunk := image.read(CHUNK_SIZE):
+        digest.update(chunk)
+    image.seek(0)
+    return digest.hexdigest()
+
+
+def _detect_all(images: List[ImageSource]) -> List[Union[DetectionResult, Exception]]:
+    """
+    Un único forward para todo el lote; si falla (p.ej. una imagen corrupta)
+    se repite imagen a imagen para que solo falle la petición culpable.
+    """
+    detector = get_detector()
+    try:
+        return detector.detect_batch(images)
+    except Exception:
+        logger.exception("[detect] falló el lote de %d; se reintenta una a una", len(images))
+    results: List[Union[DetectionResult, Exception]] = []
+    for image in images:
+        try:
+            results.append(detector.detect(image))
+        except Exception as exc:
+            results.append(exc)
+    return results
+
+
+@celery_app.task(
+    base=Batches,
+    name="app.worker.run_detection",
+    flush_every=EPP_BATCH_SIZE,
+    flush_interval=EPP_BATCH_INTERVAL_MS / 1000,
+)
+def run_detection(requests: List[SimpleRequest]):
+    """
+    Detección EPP + alta del clockin, en micro-lotes: el worker junta hasta
+    EPP_BATCH_SIZE peticiones (o las que lleguen en EPP_BATCH_INTERVAL_MS),
+    las pasa por el modelo de una vez y guarda el resultado de cada una con
+    su propio task_id, que es lo que consulta get_detection_status.
+
+    Cada petición se encola con run_detection.delay(payload), con el payload
+    de services.detection.enqueue_detection: user_id, project_id, latitude,
+    longitude, postal_code, photo_path / thumbnail_path y photo_key, la clave
+    de la foto en el storage (la imagen NO viaja por Redis); con clockin_id
+    el clockin ya existe (aprobación diferida) y solo se le pone approved y
+    las detecciones, en bloque para todo el lote. Con photo_sha256
+    se consulta antes la caché de detecciones (services.detection_cache): una
+    foto repetida se resuelve sin abrirla ni pasarla por el modelo.
+    """
+    storage = get_storage()
+    detector = get_detector()
+    results: Dict[str, Union[Dict[str, Any], Exception]] = {}
+    detected: List[tuple] = []
+    payloads = {req.id: dict(req.args[0]) for req in requests}
+
+    # Fotos ya vistas con este modelo (reintentos): ni se abren ni se infieren
+    pending = _from_cache(detector.version, [(req, payloads[req.id]) for req in requests], detected)
+
+    with ExitStack() as stack:
+        # Abrimos cada foto sin leerla entera (mmap en local, por trozos en S3)
+        batch, hashed = [], []
+        for req, payload in pending:
+            try:
+                image = stack.enter_context(storage.open(payload["photo_key"]))
+                if payload.get("photo_sha256"):
+                    batch.append((req, payload, image))
+                else:
+                    payload["photo_sha256"] = _sha256(image)
+                    hashed.append((req, payload, image))
+            except Exception as exc:
+                results[req.id] = exc
+        # Las que no traían hash se consultan ahora, con el calculado aquí
+        batch += _from_cache(detector.version, hashed, detected)
+
+        detections = _detect_all([image for _, _, image in batch]) if batch else []
+
+    cache_labels(detector.version, {
+        payload["photo_sha256"]: detection.labels
+        for (_, payload, _), detection in zip(batch, detections)
+        if not isinstance(detection, Exception)
+    })
+
+    for (req, payload, _), detection in zip(batch, detections):
+        if isinstance(detection, Exception):
+            results[req.id] = detection
+        else:
+            detected.append((req, payload, detection))
+    _persist_all(detected, results)
+
+    release_detections(req.id for req in requests)
+    for req in requests:
+        out = results[req.id]
+        if isinstance(out, Exception):
+            celery_app.backend.mark_as_failure(req.id, out, request=req, call_errbacks=False)
+            event = {"status": "failed", "error": str(out)}
+        else:
+            celery_app.backend.mark_as_done(req.id, out, request=req)
+            event = {"status": "completed", **out}
+        # Aviso a los clientes esperando por SSE (/detection/task-events/{id})
+        try:
+            publish_detection_event(req.id, event)
+        except Exception:
+            logger.exception("[detect] no se pudo publicar el resultado de %s", req.id)
+
+
+@celery_app.task(name="app.worker.finalize_clockin_photo")
+def finalize_clockin_photo(clockin_id: str, key: str):
+    """
+    Termina una subida directa (URL prefirmada): normaliza la foto, la guarda
+    por contenido, apunta el clockin a ella y borra el objeto incoming/.
+    Mientras tanto el clockin sigue mostrando el original.
+    """
+    photo = store_incoming_clockin_photo(key)
+    db = SessionLocal()
+    try:
+        clk = db.get(Clockin, UUID(clockin_id))
+        if clk is None:
+            # El clockin se borró entretanto
+            release_clockin_photo(db, photo.url, photo.thumbnail_url)
+        elif clk.photo_path == url_for(key):
+            clk.photo_path = photo.url
+            clk.thumbnail_path = photo.thumbnail_url
+            db.commit()
+            confirm_photo(db, photo)
+        else:
+            # El clockin ya apunta a otra foto
+            release_clockin_photo(db, photo.url, photo.thumbnail_url)
+    finally:
+        discard_upload(photo)
+        db.close()
+
+    get_storage().delete(key)
+    logger.info("[storage] clockin=%s %s -> %s", clockin_id, key, photo.key)
+    return {"photo_path": photo.url, "thumbnail_path": photo.thumbnail_url}
@@ -0,0 +1,133 @@
+# backend/scripts/benchmark_backends.py
+"""
+Compara los backends del detector EPP en CPU: latencia (p50/p95 por lote),
+throughput (imágenes/s), tiempo de carga y memoria (RSS máxima).
+
+    cd backend
+    python -m scripts.benchmark_backends \
+        --model torch:yolov5/epp-detector/exp8/weights/best.pt \
+        --model onnx:yolov5/epp-detector/exp8/weights/best.onnx \
+        --model onnx:yolov5/epp-detector/exp8/weights/best_int8.onnx \
+        --batch-sizes 1 8 --json bench.json
+
+Cada modelo se mide en un proceso aparte, para que la RSS de uno (torch
+carga cientos de MB) no contamine la de otro.
+"""
+
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from app.services.evaluation import peak_rss_mb
+from app.services.inference import EPP_MODEL_PATH, EPP_ONNX_PATH, EPP_DATA_YAML, EPPDetector
+
+
+def _default_models():
+    int8 = os.path.splitext(EPP_ONNX_PATH)[0] + "_int8.onnx"
+    models = [f"torch:{EPP_MODEL_PATH}", f"onnx:{EPP_ONNX_PATH}", f"onnx:{int8}"]
+    return [m for m in models if os.path.exists(m.split(":", 1)[1])]
+
+
+def run_one(model: str, images_dir: str, n: int, batch_sizes, warmup: int) -> dict:
+    """Mide un modelo en ESTE proceso."""
+    backend, path = model.split(":", 1)
+    paths = sorted(glob.glob(os.path.join(images_dir, "*.jpg")))[:n]
+    images = []
+    for p in paths:
+        with open(p, "rb") as f:
+            images.append(f.read())
+    rss_before = peak_rss_mb()
+
+    t0 = time.perf_counter()
+    detector = EPPDetector(backend=backend, model_path=path)
+    detector.warmup()
+    load_ms = (time.perf_counter() - t0) * 1000
+
+    report = {
+        "model": model,
+        "images": len(images),
+        "load_ms": round(load_ms, 1),
+        "rss_before_mb": round(rss_before, 1),
+        "batches": {},
+    }
+    for bs in batch_sizes:
+        batches = [images[i:i + bs] for i in range(0, len(images), bs)]
+        for batch in batches[:warmup]:
+            detector.detect_batch(batch)
+
+        latencies, stages = [], {}
+        start = time.perf_counter()
+        for batch in batches:
+            t = time.perf_counter()
+            results = detector.detect_batch(batch)
+            latencies.append((time.perf_counter() - t) * 1000)
+            for k, v in results[0].timings.items():
+                stages.setdefault(k, []).append(v)
+        elapsed = time.perf_counter() - start
+
+        report["batches"][str(bs)] = {
+            "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+            "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+            "images_per_s": round(len(images) / elapsed, 2),
+            "stages_mean_ms": {
+                k: round(float(np.mean(v)), 2) for k, v in stages.items() if k != "batch_size"
+            },
+        }
+    report["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark de backends del detector EPP")
+    parser.add_argument("--model", action="append", help="backend:ruta (repetible)")
+    parser.add_argument(
+        "--images",
+        default=os.path.join(os.path.dirname(EPP_DATA_YAML), "valid", "images"),
+    )
+    parser.add_argument("-n", type=int, default=64, help="nº de imágenes")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--warmup", type=int, default=2, help="lotes de calentamiento")
+    parser.add_argument("--json", help="guarda el informe en este fichero")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    models = args.model or _default_models()
+    if not models:
+        raise SystemExit("No hay modelos: usa --model backend:ruta")
+
+    if args.child:
+        print(json.dumps(run_one(models[0], args.images, args.n, args.batch_sizes, args.warmup)))
+        return
+
+    reports = []
+    for model in models:
+        cmd = [
+            sys.executable, "-m", "scripts.benchmark_backends", "--child",
+            "--model", model, "--images", args.images, "-n", str(args.n),
+            "--warmup", str(args.warmup), "--batch-sizes", *map(str, args.batch_sizes),
+        ]
+        out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+        reports.append(json.loads(out.strip().splitlines()[-1]))
+
+    print(f"{'modelo':<60} {'lote':>4} {'p50 ms':>9} {'p95 ms':>9} {'img/s':>8} {'RSS MB':>8}")
+    for r in reports:
+        for bs, b in r["batches"].items():
+            print(
+                f"{r['model'][-60:]:<60} {bs:>4} {b['p50_ms']:>9.1f} {b['p95_ms']:>9.1f}"
+                f" {b['images_per_s']:>8.1f} {r['peak_rss_mb']:>8.0f}"
+            )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(reports, f, indent=2)
+        print(f"Informe: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
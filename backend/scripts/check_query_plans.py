@@ -0,0 +1,254 @@
+# backend/scripts/check_query_plans.py
+"""
+Comprueba con EXPLAIN que las consultas de los endpoints principales usan
+índices (ninguna lectura secuencial de las tablas grandes) sobre un volumen
+de datos realista.
+
+Genera usuarios, proyectos, clockins, historiales, ubicaciones, detecciones
+y el rollup de horas dentro de una transacción, ejecuta las consultas (las
+de crud tal cual; las que viven en las rutas, reproducidas aquí), pide el
+plan de cada sentencia ejecutada y al final deshace todo (ROLLBACK): se
+puede lanzar contra cualquier base con el esquema al día.
+
+    cd backend
+    python -m scripts.check_query_plans --clockins 200000
+
+Sale con código 1 si alguna consulta hace Seq Scan sobre sus tablas.
+"""
+
+import argparse
+import re
+import sys
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Tuple
+
+from sqlalchemy import event, func, select, text, true
+from sqlalchemy.orm import Session
+
+from app.crud.clockin_history import list_history
+from app.crud.clockins import get_monthly_hours, summary_query
+from app.crud.project_history import list_project_history
+from app.database import engine
+from app.services.location_partitions import ensure_location_partitions, is_partitioned
+from app.models import (
+    Clockin,
+    ClockinDailyHours,
+    ClockinHistory,
+    Detection,
+    Project,
+    ProjectHistory,
+    User,
+    UserLocation,
+)
+
+SEED = [
+    # Datos reproducibles: mismo plan en cada ejecución
+    "SELECT setseed(0.42)",
+    """
+    INSERT INTO users (id, username, password, role)
+    SELECT gen_random_uuid(), 'plan_user_' || i, 'x', 'field'
+    FROM generate_series(1, :users) i
+    """,
+    """
+    INSERT INTO projects (id, name, status, start_date)
+    SELECT gen_random_uuid(), 'plan_project_' || i, 'in_progress', now()
+    FROM generate_series(1, :projects) i
+    """,
+    """
+    WITH u AS (SELECT array_agg(id) AS ids FROM users WHERE username LIKE 'plan_user_%'),
+         p AS (SELECT array_agg(id) AS ids FROM projects WHERE name LIKE 'plan_project_%'),
+         s AS (SELECT i, now() - random() * interval '730 days' AS ts FROM generate_series(1, :clockins) i)
+    INSERT INTO clockins (id, user_id, project_id, start_time, end_time, status, photo_path, approved, created_at)
+    SELECT gen_random_uuid(),
+           u.ids[1 + (random() * (cardinality(u.ids) - 1))::int],
+           p.ids[1 + (random() * (cardinality(p.ids) - 1))::int],
+           s.ts,
+           CASE WHEN s.i % 20 = 0 THEN NULL ELSE s.ts + random() * interval '9 hours' END,
+           CASE WHEN s.i % 20 = 0 THEN 'in_progress' ELSE 'completed' END,
+           '/uploads/clockins/plan/' || s.i || '.jpg',
+           CASE WHEN s.i % 500 = 0 THEN NULL ELSE true END,
+           s.ts
+    FROM s, u, p
+    """,
+    """
+    INSERT INTO clockin_history (id, clockin_id, user_id, project_id, state, city, street, street_number, postal_code, created_at)
+    SELECT gen_random_uuid(), id, user_id, project_id, 's', 'c', 'st', '1', '0', start_time
+    FROM clockins WHERE photo_path LIKE '/uploads/clockins/plan/%'
+    """,
+    """
+    INSERT INTO project_history (id, project_id, user_id, clockin_id, date, status)
+    SELECT gen_random_uuid(), project_id, user_id, id, start_time, 'in_progress'
+    FROM clockins WHERE photo_path LIKE '/uploads/clockins/plan/%'
+    """,
+    """
+    INSERT INTO user_locations (id, user_id, clockin_id, latitude, longitude, timestamp)
+    SELECT gen_random_uuid(), c.user_id, c.id, random() * 90, random() * 180, c.start_time + g * interval '1 hour'
+    FROM clockins c, generate_series(0, 1) g
+    WHERE c.photo_path LIKE '/uploads/clockins/plan/%'
+    """,
+    """
+    INSERT INTO detections (id, clockin_id, label, confidence)
+    SELECT gen_random_uuid(), id, 'helmet', 0.9
+    FROM clockins WHERE photo_path LIKE '/uploads/clockins/plan/%'
+    """,
+    """
+    INSERT INTO clockin_daily_hours (id, user_id, project_id, day, seconds, clockins)
+    SELECT gen_random_uuid(), user_id, project_id, (start_time AT TIME ZONE 'UTC')::date,
+           SUM(EXTRACT(EPOCH FROM end_time - start_time)), COUNT(*)
+    FROM clockins
+    WHERE end_time IS NOT NULL AND photo_path LIKE '/uploads/clockins/plan/%'
+    GROUP BY 2, 3, 4
+    """,
+]
+
+ANALYZED = [
+    "users", "projects", "clockins", "clockin_history", "project_history",
+    "user_locations", "detections", "clockin_daily_hours",
+]
+
+
+def _checks(ids: Dict[str, Any]) -> List[Tuple[str, List[str], Callable[[Session], Any]]]:
+    """(endpoint, tablas que no pueden leerse enteras, consulta)."""
+    user, project, clockin = ids["user"], ids["project"], ids["clockin"]
+    latest = (
+        select(UserLocation)
+        .where(UserLocation.user_id == User.id)
+        .order_by(UserLocation.timestamp.desc())
+        .limit(1)
+        .lateral("latest")
+    )
+    return [
+        ("GET /clockins/user/{user_id}", ["clockins"], lambda db: db.execute(
+            select(Clockin, User.username, Project.name)
+            .join(User, Clockin.user_id == User.id)
+            .join(Project, Clockin.project_id == Project.id, isouter=True)
+            .where(Clockin.user_id == user)
+            .order_by(Clockin.start_time.desc())
+        ).all()),
+        ("GET /clockins/{user_id}/chart-data", ["clockin_daily_hours"], lambda db: get_monthly_hours(db, user)),
+        ("GET /summary/{user_id}", ["clockin_daily_hours"], lambda db: db.execute(summary_query(user)).one()),
+        ("GET /projects/{project_id}", ["clockin_daily_hours"], lambda db: db.execute(
+            select(func.sum(ClockinDailyHours.seconds)).where(ClockinDailyHours.project_id == project)
+        ).scalar()),
+        ("PUT /projects/{project_id} (último clockin)", ["clockins"], lambda db: db.execute(
+            select(Clockin)
+            .where(Clockin.project_id == project, Clockin.end_time.isnot(None))
+            .order_by(Clockin.end_time.desc())
+            .limit(1)
+        ).first()),
+        ("release_clockin_photo", ["clockins"], lambda db: db.execute(
+            select(func.count(Clockin.id)).where(Clockin.photo_path == ids["photo_path"])
+        ).scalar()),
+        ("requeue_pending_detections", ["clockins"], lambda db: db.execute(
+            select(Clockin)
+            .where(
+                Clockin.approved.is_(None),
+                Clockin.photo_path.isnot(None),
+                Clockin.created_at <= datetime.utcnow() - timedelta(minutes=2),
+            )
+            .order_by(Clockin.created_at)
+            .limit(100)
+        ).all()),
+        ("GET /clockin_history", ["clockin_history"], lambda db: list_history(db, limit=50)),
+        ("GET /clockin_history/{user_id}", ["clockin_history"], lambda db: list_history(db, user, limit=50)),
+        ("GET /project_history?project_id=", ["project_history", "clockins"],
+         lambda db: list_project_history(db, project_id=project, limit=20)),
+        ("DELETE /clockins/{id} (historiales)", ["clockin_history", "project_history"], lambda db: (
+            db.execute(select(ClockinHistory.id).where(ClockinHistory.clockin_id == clockin)).all(),
+            db.execute(select(ProjectHistory.id).where(ProjectHistory.clockin_id == clockin)).all(),
+        )),
+        ("GET /api/locations/clockin/{clockin_id}", ["user_locations"], lambda db: db.execute(
+            select(UserLocation)
+            .where(
+                UserLocation.clockin_id == clockin,
+                UserLocation.timestamp >= select(Clockin.start_time - timedelta(days=1))
+                .where(Clockin.id == clockin).scalar_subquery(),
+            )
+            .order_by(UserLocation.timestamp.asc())
+        ).all()),
+        ("GET /api/locations/latest", ["user_locations"], lambda db: db.execute(
+            select(latest, User.username).select_from(User).join(latest, true())
+        ).all()),
+        ("detecciones de un clockin", ["detections"], lambda db: db.execute(
+            select(Detection).where(Detection.clockin_id == clockin)
+        ).all()),
+    ]
+
+
+def _plan_nodes(plan: Dict[str, Any]):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _plan_nodes(child)
+
+
+def _reads(plan: Dict[str, Any], table: str) -> bool:
+    # Las tablas particionadas aparecen con el nombre de cada partición
+    return plan.get("Relation Name", "") == table or plan.get("Relation Name", "").startswith(table + "_")
+
+
+def check(conn, checks) -> int:
+    failures = 0
+    for name, tables, run in checks:
+        statements: List[Tuple[str, Any]] = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            statements.append((statement, parameters))
+
+        event.listen(conn, "before_cursor_execute", capture)
+        try:
+            run(Session(bind=conn))
+        finally:
+            event.remove(conn, "before_cursor_execute", capture)
+
+        used, seq = set(), set()
+        # Las tablas vacías (p. ej. particiones de meses futuros) se recorren enteras sin coste
+        empty = set(conn.execute(text("SELECT relname FROM pg_class WHERE relkind = 'r' AND reltuples = 0")).scalars())
+        for statement, parameters in statements:
+            plan = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters).scalar()[0]["Plan"]
+            for node in _plan_nodes(plan):
+                if node.get("Index Name"):
+                    # Un índice por partición: user_locations_2025_01_..._idx → user_locations_*_..._idx
+                    used.add(re.sub(r"_\d{4}_\d{2}_", "_*_", node["Index Name"]))
+                if node["Node Type"] == "Seq Scan" and node["Relation Name"] not in empty \
+                        and any(_reads(node, t) for t in tables):
+                    seq.add(node["Relation Name"])
+        status = "OK " if not seq else "SEQ"
+        failures += bool(seq)
+        detail = f"Seq Scan en {', '.join(sorted(seq))}" if seq else ", ".join(sorted(used)) or "-"
+        print(f"{status} {name:<44} {detail}")
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="EXPLAIN de las consultas principales sobre datos generados")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--projects", type=int, default=200)
+    parser.add_argument("--clockins", type=int, default=100000)
+    args = parser.parse_args()
+
+    with engine.connect() as conn:
+        trans = conn.begin()
+        try:
+            if is_partitioned(conn):
+                # Particiones para los dos años de datos generados (también se deshacen)
+                ensure_location_partitions(conn, today=date.today() - timedelta(days=731), ahead=26)
+            for sql in SEED:
+                conn.execute(text(sql), {"users": args.users, "projects": args.projects, "clockins": args.clockins})
+            for table in ANALYZED:
+                conn.execute(text(f"ANALYZE {table}"))
+            row = conn.execute(text("""
+                SELECT c.user_id, c.project_id, c.id, c.photo_path
+                FROM clockins c WHERE c.photo_path LIKE '/uploads/clockins/plan/%' LIMIT 1
+            """)).one()
+            ids = {"user": row[0], "project": row[1], "clockin": row[2], "photo_path": row[3]}
+            failures = check(conn, _checks(ids))
+        finally:
+            trans.rollback()
+
+    if failures:
+        print(f"\n{failures} consulta(s) sin índice")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# backend/scripts/evaluate_detector.py
+"""
+Evalúa el detector EPP configurado sobre el dataset (app/data): mAP@0.5,
+mAP@0.5:0.95, precisión/recall por clase, acierto de approved por imagen,
+imágenes/s, latencia p50/p95 por lote y RSS máxima. El informe JSON sirve
+para comparar modelos/runtimes antes de desplegar (--baseline).
+
+Por defecto las imágenes salen de la caché de services.dataset (ya
+decodificadas y redimensionadas; la primera vez se genera en paralelo) y los
+tiempos son solo infer+postprocess. Con --no-cache se decodifica cada JPEG
+como en producción.
+
+    cd backend
+    python -m scripts.evaluate_detector --splits valid test --json eval.json
+    EPP_DETECTOR_BACKEND=onnx EPP_ONNX_PATH=.../best_int8.onnx \
+        python -m scripts.evaluate_detector --json eval_int8.json --baseline eval.json
+"""
+
+import argparse
+import json
+import time
+
+from app.services.dataset import DatasetCache, EPP_DATASET_WORKERS, load_split
+from app.services.evaluation import EVAL_CONF, evaluate
+from app.services.inference import (
+    EPP_CONF,
+    EPP_DATA_YAML,
+    EPP_DETECTOR_BACKEND,
+    EPP_IMG_SIZE,
+    EPP_IOU,
+    EPPDetector,
+    model_version,
+)
+
+# Lo que se compara con --baseline: (clave, mayor es mejor)
+COMPARED = [
+    ("map50", True), ("map50_95", True), ("precision", True), ("recall", True),
+    ("approved_accuracy", True), ("speed.images_per_s", True), ("speed.p95_ms", False),
+]
+
+
+def _get(report: dict, path: str):
+    for part in path.split("."):
+        report = report[part]
+    return report
+
+
+def print_split(split: str, r: dict) -> None:
+    s = r["speed"]
+    print(f"\n== {split}: {r['images']} imágenes, {r['instances']} objetos")
+    print(f"{'clase':<16} {'obj':>5} {'P':>7} {'R':>7} {'AP50':>7} {'AP50-95':>8}")
+    for name, m in r["classes"].items():
+        print(
+            f"{name:<16} {m['instances']:>5} {m['precision']:>7.3f} {m['recall']:>7.3f}"
+            f" {m['ap50']:>7.3f} {m['ap50_95']:>8.3f}"
+        )
+    print(
+        f"{'todas':<16} {r['instances']:>5} {r['precision']:>7.3f} {r['recall']:>7.3f}"
+        f" {r['map50']:>7.3f} {r['map50_95']:>8.3f}"
+    )
+    print(f"approved correcto: {r['approved_accuracy']:.1%}")
+    print(
+        f"{s['images_per_s']:.1f} img/s, lote {s['batch_size']}: p50 {s['p50_ms']:.1f} ms,"
+        f" p95 {s['p95_ms']:.1f} ms; RSS máx {r['peak_rss_mb']:.0f} MB"
+    )
+
+
+def print_comparison(report: dict, baseline: dict) -> None:
+    print(f"\n== frente a {baseline['model']['version']}")
+    for split, r in report["splits"].items():
+        base = baseline["splits"].get(split)
+        if base is None:
+            continue
+        for key, higher_is_better in COMPARED:
+            new, old = _get(r, key), _get(base, key)
+            delta = new - old
+            worse = delta < 0 if higher_is_better else delta > 0
+            print(f"{split:<6} {key:<20} {old:>9.3f} → {new:>9.3f} ({delta:+.3f}){'  ⚠' if worse and delta else ''}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Evaluación offline del detector EPP")
+    parser.add_argument("--backend", default=EPP_DETECTOR_BACKEND, help="torch | onnx")
+    parser.add_argument("--model", default=None, help="ruta del modelo (por defecto la del backend)")
+    parser.add_argument("--splits", nargs="+", default=["valid", "test"])
+    parser.add_argument("--data", default=EPP_DATA_YAML, help="data.yaml del dataset")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--conf", type=float, default=EPP_CONF, help="umbral para P/R y approved")
+    parser.add_argument("-n", "--limit", type=int, default=None, help="máximo de imágenes por split")
+    parser.add_argument("--no-cache", action="store_true", help="decodifica cada imagen (tiempos de extremo a extremo)")
+    parser.add_argument("--workers", type=int, default=EPP_DATASET_WORKERS, help="procesos para generar la caché")
+    parser.add_argument("--json", help="guarda el informe en este fichero")
+    parser.add_argument("--baseline", help="informe anterior con el que comparar")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    detector = EPPDetector(backend=args.backend, model_path=args.model, conf=EVAL_CONF)
+    detector.warmup()
+    load_ms = (time.perf_counter() - t0) * 1000
+
+    report = {
+        "model": {
+            "backend": args.backend,
+            "path": detector.runner.model_path,
+            # La misma versión que tendría el detector en producción (con --conf)
+            "version": model_version(args.backend, detector.runner.model_path, EPP_IMG_SIZE, args.conf, EPP_IOU),
+            "img_size": EPP_IMG_SIZE,
+            "iou": EPP_IOU,
+            "conf": args.conf,
+            "load_ms": round(load_ms, 1),
+        },
+        "splits": {},
+    }
+    for split in args.splits:
+        if args.no_cache:
+            data = load_split(split, args.data, args.limit)
+        else:
+            t = time.perf_counter()
+            data = DatasetCache(
+                split, detector.img_size, args.data, workers=args.workers, limit=args.limit,
+            ).build()
+            print(f"caché {split}: {len(data)} imágenes en {time.perf_counter() - t:.1f} s")
+        if not len(data):
+            raise SystemExit(f"No hay imágenes en el split {split}")
+        report["splits"][split] = evaluate(detector, data, args.batch_size, args.conf)
+        print_split(split, report["splits"][split])
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            print_comparison(report, json.load(f))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nInforme: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
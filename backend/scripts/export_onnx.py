@@ -0,0 +1,137 @@
+# backend/scripts/export_onnx.py
+"""
+Exporta el detector EPP (YOLOv5 .pt) a ONNX para EPP_DETECTOR_BACKEND=onnx y,
+con --int8, genera además una versión cuantizada INT8 calibrada con imágenes
+del dataset (app/data/valid/images por defecto).
+
+    cd backend
+    python -m scripts.export_onnx --weights yolov5/epp-detector/exp8/weights/best.pt --int8
+
+Salida: <weights>.onnx y <weights>_int8.onnx (batch dinámico, entrada 1x3xSxS).
+Necesita torch (solo aquí; el worker con onnx no lo necesita) y onnx.
+"""
+
+import argparse
+import glob
+import os
+
+from app.services.inference import (
+    EPP_MODEL_PATH,
+    EPP_IMG_SIZE,
+    EPP_DATA_YAML,
+    TorchBackend,
+    decode_image,
+    letterbox,
+    to_input,
+)
+
+INPUT_NAME = "images"
+
+
+def add_metadata(path: str, names: dict, img_size: int) -> None:
+    """Guarda las clases en el .onnx (OnnxBackend las lee de ahí)."""
+    import onnx
+
+    model = onnx.load(path)
+    del model.metadata_props[:]
+    for key, value in {"names": repr(names), "imgsz": str(img_size)}.items():
+        prop = model.metadata_props.add()
+        prop.key, prop.value = key, value
+    onnx.save(model, path)
+
+
+def export_fp32(weights: str, out_path: str, img_size: int, opset: int) -> dict:
+    import torch
+
+    backend = TorchBackend(weights)
+    net = getattr(backend.model, "model", backend.model)   # DetectMultiBackend → DetectionModel
+    net = net.float().eval()
+    for m in net.modules():
+        # Igual que export.py de yolov5: la capa Detect devuelve solo las predicciones
+        if m.__class__.__name__ == "Detect":
+            m.export = True
+            m.dynamic = True
+
+    dummy = torch.zeros(1, 3, img_size, img_size)
+    torch.onnx.export(
+        net,
+        dummy,
+        out_path,
+        opset_version=opset,
+        input_names=[INPUT_NAME],
+        output_names=["output"],
+        dynamic_axes={INPUT_NAME: {0: "batch"}, "output": {0: "batch"}},
+        do_constant_folding=True,
+    )
+    add_metadata(out_path, backend.names, img_size)
+    return backend.names
+
+
+def quantize_int8(fp32_path: str, out_path: str, calib_dir: str, calib_images: int, img_size: int, names: dict) -> None:
+    from onnxruntime.quantization import (
+        CalibrationDataReader, QuantFormat, QuantType, quantize_static,
+    )
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    class CalibrationReader(CalibrationDataReader):
+        """Imágenes del dataset de una en una, preprocesadas igual que en producción."""
+
+        def __init__(self, paths):
+            self._paths = iter(paths)
+
+        def get_next(self):
+            path = next(self._paths, None)
+            if path is None:
+                return None
+            with open(path, "rb") as f:
+                boxed, _, _ = letterbox(decode_image(f.read()), img_size)
+            return {INPUT_NAME: to_input(boxed)}
+
+    paths = sorted(glob.glob(os.path.join(calib_dir, "*.jpg")))[:calib_images]
+    if not paths:
+        raise SystemExit(f"No hay imágenes de calibración en {calib_dir}")
+    reader = CalibrationReader(paths)
+
+    prep_path = out_path + ".prep.onnx"
+    quant_pre_process(fp32_path, prep_path)
+    try:
+        quantize_static(
+            prep_path,
+            out_path,
+            reader,
+            quant_format=QuantFormat.QDQ,
+            per_channel=True,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+        )
+    finally:
+        os.remove(prep_path)
+    add_metadata(out_path, names, img_size)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Exporta el detector EPP a ONNX (y INT8)")
+    parser.add_argument("--weights", default=EPP_MODEL_PATH)
+    parser.add_argument("--out", default=None, help="por defecto <weights>.onnx")
+    parser.add_argument("--img-size", type=int, default=EPP_IMG_SIZE)
+    parser.add_argument("--opset", type=int, default=12)
+    parser.add_argument("--int8", action="store_true", help="genera también <out>_int8.onnx")
+    parser.add_argument(
+        "--calib-dir",
+        default=os.path.join(os.path.dirname(EPP_DATA_YAML), "valid", "images"),
+    )
+    parser.add_argument("--calib-images", type=int, default=64)
+    args = parser.parse_args()
+
+    out = args.out or os.path.splitext(args.weights)[0] + ".onnx"
+    names = export_fp32(args.weights, out, args.img_size, args.opset)
+    print(f"✅ ONNX: {out} ({os.path.getsize(out) / 1e6:.1f} MB) clases={names}")
+
+    if args.int8:
+        int8_out = os.path.splitext(out)[0] + "_int8.onnx"
+        quantize_int8(out, int8_out, args.calib_dir, args.calib_images, args.img_size, names)
+        print(f"✅ INT8: {int8_out} ({os.path.getsize(int8_out) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+# backend/scripts/rebuild_hours_rollup.py
+"""
+Regenera clockin_daily_hours desde clockins. Solo hace falta si se han
+tocado clockins por fuera de la API (SQL a mano, restauraciones parciales):
+la API mantiene el rollup al terminar, modificar o borrar clockins.
+
+    cd backend
+    python -m scripts.rebuild_hours_rollup
+"""
+
+from app.crud.hours_rollup import rebuild_hours_rollup
+from app.database import SessionLocal
+
+
+def main() -> None:
+    db = SessionLocal()
+    try:
+        rows = rebuild_hours_rollup(db)
+    finally:
+        db.close()
+    print(f"clockin_daily_hours: {rows} filas")
+
+
+if __name__ == "__main__":
+    main()
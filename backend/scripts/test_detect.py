@@ -1,7 +1,7 @@
 # backend/scripts/test_detect.py
 
 import requests
-import time
+import json
 import os
 
 # 1) Tus credenciales reales
@@ -73,18 +73,25 @@ def main():
     print("→ Task ID:", task_id)
 
     #
-    # Paso C) Polling hasta que la tarea termine
+    # Paso C) Esperar el resultado por SSE (sin polling)
     #
-    status_url = f"{BASE_URL}/detection/task-status/{task_id}"
-    while True:
-        st = requests.get(status_url, headers=headers).json()
-        print("⏱ Polling:", st)
-        if st["status"] in ("completed", "failed"):
-            break
-        time.sleep(2)
+    events_url = f"{BASE_URL}/detection/task-events/{task_id}"
+    st = {"status": "pending"}
+    with requests.get(events_url, headers=headers, stream=True) as events:
+        events.raise_for_status()
+        event = None
+        for line in events.iter_lines(decode_unicode=True):
+            if line.startswith("event:"):
+                event = line.split(":", 1)[1].strip()
+            elif line.startswith("data:") and event in ("result", "timeout"):
+                st = json.loads(line.split(":", 1)[1])
+                break
+    print("📨 Evento:", event)
 
     if st["status"] == "completed":
         print("✅ Detección OK:", st["clockin"])
+    elif st["status"] == "pending":
+        print("⏱ Sin resultado todavía; consulta", f"{BASE_URL}/detection/task-status/{task_id}")
     else:
         print("🚫 Detección fallida:", st.get("error"))
 
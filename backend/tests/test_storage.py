@@ -0,0 +1,20 @@
+# backend/tests/test_storage.py
+
+from app.services.storage import LocalStorage
+
+
+def test_local_open_empty_key(tmp_path):
+    storage = LocalStorage(root=str(tmp_path))
+    (tmp_path / "clockins").mkdir()
+    (tmp_path / "clockins" / "empty.jpg").write_bytes(b"")
+
+    with storage.open("clockins/empty.jpg") as f:
+        assert f.read() == b""
+
+
+def test_local_open_reads_content(tmp_path):
+    storage = LocalStorage(root=str(tmp_path))
+    storage.put_bytes(b"jpeg-bytes", "clockins/ab/photo.jpg")
+
+    with storage.open("clockins/ab/photo.jpg") as f:
+        assert f.read() == b"jpeg-bytes"
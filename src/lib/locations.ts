@@ -22,5 +22,20 @@ export const getAllLocations = (token: string) =>
     { headers: { Authorization: `Bearer ${token}` } }
   ).then(res => res.json());
 
+export interface LatestLocationsParams {
+  since?: string;
+  bbox?: string; // 'oeste,sur,este,norte'
+}
+
+export const getLatestLocations = (token: string, params: LatestLocationsParams = {}): Promise<LocationWithUser[]> => {
+  const query = new URLSearchParams(
+    Object.entries(params).filter((entry): entry is [string, string] => !!entry[1])
+  ).toString();
+  return api.get(
+    `/locations/latest${query ? `?${query}` : ''}`,
+    { headers: { Authorization: `Bearer ${token}` } }
+  ).then(res => res.json());
+};
+
 export const getLocationsByClockin = (token: string, clockinId: string) =>
   api.get(`/locations/clockin/${clockinId}`, { headers: { Authorization: `Bearer ${token}` } }).then(res => res.json());
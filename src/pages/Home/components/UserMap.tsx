@@ -1,6 +1,6 @@
 import React, { useEffect, useState } from 'react';
 import { GoogleMap, Marker, useJsApiLoader } from '@react-google-maps/api';
-import { getAllLocations } from '../../../lib/locations';
+import { getLatestLocations } from '../../../lib/locations';
 
 interface Point {
   id: string;
@@ -22,8 +22,9 @@ const UserMap: React.FC = () => {
     const fetchData = async () => {
       if (!token) return;
       try {
-        const { data } = await getAllLocations(token);
-        setPoints(data as unknown as Point[]);
+        // Solo la última posición de cada usuario, no todo el histórico
+        const data = await getLatestLocations(token);
+        setPoints(data);
       } catch (e) {
         console.error(e);
       }
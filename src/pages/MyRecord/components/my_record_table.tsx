@@ -8,6 +8,7 @@ export interface RecordEntry {
   id: string;
   clockinId: string;
   photoPath?: string;
+  thumbnailPath?: string;
   userName: string;
   projectName: string;
   address: string;
@@ -79,7 +80,7 @@ const MyRecordTable: FC<Props> = ({ entries, isAdmin, onEdit, onPreview, onViewM
                   <td className="px-4 py-3">
                     {e.photoPath ? (
                       <img
-                        src={`${API_BASE}${e.photoPath}`}
+                        src={`${API_BASE}${e.thumbnailPath ?? e.photoPath}`}
                         alt="record"
                         className="h-12 w-12 object-cover rounded cursor-pointer"
                         onClick={() => onPreview(e.photoPath!)}
@@ -150,7 +151,7 @@ const MyRecordTable: FC<Props> = ({ entries, isAdmin, onEdit, onPreview, onViewM
                 <div className="flex items-center gap-2">
                   {e.photoPath ? (
                     <img
-                      src={`${API_BASE}${e.photoPath}`}
+                      src={`${API_BASE}${e.thumbnailPath ?? e.photoPath}`}
                       alt="record"
                       className="h-10 w-10 object-cover rounded cursor-pointer"
                       onClick={() => onPreview(e.photoPath!)}
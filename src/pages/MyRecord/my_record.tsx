@@ -59,6 +59,7 @@ const MyRecord: React.FC = () => {
           id: r.id,
           clockinId: r.clockin_id,
           photoPath: r.photo_path,
+          thumbnailPath: r.thumbnail_path ?? undefined,
           userName: r.user_name,
           projectName: r.project_name,
           address: